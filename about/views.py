@@ -2,9 +2,12 @@ from __future__ import annotations
 
 from django.shortcuts import render
 
+from core.page_cache import cache_public_page
+
 from .models import Expert
 
 
+@cache_public_page("about.Expert")
 def about(request):
     experts = Expert.objects.filter(is_visible=True).order_by("order", "id")
     return render(request, "about/about.html", {"experts": experts})
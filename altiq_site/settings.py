@@ -6,6 +6,7 @@ SUPABASE_DB_URL, and a Tailwind/HTMX/Alpine frontend.
 from __future__ import annotations
 
 import os
+import tempfile
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -19,6 +20,65 @@ ALLOWED_HOSTS: list[str] = os.environ.get("DJANGO_ALLOWED_HOSTS", "").split() or
 # The default is "main" which renders with **no** visual badge.
 ALTIQ_ENV = os.environ.get("ALTIQ_ENV", "main").strip() or "main"
 
+# Anonymous full-page cache (core.page_cache): seconds a page is served as
+# fresh, and how long an expired or invalidated copy may still be served while
+# a single request re-renders it. No CACHES backend is configured, so the
+# cache is local to each process: a purge only reaches the process that made
+# it, and other processes serve their copy until it expires.
+ALTIQ_PAGE_CACHE_TIMEOUT = int(os.environ.get("ALTIQ_PAGE_CACHE_TIMEOUT", "300"))
+ALTIQ_PAGE_CACHE_STALE_TIMEOUT = int(os.environ.get("ALTIQ_PAGE_CACHE_STALE_TIMEOUT", "60"))
+
+# PayPal OAuth tokens (payments.tokens) are cached through the Django cache.
+# With no CACHES backend configured that cache is per-process, so every
+# worker fetches its own token; add a shared CACHES backend (Redis,
+# Memcached) to share tokens and their single-flight refresh across workers.
+
+# Webhooks are stored, then processed and the emails they trigger delivered
+# inside the same webhook request: the Vercel deployment runs no worker
+# process. Set to False on hosts that run the jobs worker (``manage.py
+# runworker``), so the request only stores the event and queues its processing.
+ALTIQ_WEBHOOKS_INLINE = os.environ.get("ALTIQ_WEBHOOKS_INLINE", "True") == "True"
+
+# Serve /checkout/<slug>/ with the async view (orders.views.checkout_async).
+# Only worth enabling when the site runs under ASGI (altiq_site.asgi), where
+# the whole middleware stack is async and gateway calls no longer hold a
+# worker; under WSGI each request still gets its own thread.
+ALTIQ_ASYNC_CHECKOUT = os.environ.get("ALTIQ_ASYNC_CHECKOUT", "False") == "True"
+
+# Request timings (core.instrumentation) are served at /metrics in the
+# Prometheus text format. When a token is set, scrapers must send it as
+# "Authorization: Bearer <token>"; otherwise only staff users may read them.
+ALTIQ_METRICS_TOKEN = os.environ.get("ALTIQ_METRICS_TOKEN", "")
+
+# Request profiling (core.profiling). In staging/test a random fraction of
+# requests is profiled; staff users can profile any request in any
+# environment by sending "X-AltIQ-Profile: 1". Captures (pstats plus
+# collapsed stacks sampled every ALTIQ_PROFILE_INTERVAL seconds) rotate in
+# ALTIQ_PROFILE_DIR and are listed at /staff/profiles/. It defaults to the
+# temp dir, the only writable place on Vercel (and local to each instance).
+ALTIQ_PROFILE_SAMPLE_RATE = float(os.environ.get("ALTIQ_PROFILE_SAMPLE_RATE", "0.01"))
+ALTIQ_PROFILE_INTERVAL = float(os.environ.get("ALTIQ_PROFILE_INTERVAL", "0.005"))
+ALTIQ_PROFILE_DIR = os.environ.get("ALTIQ_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "altiq-profiles"))
+ALTIQ_PROFILE_KEEP = int(os.environ.get("ALTIQ_PROFILE_KEEP", "200"))
+
+# N+1 query detection (core.nplusone): "log" warns about SELECTs repeated
+# ALTIQ_NPLUSONE_THRESHOLD times in one request, with the admin column or
+# template line behind them; "raise" fails the request instead (useful with
+# ``ALTIQ_NPLUSONE=raise manage.py test``); "off" disables it. Defaults to
+# "log" when DEBUG is on.
+ALTIQ_NPLUSONE = os.environ.get("ALTIQ_NPLUSONE", "log" if DEBUG else "off")
+ALTIQ_NPLUSONE_THRESHOLD = int(os.environ.get("ALTIQ_NPLUSONE_THRESHOLD", "3"))
+
+# Pending orders older than this are cancelled by ``manage.py expire_orders``
+# (payments.expiry). Keep it well above the gateways' own checkout expiry.
+ALTIQ_ORDER_TTL_HOURS = float(os.environ.get("ALTIQ_ORDER_TTL_HOURS", "24"))
+
+# Webhook deliveries must carry a valid PayPal / Coinbase signature
+# (payments.signatures; needs PAYPAL_WEBHOOK_ID and
+# COINBASE_COMMERCE_WEBHOOK_SECRET). Only switch off for local tooling that
+# posts unsigned events.
+ALTIQ_WEBHOOK_VERIFY = os.environ.get("ALTIQ_WEBHOOK_VERIFY", "True") == "True"
+
 INSTALLED_APPS = [
     "django.contrib.admin",
     "django.contrib.auth",
@@ -37,16 +97,23 @@ INSTALLED_APPS = [
     "newsletter",
     "orders",
     "payments",
+    "jobs",
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover the rest of the stack.
+    "core.instrumentation.RequestTimingMiddleware",
+    "core.nplusone.NPlusOneMiddleware",
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    # WhiteNoise, async-capable so ASGI requests stay on the event loop.
+    "core.static.AsyncWhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "allauth.account.middleware.AccountMiddleware",
+    # Needs request.user for the staff opt-in header.
+    "core.profiling.SamplingProfilerMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -55,7 +122,10 @@ ROOT_URLCONF = "altiq_site.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # DjangoTemplates plus per-request render timing (core.instrumentation).
+        "BACKEND": "core.instrumentation.TimedDjangoTemplates",
+        # Keep the usual engine alias (it would default to "instrumentation").
+        "NAME": "django",
         "DIRS": [BASE_DIR / "templates"],
         "APP_DIRS": True,
         "OPTIONS": {
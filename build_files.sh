@@ -1,5 +1,10 @@
 #!/bin/bash
 
+# Vercel runs no worker processes, so webhook events are processed (and their
+# emails sent) inside the webhook request: ALTIQ_WEBHOOKS_INLINE defaults to
+# True. Hosts that run the jobs worker ("manage.py runworker") can set
+# ALTIQ_WEBHOOKS_INLINE=False.
+
 # Install Node dependencies and build Tailwind CSS
 npm install
 npm run build:css
@@ -11,5 +16,7 @@ python manage.py collectstatic --noinput
 # Run migrations if DATABASE_URL is set
 if [ -n "$DATABASE_URL" ]; then
   python manage.py migrate --noinput
+  # Re-apply the default services/packages (with ALTIQ_ENV's prices)
+  python manage.py sync_service_catalog
 fi
 
@@ -2,9 +2,12 @@ from __future__ import annotations
 
 from django.shortcuts import render
 
+from core.page_cache import cache_public_page
+
 from .models import CaseStudy
 
 
+@cache_public_page("cases.CaseStudy")
 def case_list(request):
     cases = CaseStudy.objects.all().order_by("-is_featured", "-created_at")
     return render(request, "cases/list.html", {"cases": cases})
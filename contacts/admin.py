@@ -2,19 +2,24 @@ from __future__ import annotations
 
 from django.contrib import admin
 
+from core.admin_tools import ScalableAdmin
 from .models import CustomQuoteRequest, MeetingRequest
 
 
 @admin.register(CustomQuoteRequest)
-class CustomQuoteRequestAdmin(admin.ModelAdmin):
+class CustomQuoteRequestAdmin(ScalableAdmin):
     list_display = ("full_name", "company_name", "email", "created_at")
     search_fields = ("full_name", "company_name", "email")
+    prefix_search_fields = ("full_name", "company_name")
+    export_name = "quotes"
     list_filter = ("created_at",)
 
 
 @admin.register(MeetingRequest)
-class MeetingRequestAdmin(admin.ModelAdmin):
+class MeetingRequestAdmin(ScalableAdmin):
     list_display = ("full_name", "company_name", "email", "meeting_type", "created_at")
     list_filter = ("meeting_type", "created_at")
     search_fields = ("full_name", "company_name", "email")
+    prefix_search_fields = ("full_name", "company_name")
+    export_name = "meetings"
 
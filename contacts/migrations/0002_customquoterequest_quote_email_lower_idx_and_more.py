@@ -0,0 +1,38 @@
+# Generated by Django 4.2.26 on 2026-10-18 08:23
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contacts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customquoterequest',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='quote_email_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customquoterequest',
+            index=models.Index(django.db.models.functions.text.Lower('full_name'), name='quote_name_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customquoterequest',
+            index=models.Index(django.db.models.functions.text.Lower('company_name'), name='quote_company_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meetingrequest',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='meeting_email_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meetingrequest',
+            index=models.Index(django.db.models.functions.text.Lower('full_name'), name='meeting_name_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meetingrequest',
+            index=models.Index(django.db.models.functions.text.Lower('company_name'), name='meeting_company_lower_idx'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 from django.db import models
+from django.db.models.functions import Lower
 
 
 class CustomQuoteRequest(models.Model):
@@ -22,6 +23,12 @@ class CustomQuoteRequest(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Admin search (core.admin_tools): exact email, name/company prefixes.
+            models.Index(Lower("email"), name="quote_email_lower_idx"),
+            models.Index(Lower("full_name"), name="quote_name_lower_idx"),
+            models.Index(Lower("company_name"), name="quote_company_lower_idx"),
+        ]
 
     def __str__(self) -> str:  # pragma: no cover
         return f"Custom quote - {self.company_name or self.full_name}"
@@ -49,6 +56,12 @@ class MeetingRequest(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Admin search (core.admin_tools): exact email, name/company prefixes.
+            models.Index(Lower("email"), name="meeting_email_lower_idx"),
+            models.Index(Lower("full_name"), name="meeting_name_lower_idx"),
+            models.Index(Lower("company_name"), name="meeting_company_lower_idx"),
+        ]
 
     def __str__(self) -> str:  # pragma: no cover
         return f"Meeting - {self.company_name or self.full_name} ({self.meeting_type})"
@@ -0,0 +1,179 @@
+"""Admin changelists that stay fast on large tables.
+
+``ScalableAdmin`` replaces the parts of the stock changelist that scan the
+whole table:
+
+* ``COUNT(*)`` of the table becomes an estimate from the database statistics
+  (``estimated_count``); filtered counts stop at ``COUNT_LIMIT`` rows.
+* ``OFFSET`` pages become keyset pages: ``?after=<pk>`` fetches the rows
+  below that primary key, so page 5,000 costs the same as page 1. This
+  applies to the default newest-first order; sorting by a column falls back
+  to numbered pages.
+* ``AllValuesFieldListFilter``'s ``SELECT DISTINCT`` over the table is
+  cached for ``VALUES_CACHE_SECONDS`` (``CachedValuesFilter``).
+* Selected rows (or all filtered rows) export as streaming CSV/NDJSON
+  through ``core.exports`` when ``export_name`` is set.
+* ``icontains`` search becomes an exact match on the lower-cased email, or a
+  case-insensitive prefix match on ``prefix_search_fields``. Both are range
+  scans on ``Lower(...)`` expression indexes declared on the models.
+"""
+from __future__ import annotations
+
+from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from .exports import EXPORTS, export_response
+
+CURSOR_VAR = "after"
+# Tables smaller than this are counted exactly.
+ESTIMATE_ABOVE = 10_000
+COUNT_LIMIT = 1_000
+VALUES_CACHE_SECONDS = 600
+# Longest all-digit search term still tried as a primary key (fits a signed
+# 64-bit integer); longer ones, e.g. pasted phone numbers, would overflow.
+MAX_PK_DIGITS = 18
+
+
+def pk_search(term: str) -> Q:
+    """``Q(pk=...)`` when ``term`` can be a primary key, else an empty ``Q``."""
+
+    if term.isascii() and term.isdigit() and len(term) <= MAX_PK_DIGITS:
+        return Q(pk=int(term))
+    return Q()
+
+
+def estimated_count(model) -> int:
+    """Approximate row count of ``model``'s table without scanning it."""
+
+    table = connection.ops.quote_name(model._meta.db_table)
+    estimate = None
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+            row = cursor.fetchone()
+            # -1 until the table has been vacuumed or analysed.
+            estimate = row[0] if row and row[0] >= 0 else None
+        elif connection.vendor == "sqlite":
+            # A B-tree seek; deleted rows make it an overestimate.
+            cursor.execute(f"SELECT MAX(rowid) FROM {table}")
+            estimate = cursor.fetchone()[0] or 0
+    if estimate is None or estimate < ESTIMATE_ABOVE:
+        return model._default_manager.count()
+    return estimate
+
+
+class CachedValuesFilter(admin.AllValuesFieldListFilter):
+    """``AllValuesFieldListFilter`` (e.g. currency) without a table scan per page view."""
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        super().__init__(field, request, params, model, model_admin, field_path)
+        key = f"admin:values:{model._meta.label_lower}:{field_path}"
+        self.lookup_choices = cache.get_or_set(key, lambda: list(self.lookup_choices), VALUES_CACHE_SECONDS)
+
+
+class KeysetChangeList(ChangeList):
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_results(self, request):
+        self.keyset = (
+            ORDER_VAR not in self.params
+            and list(self._get_default_ordering()) == ["-pk"]
+            and not self.show_all
+            and not self.list_editable
+        )
+        if not self.keyset:
+            return super().get_results(request)
+
+        try:
+            self.cursor = int(self.params.get(CURSOR_VAR, ""))
+        except ValueError:
+            self.cursor = None
+        queryset = self.queryset if self.cursor is None else self.queryset.filter(pk__lt=self.cursor)
+        rows = list(queryset[: self.list_per_page + 1])
+        self.result_list = rows[: self.list_per_page]
+        self.next_cursor = rows[-2].pk if len(rows) > self.list_per_page else None
+
+        filtered = self.has_active_filters or bool(self.query)
+        if filtered:
+            self.result_count = self.queryset.order_by()[: COUNT_LIMIT + 1].count()
+            self.result_count_capped = self.result_count > COUNT_LIMIT
+            self.result_count_estimated = False
+        else:
+            self.result_count = estimated_count(self.model)
+            self.result_count_capped = False
+            self.result_count_estimated = self.result_count >= ESTIMATE_ABOVE
+        self.show_full_result_count = False
+        self.full_result_count = None
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = self.cursor is not None or self.next_cursor is not None
+        self.paginator = None
+
+    @property
+    def next_page_url(self) -> str:
+        return self.get_query_string({CURSOR_VAR: self.next_cursor})
+
+    @property
+    def first_page_url(self) -> str:
+        return self.get_query_string(remove=[CURSOR_VAR])
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """``ModelAdmin`` with estimated counts, keyset pages and indexed search.
+
+    Subclasses set ``email_search_field`` and ``prefix_search_fields``; each
+    needs a ``Lower(field)`` index on the model. ``search_fields`` is only
+    used to show the search box.
+    """
+
+    ordering = ("-pk",)
+    show_full_result_count = False
+    change_list_template = "admin/keyset_change_list.html"
+    email_search_field: str | None = "email"
+    prefix_search_fields: tuple[str, ...] = ()
+    search_help_text = "Email completo, o el inicio del nombre o la empresa."
+    # Key of core.exports.EXPORTS behind the export actions.
+    export_name: str | None = None
+    actions = ("export_csv", "export_ndjson")
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        if self.export_name is None:
+            actions.pop("export_csv", None)
+            actions.pop("export_ndjson", None)
+        return actions
+
+    @admin.action(description="Exportar seleccionados (CSV)")
+    def export_csv(self, request, queryset):
+        return export_response(EXPORTS[self.export_name], queryset, "csv")
+
+    @admin.action(description="Exportar seleccionados (NDJSON)")
+    def export_ndjson(self, request, queryset):
+        return export_response(EXPORTS[self.export_name], queryset, "ndjson")
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip().lower()
+        if not term:
+            return queryset, False
+        if "@" in term and self.email_search_field:
+            field = self.email_search_field
+            return queryset.alias(**{f"{field}_lower": Lower(field)}).filter(**{f"{field}_lower": term}), False
+
+        # "abc" -> ["abc", "abd"): a range the index can seek, unlike LIKE
+        # under most database collations.
+        upper = term[:-1] + chr(ord(term[-1]) + 1)
+        condition = pk_search(term)
+        for field in self.prefix_search_fields:
+            queryset = queryset.alias(**{f"{field}_lower": Lower(field)})
+            condition |= Q(**{f"{field}_lower__gte": term, f"{field}_lower__lt": upper})
+        return queryset.filter(condition) if condition else queryset.none(), False
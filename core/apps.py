@@ -1,7 +1,18 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
 
 
 class CoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "core"
 
+    def ready(self) -> None:
+        from .instrumentation import time_queries
+        from .nplusone import track_queries
+        from .page_cache import purge_dependents
+
+        post_save.connect(purge_dependents, dispatch_uid="core.page_cache.post_save")
+        post_delete.connect(purge_dependents, dispatch_uid="core.page_cache.post_delete")
+        connection_created.connect(time_queries, dispatch_uid="core.instrumentation.time_queries")
+        connection_created.connect(track_queries, dispatch_uid="core.nplusone.track_queries")
@@ -0,0 +1,306 @@
+"""End-to-end HTTP benchmark driver (``manage.py benchmark_http``).
+
+Requests are built as WSGI environs and passed straight to the project's WSGI
+application, so every measurement includes the full middleware stack, URL
+routing, templates and database work, but no socket or server overhead. Each
+virtual client keeps its own cookies and runs on its own thread (with its own
+database connection), like concurrent browsers against a threaded server.
+``ASGIClient`` does the same against the ASGI application from an event loop.
+"""
+from __future__ import annotations
+
+import asyncio
+import io
+import json
+import statistics
+import sys
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from http.cookies import SimpleCookie
+from typing import Callable
+from urllib.parse import urlencode, urlsplit
+
+from django.db import connection, connections
+
+RequestSpec = tuple[str, str, bytes, dict[str, str]]
+
+
+class WSGIClient:
+    """Minimal cookie-keeping client calling a WSGI application directly."""
+
+    def __init__(self, app, host: str = "localhost") -> None:
+        self.app = app
+        self.host = host
+        self.cookies: dict[str, str] = {}
+
+    def request(
+        self, method: str, path: str, body: bytes = b"", headers: dict[str, str] | None = None
+    ) -> tuple[int, dict[str, str], bytes]:
+        parts = urlsplit(path)
+        environ = {
+            "REQUEST_METHOD": method,
+            "PATH_INFO": parts.path,
+            "QUERY_STRING": parts.query,
+            "SERVER_NAME": self.host,
+            "SERVER_PORT": "80",
+            "SERVER_PROTOCOL": "HTTP/1.1",
+            "HTTP_HOST": self.host,
+            "REMOTE_ADDR": "127.0.0.1",
+            "CONTENT_LENGTH": str(len(body)),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "http",
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        if self.cookies:
+            environ["HTTP_COOKIE"] = "; ".join(f"{name}={value}" for name, value in self.cookies.items())
+        for name, value in (headers or {}).items():
+            key = name.upper().replace("-", "_")
+            environ[key if key == "CONTENT_TYPE" else f"HTTP_{key}"] = value
+
+        captured: dict = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            captured["status"] = int(status.split(" ", 1)[0])
+            captured["headers"] = response_headers
+
+        result = self.app(environ, start_response)
+        try:
+            content = b"".join(result)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+
+        return self._response(captured["status"], captured["headers"], content)
+
+    def _response(
+        self, status: int, headers: list[tuple[str, str]], content: bytes
+    ) -> tuple[int, dict[str, str], bytes]:
+        for name, value in headers:
+            if name.lower() == "set-cookie":
+                for morsel in SimpleCookie(value).values():
+                    self.cookies[morsel.key] = morsel.value
+        return status, {name.lower(): value for name, value in headers}, content
+
+
+class ASGIClient(WSGIClient):
+    """``WSGIClient`` for an ASGI application; ``request`` is a coroutine."""
+
+    async def request(
+        self, method: str, path: str, body: bytes = b"", headers: dict[str, str] | None = None
+    ) -> tuple[int, dict[str, str], bytes]:
+        parts = urlsplit(path)
+        request_headers = [(b"host", self.host.encode()), (b"content-length", str(len(body)).encode())]
+        if self.cookies:
+            cookie = "; ".join(f"{name}={value}" for name, value in self.cookies.items())
+            request_headers.append((b"cookie", cookie.encode()))
+        for name, value in (headers or {}).items():
+            request_headers.append((name.lower().encode(), value.encode()))
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": parts.path,
+            "raw_path": parts.path.encode(),
+            "query_string": parts.query.encode(),
+            "headers": request_headers,
+            "client": ("127.0.0.1", 0),
+            "server": (self.host, 80),
+        }
+
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+        finished = asyncio.Event()
+        captured: dict = {"body": []}
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            # The client stays connected until the response is complete.
+            await finished.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                captured["status"] = message["status"]
+                captured["headers"] = [(name.decode(), value.decode()) for name, value in message["headers"]]
+            elif message["type"] == "http.response.body":
+                captured["body"].append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    finished.set()
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            finished.set()
+        return self._response(captured["status"], captured["headers"], b"".join(captured["body"]))
+
+
+@dataclass
+class Scenario:
+    """One benchmarked endpoint.
+
+    ``build(client)`` returns the request to time as (method, path, body,
+    headers); ``setup(client)`` runs once per virtual client, untimed.
+    """
+
+    name: str
+    build: Callable[[WSGIClient], RequestSpec]
+    expected_status: int = 200
+    setup: Callable[[WSGIClient], None] | None = None
+
+
+def get_page(path: str) -> Callable[[WSGIClient], RequestSpec]:
+    return lambda client: ("GET", path, b"", {})
+
+
+def post_json(
+    path: str,
+    make_payload: Callable[[], dict],
+    sign: Callable[[str, bytes], dict[str, str]] | None = None,
+) -> Callable[[WSGIClient], RequestSpec]:
+    """JSON POST; ``sign(path, body)`` adds headers such as webhook signatures."""
+
+    def build(client: WSGIClient) -> RequestSpec:
+        body = json.dumps(make_payload()).encode()
+        headers = {"Content-Type": "application/json"}
+        if sign is not None:
+            headers.update(sign(path, body))
+        return "POST", path, body, headers
+
+    return build
+
+
+def post_form(path: str, make_fields: Callable[[WSGIClient], dict]) -> Callable[[WSGIClient], RequestSpec]:
+    def build(client: WSGIClient) -> RequestSpec:
+        body = urlencode(make_fields(client)).encode()
+        return "POST", path, body, {"Content-Type": "application/x-www-form-urlencoded"}
+
+    return build
+
+
+def unique_id(prefix: str = "bench") -> str:
+    return f"{prefix}-{uuid.uuid4().hex}"
+
+
+@dataclass
+class _Sample:
+    latency: float
+    status: int
+    queries: int
+    size: int
+
+
+@dataclass
+class _Worker:
+    client: WSGIClient
+    samples: list[_Sample] = field(default_factory=list)
+
+
+def _run_requests(worker: _Worker, scenario: Scenario, count: int, record: bool) -> None:
+    queries = 0
+
+    def count_queries(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count_queries):
+        for _ in range(count):
+            method, path, body, headers = scenario.build(worker.client)
+            queries = 0
+            started = time.perf_counter()
+            try:
+                status, _headers, content = worker.client.request(method, path, body, headers)
+            except Exception:  # noqa: BLE001 - a crash is a failed request
+                status, content = 599, b""
+            elapsed = time.perf_counter() - started
+            if record:
+                worker.samples.append(_Sample(elapsed, status, queries, len(content)))
+
+
+def _quantile(values: list[float], q: int) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def run_scenario(
+    app, scenario: Scenario, *, requests: int, concurrency: int, warmup: int = 5, host: str = "localhost",
+    make_client: Callable[[], WSGIClient] | None = None,
+) -> dict:
+    """Drive ``scenario`` with ``concurrency`` clients and summarise the samples."""
+
+    make_client = make_client or (lambda: WSGIClient(app, host))
+    workers = [_Worker(make_client()) for _ in range(concurrency)]
+    per_worker = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+
+    def work(worker: _Worker, count: int) -> None:
+        if scenario.setup is not None:
+            scenario.setup(worker.client)
+        _run_requests(worker, scenario, warmup, record=False)
+        _run_requests(worker, scenario, count, record=True)
+
+    started = time.perf_counter()
+    if concurrency == 1:
+        work(workers[0], per_worker[0])
+    else:
+        def thread_main(worker: _Worker, count: int) -> None:
+            try:
+                work(worker, count)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=thread_main, args=args) for args in zip(workers, per_worker)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - started
+
+    samples = [sample for worker in workers for sample in worker.samples]
+    latencies = [sample.latency * 1000 for sample in samples] or [0.0]
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for sample in samples if sample.status != scenario.expected_status),
+        "rps": round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(_quantile(latencies, 50), 2),
+        "p95_ms": round(_quantile(latencies, 95), 2),
+        "p99_ms": round(_quantile(latencies, 99), 2),
+        "queries_avg": round(statistics.fmean(s.queries for s in samples), 2) if samples else 0.0,
+        "queries_max": max((s.queries for s in samples), default=0),
+        "bytes_avg": round(statistics.fmean(s.size for s in samples)) if samples else 0,
+    }
+
+
+def compare_results(current: dict, baseline: dict, tolerance: float = 0.25, min_delta_ms: float = 1.0) -> list[str]:
+    """Regressions of ``current`` against ``baseline`` (both ``run`` outputs).
+
+    Query counts are a hard budget: any increase is a regression. Latency
+    percentiles may grow by ``tolerance`` (and at least ``min_delta_ms``, so
+    sub-millisecond noise is ignored) and throughput may drop by as much.
+    """
+
+    regressions = []
+    for name, base in baseline.get("scenarios", {}).items():
+        cur = current.get("scenarios", {}).get(name)
+        if cur is None:
+            continue
+        if cur["errors"] > base["errors"]:
+            regressions.append(f"{name}: errors {base['errors']} -> {cur['errors']}")
+        if cur["queries_avg"] > base["queries_avg"]:
+            regressions.append(f"{name}: queries/request {base['queries_avg']} -> {cur['queries_avg']}")
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if cur[key] > base[key] * (1 + tolerance) and cur[key] - base[key] >= min_delta_ms:
+                regressions.append(f"{name}: {key} {base[key]} -> {cur[key]}")
+        if cur["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['rps']} -> {cur['rps']} req/s")
+        if cur["bytes_avg"] > base["bytes_avg"] * (1 + tolerance):
+            regressions.append(f"{name}: bytes/response {base['bytes_avg']} -> {cur['bytes_avg']}")
+    return regressions
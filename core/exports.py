@@ -0,0 +1,198 @@
+"""Streaming CSV/NDJSON exports of orders, payments and leads.
+
+Rows are read with ``values_list(...).iterator(chunk_size=CHUNK_SIZE)`` (a
+server-side cursor on PostgreSQL) and written to the response as they
+arrive, so memory stays flat however many rows are exported. Used by the
+staff URL ``/staff/export/<name>/`` and the "Exportar" admin actions.
+"""
+from __future__ import annotations
+
+import csv
+import datetime
+import json
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.db.models import OuterRef, Subquery
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from contacts.models import CustomQuoteRequest, MeetingRequest
+from orders.models import Order
+from payments.models import Payment
+
+CHUNK_SIZE = 2000
+# Rows per chunk written to the response.
+ROWS_PER_WRITE = 500
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+@dataclass(frozen=True)
+class Export:
+    name: str
+    model: type[models.Model]
+    # (column header, values_list path)
+    columns: tuple[tuple[str, str], ...]
+    annotations: Callable[[], dict] | None = None
+
+    def queryset(self) -> models.QuerySet:
+        return self.model._default_manager.all()
+
+    def prepare(self, queryset: models.QuerySet) -> models.QuerySet:
+        if self.annotations is not None:
+            queryset = queryset.annotate(**self.annotations())
+        return queryset
+
+
+def _latest_payment(field: str) -> Subquery:
+    return Subquery(Payment.objects.filter(order=OuterRef("pk")).order_by("-created_at", "-pk").values(field)[:1])
+
+
+_ORDER_COLUMNS = (
+    ("customer_name", "customer_name"),
+    ("company_name", "company_name"),
+    ("email", "email"),
+    ("phone", "phone"),
+    ("package", "package__slug"),
+)
+
+EXPORTS = {
+    export.name: export
+    for export in (
+        Export(
+            "orders",
+            Order,
+            (
+                ("id", "id"),
+                ("created_at", "created_at"),
+                ("status", "status"),
+                *_ORDER_COLUMNS,
+                ("amount", "amount"),
+                ("currency", "currency"),
+                ("payment_method", "payment_method"),
+                ("payment_status", "payment_status"),
+                ("provider_payment_id", "provider_payment_id"),
+            ),
+            annotations=lambda: {
+                "payment_method": _latest_payment("method"),
+                "payment_status": _latest_payment("status"),
+                "provider_payment_id": _latest_payment("provider_payment_id"),
+            },
+        ),
+        Export(
+            "payments",
+            Payment,
+            (
+                ("id", "id"),
+                ("created_at", "created_at"),
+                ("method", "method"),
+                ("status", "status"),
+                ("provider_payment_id", "provider_payment_id"),
+                ("amount", "amount"),
+                ("currency", "currency"),
+                ("order_id", "order_id"),
+                ("order_status", "order__status"),
+                *((header, f"order__{path}") for header, path in _ORDER_COLUMNS),
+            ),
+        ),
+        Export(
+            "quotes",
+            CustomQuoteRequest,
+            (
+                ("id", "id"),
+                ("created_at", "created_at"),
+                ("full_name", "full_name"),
+                ("company_name", "company_name"),
+                ("email", "email"),
+                ("phone", "phone"),
+                ("industry", "industry"),
+                ("location", "location"),
+                ("current_challenge", "current_challenge"),
+                ("desired_outcome", "desired_outcome"),
+            ),
+        ),
+        Export(
+            "meetings",
+            MeetingRequest,
+            (
+                ("id", "id"),
+                ("created_at", "created_at"),
+                ("full_name", "full_name"),
+                ("company_name", "company_name"),
+                ("email", "email"),
+                ("phone", "phone"),
+                ("meeting_type", "meeting_type"),
+                ("preferred_date", "preferred_date"),
+                ("preferred_time_range", "preferred_time_range"),
+                ("notes", "notes"),
+            ),
+        ),
+    )
+}
+
+
+def filter_created(
+    queryset: models.QuerySet, start: datetime.date | None, end: datetime.date | None
+) -> models.QuerySet:
+    """Rows created from ``start`` to ``end`` inclusive, in local dates."""
+
+    zone = timezone.get_current_timezone()
+    if start is not None:
+        queryset = queryset.filter(created_at__gte=datetime.datetime.combine(start, datetime.time(), zone))
+    if end is not None:
+        next_day = end + datetime.timedelta(days=1)
+        queryset = queryset.filter(created_at__lt=datetime.datetime.combine(next_day, datetime.time(), zone))
+    return queryset
+
+
+class _Echo:
+    """File-like object that hands back what ``csv.writer`` writes."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def _csv_cell(value):
+    # Spreadsheet apps run cells starting with these as formulas.
+    if isinstance(value, str) and value[:1] in ("=", "+", "-", "@"):
+        return "'" + value
+    return value
+
+
+def _rows(export: Export, queryset: models.QuerySet) -> Iterator[tuple]:
+    paths = [path for _, path in export.columns]
+    return export.prepare(queryset).order_by("pk").values_list(*paths).iterator(chunk_size=CHUNK_SIZE)
+
+
+def stream_export(export: Export, queryset: models.QuerySet, fmt: str) -> Iterator[str]:
+    headers = [header for header, _ in export.columns]
+    writer = csv.writer(_Echo())
+    if fmt == "csv":
+        # The BOM makes Excel read the file as UTF-8.
+        yield "\ufeff" + writer.writerow(headers)
+
+    def render(row: tuple) -> str:
+        if fmt == "csv":
+            return writer.writerow([_csv_cell(value) for value in row])
+        return json.dumps(dict(zip(headers, row)), cls=DjangoJSONEncoder) + "\n"
+
+    pending: list[str] = []
+    for row in _rows(export, queryset):
+        pending.append(render(row))
+        if len(pending) >= ROWS_PER_WRITE:
+            yield "".join(pending)
+            pending = []
+    if pending:
+        yield "".join(pending)
+
+
+def export_response(export: Export, queryset: models.QuerySet, fmt: str) -> StreamingHttpResponse:
+    response = StreamingHttpResponse(stream_export(export, queryset, fmt), content_type=FORMATS[fmt])
+    filename = f"{export.name}-{timezone.localdate():%Y%m%d}.{fmt}"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,312 @@
+"""Per-request timing: ``Server-Timing`` header and Prometheus metrics.
+
+``RequestTimingMiddleware`` measures, for every request:
+
+* total time in the Django stack,
+* DB time and query count (``time_queries``, an execute wrapper on every
+  connection, so queries an async view runs through ``sync_to_async`` on
+  another thread count too),
+* template render time (``TimedDjangoTemplates`` backend),
+* outbound gateway time (``payments.gateway_http.call_listener``).
+
+The numbers go into a ``Server-Timing`` header outside production
+(``ALTIQ_ENV``) and into per-URL-name histograms served at ``/metrics`` in the
+Prometheus text format. Metrics are kept per process; with several worker
+processes each one reports its own series.
+"""
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+from jobs.worker import queue_stats
+from payments.gateway_http import CallRecord, call_listener
+from payments.resilience import CLOSED, HALF_OPEN, OPEN, gateway_health
+
+PRODUCTION_ENVS = {"main", "production"}
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+# /metrics reuses the job queue counts (one aggregate query) for this long.
+QUEUE_STATS_TTL = 15.0
+
+
+@dataclass
+class RequestMetrics:
+    db_time: float = 0.0
+    queries: int = 0
+    template_time: float = 0.0
+    gateway_time: float = 0.0
+    gateway_calls: int = 0
+
+    def add_gateway_call(self, record: CallRecord) -> None:
+        self.gateway_time += record.elapsed
+        self.gateway_calls += 1
+
+    def time_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+
+current_metrics: ContextVar[RequestMetrics | None] = ContextVar("request_metrics", default=None)
+
+
+# ---------------------------------------------------------------------------
+# Metric registry
+# ---------------------------------------------------------------------------
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...], buckets: tuple[float, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._series: dict[tuple[str, ...], list[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple[str, ...], value: float) -> None:
+        with self._lock:
+            series = self._series.setdefault(labels, [0] * (len(self.buckets) + 1) + [0.0])
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), series):
+                    cumulative += count
+                    le = f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-1]}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple[str, ...], amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    "altiq_http_request_duration_seconds", "Time spent in the Django stack per request.", ("view", "method"),
+    DURATION_BUCKETS,
+)
+DB_DURATION = Histogram(
+    "altiq_http_db_duration_seconds", "Database time per request.", ("view",), DURATION_BUCKETS
+)
+DB_QUERIES = Histogram("altiq_http_db_queries", "Database queries per request.", ("view",), QUERY_BUCKETS)
+TEMPLATE_DURATION = Histogram(
+    "altiq_http_template_duration_seconds", "Template render time per request.", ("view",), DURATION_BUCKETS
+)
+GATEWAY_DURATION = Histogram(
+    "altiq_http_gateway_duration_seconds", "Outbound payment gateway time per request.", ("view",),
+    DURATION_BUCKETS,
+)
+RESPONSES = Counter("altiq_http_responses_total", "Responses by view and status code.", ("view", "status"))
+
+METRICS = (REQUEST_DURATION, DB_DURATION, DB_QUERIES, TEMPLATE_DURATION, GATEWAY_DURATION, RESPONSES)
+
+# (queue_stats(), time.monotonic() when it was read)
+_queue_stats: tuple[dict, float] | None = None
+
+
+def _cached_queue_stats() -> dict:
+    global _queue_stats
+
+    cached = _queue_stats
+    if cached is None or time.monotonic() - cached[1] >= QUEUE_STATS_TTL:
+        cached = _queue_stats = (queue_stats(), time.monotonic())
+    return cached[0]
+
+
+def render_metrics() -> str:
+    """All request metrics plus gateway circuit and job queue state, in Prometheus text format."""
+
+    lines: list[str] = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+
+    health = gateway_health()
+    lines += ["# HELP altiq_gateway_circuit_open Whether the gateway circuit breaker is open (1) or half-open (0.5).",
+              "# TYPE altiq_gateway_circuit_open gauge"]
+    state_value = {CLOSED: 0, HALF_OPEN: 0.5, OPEN: 1}
+    for gateway, snapshot in health.items():
+        lines.append(f'altiq_gateway_circuit_open{{gateway="{gateway}"}} {state_value[snapshot["circuit"]["state"]]}')
+    lines += ["# HELP altiq_gateway_rejected_total Calls rejected by the circuit breaker or bulkhead.",
+              "# TYPE altiq_gateway_rejected_total counter"]
+    for gateway, snapshot in health.items():
+        for reason, value in (("circuit", snapshot["circuit"]["rejected"]), ("bulkhead", snapshot["bulkhead"]["rejected"])):
+            lines.append(f'altiq_gateway_rejected_total{{gateway="{gateway}",reason="{reason}"}} {value}')
+
+    jobs = _cached_queue_stats()
+    lines += ["# HELP altiq_jobs Background jobs by queue and state.", "# TYPE altiq_jobs gauge"]
+    for queue, stats in sorted(jobs.items()):
+        for state in ("queued", "scheduled", "running", "failed"):
+            lines.append(f'altiq_jobs{{queue="{_escape(queue)}",state="{state}"}} {stats[state]}')
+    lines += ["# HELP altiq_jobs_oldest_due_seconds Age of the oldest job waiting for a worker.",
+              "# TYPE altiq_jobs_oldest_due_seconds gauge"]
+    for queue, stats in sorted(jobs.items()):
+        lines.append(f'altiq_jobs_oldest_due_seconds{{queue="{_escape(queue)}"}} {stats["oldest_due_seconds"]}')
+    return "\n".join(lines) + "\n"
+
+
+# ---------------------------------------------------------------------------
+# Collection
+# ---------------------------------------------------------------------------
+
+
+class _TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = current_metrics.get()
+        if metrics is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """``DjangoTemplates`` whose top-level renders are timed for the current request.
+
+    Only templates loaded through the backend are wrapped, so ``{% include %}``
+    and ``{% extends %}`` are not counted twice.
+    """
+
+    def from_string(self, template_code):
+        return _TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return _TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+def _server_timing(total: float, metrics: RequestMetrics) -> str:
+    return ", ".join(
+        [
+            f"total;dur={total * 1000:.1f}",
+            f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"',
+            f"tpl;dur={metrics.template_time * 1000:.1f}",
+            f'gw;dur={metrics.gateway_time * 1000:.1f};desc="{metrics.gateway_calls} calls"',
+        ]
+    )
+
+
+def _time_query(execute, sql, params, many, context):
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics.time_query(execute, sql, params, many, context)
+
+
+def time_queries(sender, connection, **kwargs) -> None:
+    """``connection_created`` receiver timing the connection's queries for the current request.
+
+    Connections are per thread, so wrapping the request thread's connection
+    would miss the queries of async views. The context variable holding the
+    request's metrics follows it into ``sync_to_async`` threads instead.
+    """
+
+    if _time_query not in connection.execute_wrappers:
+        # First, i.e. outermost: a ``connection.execute_wrapper()`` block
+        # active right now pops the last wrapper when it exits.
+        connection.execute_wrappers.insert(0, _time_query)
+
+
+@contextmanager
+def _collecting(metrics: RequestMetrics):
+    metrics_token = current_metrics.set(metrics)
+    listener_token = call_listener.set(metrics.add_gateway_call)
+    try:
+        yield
+    finally:
+        call_listener.reset(listener_token)
+        current_metrics.reset(metrics_token)
+
+
+class RequestTimingMiddleware:
+    """Collect per-request timings; keep it first in ``MIDDLEWARE``."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        started = time.perf_counter()
+        with _collecting(metrics):
+            response = self.get_response(request)
+        return self._record(request, response, metrics, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        started = time.perf_counter()
+        with _collecting(metrics):
+            response = await self.get_response(request)
+        return self._record(request, response, metrics, time.perf_counter() - started)
+
+    def _record(self, request, response, metrics: RequestMetrics, total: float):
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match is not None else "unmatched"
+        REQUEST_DURATION.observe((view, request.method), total)
+        DB_DURATION.observe((view,), metrics.db_time)
+        DB_QUERIES.observe((view,), metrics.queries)
+        TEMPLATE_DURATION.observe((view,), metrics.template_time)
+        GATEWAY_DURATION.observe((view,), metrics.gateway_time)
+        RESPONSES.inc((view, str(response.status_code)))
+
+        if settings.ALTIQ_ENV not in PRODUCTION_ENVS:
+            response["Server-Timing"] = _server_timing(total, metrics)
+        return response
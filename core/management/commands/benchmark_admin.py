@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import random
+import time
+from decimal import Decimal
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.test import RequestFactory
+
+from contacts.models import CustomQuoteRequest
+from core.admin_tools import estimated_count
+from orders.models import Order
+from payments.models import Payment
+from services.models import ServicePackage
+
+BATCH_SIZE = 5000
+FIRST_NAMES = ("Ana", "Luis", "María", "José", "Carla", "Diego", "Sofía", "Jorge", "Lucía", "Pedro")
+LAST_NAMES = ("García", "López", "Martínez", "Hernández", "Ruiz", "Torres", "Flores", "Rivera", "Gómez", "Díaz")
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed N orders, payments and quote requests inside a transaction and time the admin changelists "
+        "(stock ModelAdmin vs core.admin_tools.ScalableAdmin) and the queries behind them: counts, deep "
+        "pages and searches. Nothing is kept."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--repeat", type=int, default=10, help="Executions per measurement.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                targets = self._seed(options["rows"])
+                self._compare_queries(targets, options["repeat"])
+                self._compare_changelists(targets, options["repeat"])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _seed(self, rows: int) -> dict:
+        self.stdout.write(f"Seeding {rows} orders and payments, {rows // 10} quote requests on {connection.vendor}...")
+        started = time.perf_counter()
+        package = ServicePackage.objects.create(
+            slug="benchmark-admin", name_es="Benchmark", short_description_es="", price_mxn=Decimal("1")
+        )
+        rng = random.Random(42)
+        statuses = [value for value, _ in Order.STATUS_CHOICES]
+
+        def name() -> str:
+            return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+        for start in range(0, rows, BATCH_SIZE):
+            count = min(BATCH_SIZE, rows - start)
+            orders = Order.objects.bulk_create(
+                [
+                    Order(
+                        package=package,
+                        customer_name=name(),
+                        company_name=f"Planta {start + i}",
+                        email=f"Cliente.{start + i}@Example.com",
+                        amount=Decimal("1"),
+                        status=rng.choice(statuses),
+                    )
+                    for i in range(count)
+                ]
+            )
+            Payment.objects.bulk_create(
+                [
+                    Payment(
+                        order=order,
+                        method="paypal" if (start + i) % 2 else "coinbase",
+                        amount=Decimal("1"),
+                        provider_payment_id=f"BENCH-{start + i}",
+                    )
+                    for i, order in enumerate(orders)
+                ]
+            )
+            CustomQuoteRequest.objects.bulk_create(
+                [
+                    CustomQuoteRequest(
+                        full_name=name(),
+                        company_name=f"Planta {start + i}",
+                        email=f"lead.{start + i}@example.com",
+                        current_challenge="-",
+                    )
+                    for i in range(count // 10)
+                ]
+            )
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+        self.stdout.write(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+        middle = Order.objects.order_by("-pk").values_list("pk", flat=True)[rows // 2]
+        return {
+            "user": get_user_model().objects.create_superuser("benchmark-admin", "benchmark-admin@example.com", None),
+            "email": f"cliente.{rows // 3}@example.com",
+            # Matches "Planta 1234", "Planta 12340".."Planta 12349", ...
+            "prefix": f"planta {rows // 800}",
+            "offset": rows // 2,
+            "cursor": middle,
+        }
+
+    def _time(self, func, repeat: int) -> float:
+        func()  # warm caches
+        started = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return (time.perf_counter() - started) * 1000 / repeat
+
+    def _report(self, label: str, before_ms: float, after_ms: float) -> None:
+        self.stdout.write(
+            f"{label:<34} {before_ms:>10.2f} ms -> {after_ms:>8.2f} ms  ({before_ms / max(after_ms, 1e-6):.0f}x)"
+        )
+
+    def _compare_queries(self, targets: dict, repeat: int) -> None:
+        self.stdout.write(self.style.MIGRATE_HEADING("\n== queries (before -> after) =="))
+        orders = Order.objects.all()
+        page = 100
+        lowered = orders.alias(
+            email_lower=Lower("email"), name_lower=Lower("customer_name"), company_lower=Lower("company_name")
+        )
+        prefix = targets["prefix"]
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        comparisons = {
+            "total count": (orders.count, lambda: estimated_count(Order)),
+            "middle page": (
+                lambda: list(orders.order_by("-pk")[targets["offset"]: targets["offset"] + page]),
+                lambda: list(orders.filter(pk__lt=targets["cursor"]).order_by("-pk")[:page]),
+            ),
+            "search by email": (
+                lambda: list(orders.filter(
+                    Q(customer_name__icontains=targets["email"])
+                    | Q(company_name__icontains=targets["email"])
+                    | Q(email__icontains=targets["email"])
+                ).order_by("-pk")[:page]),
+                lambda: list(lowered.filter(email_lower=targets["email"]).order_by("-pk")[:page]),
+            ),
+            "search by name prefix": (
+                lambda: list(orders.filter(
+                    Q(customer_name__icontains=prefix) | Q(company_name__icontains=prefix) | Q(email__icontains=prefix)
+                ).order_by("-pk")[:page]),
+                lambda: list(lowered.filter(
+                    Q(name_lower__gte=prefix, name_lower__lt=upper) | Q(company_lower__gte=prefix, company_lower__lt=upper)
+                ).order_by("-pk")[:page]),
+            ),
+        }
+        for label, (before, after) in comparisons.items():
+            self._report(label, self._time(before, repeat), self._time(after, repeat))
+
+    def _compare_changelists(self, targets: dict, repeat: int) -> None:
+        self.stdout.write(self.style.MIGRATE_HEADING("\n== admin changelists (stock -> scalable) =="))
+        factory = RequestFactory()
+        cases = (
+            (Order, {}, "first page"),
+            (Order, {"after": str(targets["cursor"])}, "middle page"),
+            (Order, {"q": targets["email"]}, "email search"),
+            (Payment, {}, "first page"),
+            (CustomQuoteRequest, {"q": targets["prefix"]}, "prefix search"),
+        )
+        for model, params, label in cases:
+            scalable = admin.site._registry[model]
+            stock = type(
+                f"Stock{type(scalable).__name__}",
+                (admin.ModelAdmin,),
+                {
+                    "list_display": scalable.list_display,
+                    "list_filter": [f if isinstance(f, str) else f[0] for f in scalable.list_filter],
+                    "search_fields": scalable.search_fields,
+                },
+            )(model, admin.site)
+            stock_params = dict(params)
+            if "after" in stock_params:
+                # The same rows with numbered pages.
+                stock_params = {"p": str(targets["offset"] // stock.list_per_page + 1)}
+
+            def render(model_admin, query):
+                request = factory.get("/admin/", query)
+                request.user = targets["user"]
+                model_admin.changelist_view(request).render()
+
+            self._report(
+                f"{model._meta.model_name} {label}",
+                self._time(lambda: render(stock, stock_params), repeat),
+                self._time(lambda: render(scalable, params), repeat),
+            )
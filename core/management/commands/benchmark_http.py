@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import json
+import os
+import platform
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from core.benchmark import (
+    Scenario,
+    WSGIClient,
+    compare_results,
+    get_page,
+    post_form,
+    post_json,
+    run_scenario,
+    unique_id,
+)
+from orders.models import Order
+from payments.models import WebhookEvent
+from payments.simulator import GatewaySimulator, SimulatorConfig
+from services.models import ServicePackage
+
+BENCHMARK_USERNAME = "benchmark-http"
+SCENARIOS = ("home", "services", "cases", "checkout", "paypal_webhook", "coinbase_webhook")
+# Scenarios that need the gateway simulator (API calls or webhook signatures).
+GATEWAY_SCENARIOS = {"checkout", "paypal_webhook", "coinbase_webhook"}
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the main pages, checkout POST and both webhooks through the WSGI app with concurrent "
+        "clients. Reports p50/p95/p99 latency, throughput, DB queries and bytes per response, writes "
+        "JSON results and fails when they regress against a stored baseline. Checkout and webhook "
+        "scenarios write rows (removed afterwards), so prefer a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200, help="Timed requests per scenario.")
+        parser.add_argument("--concurrency", type=int, default=4, help="Concurrent clients.")
+        parser.add_argument("--warmup", type=int, default=5, help="Untimed requests per client first.")
+        parser.add_argument("--scenario", action="append", choices=SCENARIOS, dest="scenarios")
+        parser.add_argument("--gateway-latency", type=float, default=0.0, help="Simulated PayPal latency (s).")
+        parser.add_argument("--host", help="Host header (default: first ALLOWED_HOSTS entry or localhost).")
+        parser.add_argument("--output", help="Write the JSON results to this file.")
+        parser.add_argument("--baseline", help="JSON results to compare against; regressions fail the command.")
+        parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed latency/throughput drift.")
+
+    def handle(self, *args, **options):
+        host = options["host"] or next(
+            (h.lstrip(".") for h in settings.ALLOWED_HOSTS if h != "*"), "localhost"
+        )
+        app = get_wsgi_application()
+        names = options["scenarios"] or list(SCENARIOS)
+
+        user = None
+        simulator = None
+        saved_env: dict[str, str | None] = {}
+        results = {
+            "meta": {
+                "created_at": timezone.now().isoformat(),
+                "database": connection.vendor,
+                "python": platform.python_version(),
+                "requests": options["requests"],
+                "concurrency": options["concurrency"],
+                "gateway_latency": options["gateway_latency"],
+            },
+            "scenarios": {},
+        }
+        try:
+            if GATEWAY_SCENARIOS.intersection(names):
+                simulator = GatewaySimulator(SimulatorConfig(
+                    latency=options["gateway_latency"],
+                    paypal_webhook_id="WH-BENCHMARK",
+                    coinbase_webhook_secret="benchmark",
+                )).__enter__()
+                overrides = {
+                    "PAYPAL_ENV": "simulator",
+                    "PAYMENT_SIMULATOR_URL": simulator.base_url,
+                    "PAYPAL_CLIENT_ID": "benchmark",
+                    "PAYPAL_CLIENT_SECRET": "benchmark",
+                    "PAYPAL_WEBHOOK_ID": "WH-BENCHMARK",
+                    "COINBASE_COMMERCE_WEBHOOK_SECRET": "benchmark",
+                    "GATEWAY_MAX_CONCURRENT": str(max(10, options["concurrency"])),
+                }
+                saved_env = {key: os.environ.get(key) for key in overrides}
+                os.environ.update(overrides)
+
+            scenarios = []
+            for name in names:
+                if name == "checkout":
+                    package = ServicePackage.objects.filter(is_active=True).order_by("display_order").first()
+                    if package is None:
+                        self.stderr.write("Skipping checkout: no active service package.")
+                        continue
+                    user, _ = get_user_model().objects.get_or_create(
+                        username=BENCHMARK_USERNAME, defaults={"email": "benchmark@example.com"}
+                    )
+                    scenarios.append(self._checkout_scenario(user, package))
+                else:
+                    scenarios.append(self._scenario(name, simulator))
+
+            for scenario in scenarios:
+                summary = run_scenario(
+                    app,
+                    scenario,
+                    requests=options["requests"],
+                    concurrency=options["concurrency"],
+                    warmup=options["warmup"],
+                    host=host,
+                )
+                results["scenarios"][scenario.name] = summary
+                self.stdout.write(
+                    f"{scenario.name:<17} {summary['rps']:>8.1f} req/s  "
+                    f"p50={summary['p50_ms']:.1f}ms p95={summary['p95_ms']:.1f}ms p99={summary['p99_ms']:.1f}ms  "
+                    f"queries={summary['queries_avg']:g}  bytes={summary['bytes_avg']}  errors={summary['errors']}"
+                )
+        finally:
+            if simulator is not None:
+                simulator.__exit__(None, None, None)
+            for key, value in saved_env.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+            self._cleanup(user)
+
+        if options["output"]:
+            Path(options["output"]).write_text(json.dumps(results, indent=2) + "\n")
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options["baseline"]:
+            baseline = json.loads(Path(options["baseline"]).read_text())
+            regressions = compare_results(results, baseline, tolerance=options["tolerance"])
+            if regressions:
+                raise CommandError("Performance regressions:\n  " + "\n  ".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
+
+    def _scenario(self, name: str, simulator: GatewaySimulator | None) -> Scenario:
+        if name == "home":
+            return Scenario(name, get_page(reverse("home")))
+        if name == "services":
+            return Scenario(name, get_page(reverse("services:list")))
+        if name == "cases":
+            return Scenario(name, get_page(reverse("cases:list")))
+        if name == "paypal_webhook":
+            return Scenario(name, post_json(reverse("payments:paypal_webhook"), lambda: {
+                "id": unique_id(),
+                "event_type": "CHECKOUT.ORDER.APPROVED",
+                "resource": {"id": unique_id("bench-order")},
+            }, sign=simulator.webhook_headers))
+        return Scenario(name, post_json(reverse("payments:coinbase_webhook"), lambda: {
+            "event": {"id": unique_id(), "type": "charge:confirmed", "data": {"id": unique_id("bench-charge")}},
+        }, sign=simulator.webhook_headers))
+
+    def _checkout_scenario(self, user, package) -> Scenario:
+        path = reverse("orders:checkout", kwargs={"package_slug": package.slug})
+
+        def login(client: WSGIClient) -> None:
+            browser = Client()
+            browser.force_login(user)
+            client.cookies[settings.SESSION_COOKIE_NAME] = browser.cookies[settings.SESSION_COOKIE_NAME].value
+            # Rendering the form sets the CSRF cookie.
+            client.request("GET", path)
+
+        def fields(client: WSGIClient) -> dict:
+            return {
+                "csrfmiddlewaretoken": client.cookies.get(settings.CSRF_COOKIE_NAME, ""),
+                "customer_name": "Benchmark",
+                "email": "benchmark@example.com",
+                "payment_method": "paypal",
+                "idempotency_key": unique_id(),
+            }
+
+        return Scenario("checkout", post_form(path, fields), expected_status=302, setup=login)
+
+    def _cleanup(self, user) -> None:
+        WebhookEvent.objects.filter(event_id__startswith="bench-").delete()
+        if user is not None:
+            Order.objects.filter(user=user).delete()
+            user.delete()
@@ -0,0 +1,189 @@
+"""Detect N+1 queries: the same SELECT repeated once per row.
+
+A tracker, fed by an execute wrapper on every DB connection, groups SELECTs by
+shape (the SQL with its parameters left out) and remembers where each one came
+from: the admin changelist column, the template line or, failing both, the
+project code that triggered it. Shapes run ``ALTIQ_NPLUSONE_THRESHOLD`` times or more in
+one request are reported.
+
+``NPlusOneMiddleware`` applies this to requests, controlled by
+``ALTIQ_NPLUSONE``: ``"log"`` writes a warning, ``"raise"`` fails the request
+with ``NPlusOneError``. In tests, wrap the code under test in
+``assert_no_nplusone()``.
+"""
+from __future__ import annotations
+
+import logging
+import re
+import sys
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class NPlusOneError(AssertionError):
+    pass
+
+
+@dataclass
+class RepeatedQuery:
+    shape: str
+    count: int
+    origins: Counter[str] = field(default_factory=Counter)
+
+    @property
+    def origin(self) -> str:
+        return self.origins.most_common(1)[0][0] if self.origins else "unknown"
+
+    def __str__(self) -> str:
+        return f"{self.count}x from {self.origin}: {self.shape[:300]}"
+
+
+def query_shape(sql: str) -> str:
+    return _IN_LIST.sub("IN (...)", _WHITESPACE.sub(" ", sql.strip()))
+
+
+def query_origin() -> str:
+    """Admin column, template line or project code running the current query."""
+
+    base = str(settings.BASE_DIR)
+    code_origin = None
+    frame = sys._getframe(2)
+    while frame is not None:
+        code = frame.f_code
+        if code.co_name == "items_for_result" and "field_name" in frame.f_locals:
+            changelist = frame.f_locals.get("cl")
+            admin_name = type(changelist.model_admin).__name__ if changelist is not None else "admin"
+            return f"admin column {admin_name}.{frame.f_locals['field_name']}"
+        if code.co_name == "render_annotated":
+            node = frame.f_locals.get("self")
+            token, origin = getattr(node, "token", None), getattr(node, "origin", None)
+            if token is not None and origin is not None:
+                return f"template {origin.template_name or origin.name}:{token.lineno}"
+        if (
+            code_origin is None
+            and code.co_filename.startswith(base)
+            and code.co_filename != __file__
+            and "site-packages" not in code.co_filename
+        ):
+            code_origin = f"{code.co_filename[len(base) + 1:]}:{frame.f_lineno} in {code.co_name}"
+        frame = frame.f_back
+    return code_origin or "unknown"
+
+
+class QueryTracker:
+    """Groups the SELECTs run while it is active by shape."""
+
+    def __init__(self, threshold: int | None = None) -> None:
+        self.threshold = threshold or settings.ALTIQ_NPLUSONE_THRESHOLD
+        self.queries: dict[str, RepeatedQuery] = {}
+
+    def record(self, sql: str) -> None:
+        if sql.lstrip()[:6].upper() == "SELECT":
+            shape = query_shape(sql)
+            entry = self.queries.get(shape)
+            if entry is None:
+                entry = self.queries[shape] = RepeatedQuery(shape, 0)
+            entry.count += 1
+            entry.origins[query_origin()] += 1
+
+    def repeated(self) -> list[RepeatedQuery]:
+        found = [entry for entry in self.queries.values() if entry.count >= self.threshold]
+        return sorted(found, key=lambda entry: entry.count, reverse=True)
+
+    def report(self) -> str:
+        return "\n".join(f"  {entry}" for entry in self.repeated())
+
+
+# Trackers active in the current context, innermost last.
+_trackers: ContextVar[tuple[QueryTracker, ...]] = ContextVar("nplusone_trackers", default=())
+
+
+def _track_query(execute, sql, params, many, context):
+    for tracker in _trackers.get():
+        tracker.record(sql)
+    return execute(sql, params, many, context)
+
+
+def track_queries(sender, connection, **kwargs) -> None:
+    """``connection_created`` receiver reporting the connection's queries to active trackers.
+
+    Keyed on a context variable rather than wrapping one connection, so the
+    ``sync_to_async`` threads of async views (each with its own connection)
+    are tracked too.
+    """
+
+    if _track_query not in connection.execute_wrappers:
+        # First, so a ``connection.execute_wrapper()`` block active right now
+        # still pops its own wrapper when it exits.
+        connection.execute_wrappers.insert(0, _track_query)
+
+
+@contextmanager
+def detect_nplusone(threshold: int | None = None):
+    """Track the queries run in this context; yields the ``QueryTracker``."""
+
+    tracker = QueryTracker(threshold)
+    token = _trackers.set(_trackers.get() + (tracker,))
+    try:
+        yield tracker
+    finally:
+        _trackers.reset(token)
+
+
+@contextmanager
+def assert_no_nplusone(threshold: int | None = None):
+    """Fail with ``NPlusOneError`` if the block repeats a query shape."""
+
+    with detect_nplusone(threshold) as tracker:
+        yield tracker
+    if tracker.repeated():
+        raise NPlusOneError("N+1 queries detected:\n" + tracker.report())
+
+
+class NPlusOneMiddleware:
+    """Report N+1 queries per request according to ``ALTIQ_NPLUSONE``."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if settings.ALTIQ_NPLUSONE not in ("log", "raise"):
+            return self.get_response(request)
+
+        with detect_nplusone() as tracker:
+            response = self.get_response(request)
+        self._report(request, tracker)
+        return response
+
+    async def __acall__(self, request):
+        if settings.ALTIQ_NPLUSONE not in ("log", "raise"):
+            return await self.get_response(request)
+
+        with detect_nplusone() as tracker:
+            response = await self.get_response(request)
+        self._report(request, tracker)
+        return response
+
+    def _report(self, request, tracker: QueryTracker) -> None:
+        if tracker.repeated():
+            message = f"N+1 queries in {request.method} {request.path}:\n{tracker.report()}"
+            if settings.ALTIQ_NPLUSONE == "raise":
+                raise NPlusOneError(message)
+            logger.warning(message)
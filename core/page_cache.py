@@ -0,0 +1,145 @@
+"""Full-page cache for anonymous visitors on the public content pages.
+
+Pages are keyed by path, active language and ``ALTIQ_ENV`` and stored together
+with the *version* of every model they depend on. Saving or deleting one of
+those models bumps its version (see ``purge_dependents``), which invalidates
+exactly the pages declared against it. Expired or invalidated copies are kept
+for ``ALTIQ_PAGE_CACHE_STALE_TIMEOUT`` seconds and served to concurrent
+visitors while a single request re-renders the page.
+"""
+from __future__ import annotations
+
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.translation import get_language
+
+KEY_PREFIX = "altiq:page"
+DEPENDENCY_PREFIX = "altiq:page-deps"
+RENDER_LOCK_TIMEOUT = 30
+# Headers a 304 must not repeat from the cached 200.
+NOT_MODIFIED_SKIPPED_HEADERS = {"content-type", "content-length"}
+
+# Model labels ("app_label.ModelName") that at least one cached page uses.
+_dependencies: set[str] = set()
+
+
+def _page_key(request) -> str:
+    env = getattr(settings, "ALTIQ_ENV", "main")
+    path_hash = hashlib.md5(request.path.encode()).hexdigest()
+    return f"{KEY_PREFIX}:{env}:{get_language()}:{path_hash}"
+
+
+def _dependency_key(label: str) -> str:
+    return f"{DEPENDENCY_PREFIX}:{label.lower()}"
+
+
+def _dependency_versions(labels: tuple[str, ...]) -> dict[str, int]:
+    stored = cache.get_many([_dependency_key(label) for label in labels])
+    return {label: stored.get(_dependency_key(label)) for label in labels}
+
+
+def purge_dependents(sender, **kwargs) -> None:
+    """``post_save``/``post_delete`` receiver invalidating dependent pages."""
+
+    label = sender._meta.label
+    if label not in _dependencies:
+        return
+    key = _dependency_key(label)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Seed with a timestamp so a version lost to eviction never matches
+        # the version stored alongside an old page.
+        cache.add(key, time.time_ns(), timeout=None)
+
+
+def _is_cacheable(request, response) -> bool:
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        # Pages that embed a CSRF token are tied to the visitor's cookie.
+        and not request.META.get("CSRF_COOKIE_NEEDS_UPDATE")
+    )
+
+
+def _respond(request, entry: dict) -> HttpResponse:
+    etag = entry["etag"]
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(entry["content"])
+        headers = entry["headers"]
+    else:
+        headers = [
+            (name, value) for name, value in entry["headers"] if name.lower() not in NOT_MODIFIED_SKIPPED_HEADERS
+        ]
+    # Whatever the view set (Content-Type, Cache-Control, Vary, ...) is replayed.
+    for name, value in headers:
+        response[name] = value
+    response["ETag"] = etag
+    return response
+
+
+def cache_public_page(*depends_on: str):
+    """Serve the decorated view from the page cache for anonymous GETs.
+
+    ``depends_on`` lists the model labels whose changes must purge the page,
+    e.g. ``@cache_public_page("cases.CaseStudy")``.
+    """
+
+    _dependencies.update(depends_on)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (
+                request.method not in ("GET", "HEAD")
+                or request.GET
+                or request.user.is_authenticated
+            ):
+                return view(request, *args, **kwargs)
+
+            key = _page_key(request)
+            versions = _dependency_versions(depends_on)
+            entry = cache.get(key)
+            lock_key = f"{key}:lock"
+            locked = False
+            if entry is not None:
+                if entry["versions"] == versions and entry["fresh_until"] > time.time():
+                    return _respond(request, entry)
+                # Stale: one request re-renders, everybody else keeps the copy.
+                locked = cache.add(lock_key, 1, timeout=RENDER_LOCK_TIMEOUT)
+                if not locked:
+                    return _respond(request, entry)
+
+            try:
+                response = view(request, *args, **kwargs)
+                if hasattr(response, "render") and callable(response.render):
+                    response = response.render()
+                if not _is_cacheable(request, response):
+                    return response
+
+                content = response.content
+                fresh_timeout = settings.ALTIQ_PAGE_CACHE_TIMEOUT
+                entry = {
+                    "content": content,
+                    "headers": list(response.items()),
+                    "etag": f'"{hashlib.sha256(content).hexdigest()[:32]}"',
+                    "versions": versions,
+                    "fresh_until": time.time() + fresh_timeout,
+                }
+                cache.set(key, entry, fresh_timeout + settings.ALTIQ_PAGE_CACHE_STALE_TIMEOUT)
+                return _respond(request, entry)
+            finally:
+                if locked:
+                    cache.delete(lock_key)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,233 @@
+"""Opt-in profiling of live requests.
+
+``SamplingProfilerMiddleware`` profiles a request when either
+
+* ``ALTIQ_ENV`` is ``staging`` or ``test`` and the request falls in the
+  ``ALTIQ_PROFILE_SAMPLE_RATE`` fraction, or
+* a staff user sends the ``X-AltIQ-Profile: 1`` header (any environment).
+
+Each capture is written to ``ALTIQ_PROFILE_DIR`` as three files sharing an id:
+``<id>.prof`` (cProfile data, for ``pstats``/snakeviz), ``<id>.collapsed``
+(stacks sampled every ``ALTIQ_PROFILE_INTERVAL`` seconds, in the collapsed
+format read by flamegraph.pl and speedscope) and ``<id>.json`` (view, path,
+status and duration). Only the newest ``ALTIQ_PROFILE_KEEP`` captures are kept.
+
+One request is profiled at a time: on Python 3.12+ only one cProfile may be
+active per interpreter, so a request arriving while another is being
+profiled is served unprofiled. Profiles cover the thread running the
+middleware; under ASGI that is the event loop, so they include whatever
+else the loop ran meanwhile and miss work handed to ``sync_to_async``.
+"""
+from __future__ import annotations
+
+import cProfile
+import json
+import logging
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ENVS = {"staging", "test"}
+PROFILE_HEADER = "X-AltIQ-Profile"
+CAPTURE_SUFFIXES = (".json", ".prof", ".collapsed")
+
+# Held while a request is being profiled.
+_profiling = threading.Lock()
+
+
+class StackSampler:
+    """Sample one thread's Python stack at a fixed interval from a helper thread."""
+
+    def __init__(self, thread_id: int, interval: float) -> None:
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="altiq-stack-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    base = str(settings.BASE_DIR)
+    if filename.startswith(base):
+        filename = filename[len(base) + 1:]
+    elif "site-packages/" in filename:
+        filename = filename.split("site-packages/", 1)[1]
+    # ";" separates frames and " " the count in the collapsed format.
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ",").replace(" ", "_")
+
+
+def profile_dir() -> Path:
+    return Path(settings.ALTIQ_PROFILE_DIR)
+
+
+def should_profile(request) -> bool:
+    if request.headers.get(PROFILE_HEADER) == "1":
+        user = getattr(request, "user", None)
+        if user is not None and user.is_staff:
+            return True
+    return settings.ALTIQ_ENV in PROFILE_ENVS and random.random() < settings.ALTIQ_PROFILE_SAMPLE_RATE
+
+
+def save_capture(meta: dict, profiler: cProfile.Profile, stacks: Counter[str]) -> str:
+    """Write one capture and drop the oldest ones beyond ``ALTIQ_PROFILE_KEEP``."""
+
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    # Ids sort chronologically, which is what rotation relies on.
+    capture_id = f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:6]}"
+    profiler.dump_stats(directory / f"{capture_id}.prof")
+    (directory / f"{capture_id}.collapsed").write_text(
+        "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+    )
+    (directory / f"{capture_id}.json").write_text(json.dumps({"id": capture_id, **meta}))
+
+    for old in sorted(directory.glob("*.json"))[: -settings.ALTIQ_PROFILE_KEEP or None]:
+        for suffix in CAPTURE_SUFFIXES:
+            old.with_suffix(suffix).unlink(missing_ok=True)
+    return capture_id
+
+
+def list_captures() -> list[dict]:
+    """Metadata of every stored capture, slowest first."""
+
+    captures = []
+    directory = profile_dir()
+    if directory.is_dir():
+        for path in directory.glob("*.json"):
+            try:
+                captures.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue
+    return sorted(captures, key=lambda capture: capture["duration_ms"], reverse=True)
+
+
+def capture_path(capture_id: str, suffix: str) -> Path | None:
+    """Path of one stored capture file, or None for unknown ids."""
+
+    if suffix not in CAPTURE_SUFFIXES or not capture_id.replace("-", "").isalnum():
+        return None
+    path = profile_dir() / f"{capture_id}{suffix}"
+    return path if path.is_file() else None
+
+
+class RequestProfile:
+    """cProfile plus stack sampler for one request, on the current thread."""
+
+    def __init__(self) -> None:
+        self.profiler = cProfile.Profile()
+        self.sampler = StackSampler(threading.get_ident(), settings.ALTIQ_PROFILE_INTERVAL)
+        self.started = 0.0
+        self.elapsed = 0.0
+
+    def start(self) -> bool:
+        """Start profiling; False if another profile is already running."""
+
+        if not _profiling.acquire(blocking=False):
+            return False
+        try:
+            self.profiler.enable()
+        except ValueError:
+            # Python 3.12+: another profiler (a debugger, coverage) is active.
+            _profiling.release()
+            return False
+        self.sampler.start()
+        self.started = time.perf_counter()
+        return True
+
+    def stop(self) -> None:
+        self.profiler.disable()
+        self.elapsed = time.perf_counter() - self.started
+        self.sampler.stop()
+        _profiling.release()
+
+    def save(self, request, response) -> None:
+        match = getattr(request, "resolver_match", None)
+        meta = {
+            "view": match.view_name if match is not None else "unmatched",
+            "method": request.method,
+            "path": request.get_full_path(),
+            "status": response.status_code,
+            "duration_ms": round(self.elapsed * 1000, 1),
+            "samples": sum(self.sampler.stacks.values()),
+            "created_at": time.time(),
+        }
+        try:
+            capture_id = save_capture(meta, self.profiler, self.sampler.stacks)
+        except OSError:
+            logger.warning("Could not write profile for %s", meta["path"], exc_info=True)
+        else:
+            response["X-AltIQ-Profile-Id"] = capture_id
+
+
+class SamplingProfilerMiddleware:
+    """Profile opted-in requests; goes after ``AuthenticationMiddleware``."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not should_profile(request):
+            return self.get_response(request)
+        profile = RequestProfile()
+        if not profile.start():
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            profile.stop()
+        profile.save(request, response)
+        return response
+
+    async def __acall__(self, request):
+        # The staff check loads request.user, which queries the database.
+        if request.headers.get(PROFILE_HEADER) == "1":
+            wanted = await sync_to_async(should_profile)(request)
+        else:
+            wanted = should_profile(request)
+        if not wanted:
+            return await self.get_response(request)
+        profile = RequestProfile()
+        if not profile.start():
+            return await self.get_response(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            profile.stop()
+        await sync_to_async(profile.save)(request, response)
+        return response
@@ -0,0 +1,38 @@
+"""Static file serving for both WSGI and ASGI deployments.
+
+WhiteNoise's middleware is sync-only, so under ASGI Django would adapt it and
+every request after it would hop from the event loop to a thread and back.
+``AsyncWhiteNoiseMiddleware`` keeps the same lookup and serving but passes
+non-static requests straight to the rest of an async stack.
+"""
+from __future__ import annotations
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """``WhiteNoiseMiddleware`` that does not force a sync stack."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs) -> None:
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            # Opens the file and may stat it: keep that off the event loop.
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
@@ -1,7 +1,37 @@
 from __future__ import annotations
 
-from django.test import TestCase
+import csv
+import io
+import json
+import pstats
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.handlers.asgi import ASGIHandler
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.template import engines
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
+
+from cases.models import CaseStudy
+from orders.admin import OrderAdmin
+from orders.models import Order
+from payments.models import Payment
+from services.models import ServicePackage
+
+from . import profiling
+from .instrumentation import RequestTimingMiddleware
+from .nplusone import NPlusOneError, NPlusOneMiddleware, assert_no_nplusone, detect_nplusone
+from .page_cache import cache_public_page
 
 
 class CoreViewsTests(TestCase):
@@ -11,3 +41,359 @@ class CoreViewsTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, "AltIQ")
 
+
+class PageCacheTests(TestCase):
+    def setUp(self) -> None:
+        cache.clear()
+        self.case = CaseStudy.objects.create(
+            slug="paros-planta",
+            title_es="Menos paros en planta",
+            problem_es="Paros no programados.",
+            solution_es="Mantenimiento predictivo.",
+            impact_es="-15% paros no programados",
+        )
+
+    def test_anonymous_page_is_served_from_cache_with_etag(self) -> None:
+        url = reverse("cases:list")
+        first = self.client.get(url)
+        self.assertContains(first, "Menos paros en planta")
+        self.assertTrue(first.has_header("ETag"))
+
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(second["ETag"], first["ETag"])
+
+        not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_model_change_purges_dependent_page(self) -> None:
+        url = reverse("cases:list")
+        first = self.client.get(url)
+        self.case.title_es = "Cero paros en planta"
+        self.case.save()
+
+        response = self.client.get(url)
+        self.assertContains(response, "Cero paros en planta")
+        self.assertNotEqual(response["ETag"], first["ETag"])
+
+    def test_cached_page_keeps_the_view_headers(self) -> None:
+        @cache_public_page()
+        def view(request):
+            response = HttpResponse("{}", content_type="application/json")
+            response["Cache-Control"] = "public, max-age=60"
+            response["Vary"] = "Accept-Language"
+            return response
+
+        def get(**headers):
+            request = RequestFactory().get("/headers-test/", **headers)
+            request.user = AnonymousUser()
+            return view(request)
+
+        first = get()
+        second = get()
+        for header in ("Content-Type", "Cache-Control", "Vary", "ETag"):
+            self.assertEqual(second[header], first[header])
+
+        not_modified = get(HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified["Cache-Control"], "public, max-age=60")
+        self.assertFalse(not_modified.has_header("Content-Type"))
+
+    def test_authenticated_users_bypass_cache(self) -> None:
+        get_user_model().objects.create_user(username="staff", email="staff@example.com", password="testpass123")
+        self.client.login(username="staff", password="testpass123")
+        response = self.client.get(reverse("cases:list"))
+        self.assertFalse(response.has_header("ETag"))
+
+
+class HttpBenchmarkTests(TestCase):
+    def test_results_are_written_and_compared_to_baseline(self) -> None:
+        output = Path(tempfile.mkdtemp()) / "results.json"
+        options = {"requests": 3, "concurrency": 1, "warmup": 1, "scenario": ["cases", "paypal_webhook"]}
+        call_command("benchmark_http", output=str(output), stdout=io.StringIO(), **options)
+
+        results = json.loads(output.read_text())
+        webhook = results["scenarios"]["paypal_webhook"]
+        self.assertEqual(webhook["requests"], 3)
+        self.assertEqual(webhook["errors"], 0)
+        self.assertGreater(webhook["queries_avg"], 0)
+        self.assertEqual(results["scenarios"]["cases"]["queries_avg"], 0)
+
+        # A baseline with a tighter query budget turns the run into a failure.
+        webhook["queries_avg"] -= 1
+        output.write_text(json.dumps(results))
+        with self.assertRaisesMessage(CommandError, "paypal_webhook: queries/request"):
+            call_command("benchmark_http", baseline=str(output), stdout=io.StringIO(), **options)
+
+
+class InstrumentationTests(TestCase):
+    @override_settings(ALTIQ_ENV="staging")
+    def test_server_timing_header_outside_production(self) -> None:
+        response = self.client.get(reverse("services:list"))
+        timing = response["Server-Timing"]
+        for metric in ("total;dur=", "db;dur=", "tpl;dur=", "gw;dur="):
+            self.assertIn(metric, timing)
+
+    @override_settings(ALTIQ_ENV="main")
+    def test_no_server_timing_header_in_production(self) -> None:
+        response = self.client.get(reverse("services:list"))
+        self.assertFalse(response.has_header("Server-Timing"))
+
+    @override_settings(ALTIQ_METRICS_TOKEN="scrape-me")
+    def test_metrics_are_labelled_by_url_name(self) -> None:
+        self.client.get(reverse("services:list"))
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+
+        response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer scrape-me")
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('altiq_http_request_duration_seconds_count{view="services:list",method="GET"}', body)
+        self.assertIn('altiq_http_db_queries_bucket{view="services:list",le="+Inf"}', body)
+        self.assertIn('altiq_gateway_circuit_open{gateway="paypal"} 0', body)
+
+    def test_job_queue_counts_are_reused_between_scrapes(self) -> None:
+        staff = get_user_model().objects.create_user(username="ops", password="testpass123", is_staff=True)
+        self.client.force_login(staff)
+        with (
+            mock.patch("core.instrumentation._queue_stats", None),
+            mock.patch("core.instrumentation.queue_stats", return_value={}) as stats,
+        ):
+            self.client.get(reverse("metrics"))
+            self.client.get(reverse("metrics"))
+        self.assertEqual(stats.call_count, 1)
+
+    @override_settings(ALTIQ_ENV="staging")
+    async def test_async_stack_is_timed_without_a_thread(self) -> None:
+        async def view(request):
+            # Runs on another thread, with that thread's connection.
+            await sync_to_async(list)(ServicePackage.objects.all())
+            return HttpResponse("ok")
+
+        middleware = RequestTimingMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = await middleware(RequestFactory().get("/"))
+        self.assertIn('desc="1 queries"', response["Server-Timing"])
+
+
+class ProfilingTests(TestCase):
+    def setUp(self) -> None:
+        self.profile_dir = Path(tempfile.mkdtemp())
+        overrides = override_settings(ALTIQ_PROFILE_DIR=str(self.profile_dir), ALTIQ_PROFILE_INTERVAL=0.001)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.staff = get_user_model().objects.create_user(
+            username="ops", email="ops@example.com", password="testpass123", is_staff=True
+        )
+
+    def test_staff_header_profiles_request(self) -> None:
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("services:list"), HTTP_X_ALTIQ_PROFILE="1")
+        capture_id = response["X-AltIQ-Profile-Id"]
+
+        self.assertTrue(pstats.Stats(str(self.profile_dir / f"{capture_id}.prof")).total_calls)
+        self.assertTrue((self.profile_dir / f"{capture_id}.collapsed").exists())
+
+        page = self.client.get(reverse("profiles"))
+        self.assertContains(page, "services:list")
+        download = self.client.get(reverse("profile_download", args=[capture_id, "collapsed"]))
+        self.assertEqual(download.status_code, 200)
+
+    def test_header_ignored_for_other_users(self) -> None:
+        response = self.client.get(reverse("services:list"), HTTP_X_ALTIQ_PROFILE="1")
+        self.assertFalse(response.has_header("X-AltIQ-Profile-Id"))
+        self.assertEqual(list(self.profile_dir.iterdir()), [])
+
+    def test_request_is_served_unprofiled_while_another_is_profiled(self) -> None:
+        self.client.force_login(self.staff)
+        url = reverse("services:list")
+        with profiling._profiling:
+            response = self.client.get(url, HTTP_X_ALTIQ_PROFILE="1")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("X-AltIQ-Profile-Id"))
+
+        # Python 3.12+ refuses a second active cProfile.
+        with mock.patch("cProfile.Profile.enable", side_effect=ValueError("Another profiler is active")):
+            response = self.client.get(url, HTTP_X_ALTIQ_PROFILE="1")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("X-AltIQ-Profile-Id"))
+        self.assertTrue(self.client.get(url, HTTP_X_ALTIQ_PROFILE="1").has_header("X-AltIQ-Profile-Id"))
+
+    async def test_async_stack_is_profiled(self) -> None:
+        async def view(request):
+            return HttpResponse("ok")
+
+        middleware = profiling.SamplingProfilerMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = RequestFactory().get("/", HTTP_X_ALTIQ_PROFILE="1")
+        request.user = self.staff
+        response = await middleware(request)
+        self.assertTrue((self.profile_dir / f"{response['X-AltIQ-Profile-Id']}.prof").exists())
+
+    @override_settings(ALTIQ_ENV="staging", ALTIQ_PROFILE_SAMPLE_RATE=1.0, ALTIQ_PROFILE_KEEP=2)
+    def test_sampled_captures_rotate(self) -> None:
+        for _ in range(3):
+            self.assertTrue(self.client.get(reverse("services:list")).has_header("X-AltIQ-Profile-Id"))
+        self.assertEqual(len(list(self.profile_dir.glob("*.json"))), 2)
+        self.assertEqual(len(list(self.profile_dir.glob("*.prof"))), 2)
+
+
+class NPlusOneTests(TestCase):
+    def setUp(self) -> None:
+        for index in range(3):
+            package = ServicePackage.objects.create(
+                slug=f"nplusone-{index}", name_es=f"Paquete {index}", short_description_es="", price_mxn=100
+            )
+            Order.objects.create(package=package, customer_name="Cliente", email="c@example.com", amount=100)
+
+    def test_reports_template_line(self) -> None:
+        template = engines["django"].from_string("{% for order in orders %}\n{{ order.package }}\n{% endfor %}")
+        with self.assertRaisesMessage(NPlusOneError, "3x from template <unknown source>:2"):
+            with assert_no_nplusone():
+                template.render({"orders": Order.objects.all()})
+
+        with assert_no_nplusone():
+            template.render({"orders": Order.objects.select_related("package")})
+
+    @override_settings(ALTIQ_NPLUSONE="off")
+    def test_reports_admin_column(self) -> None:
+        admin = get_user_model().objects.create_superuser("admin", "admin@example.com", "testpass123")
+        self.client.force_login(admin)
+        with mock.patch.object(OrderAdmin, "list_select_related", False), detect_nplusone() as tracker:
+            self.client.get(reverse("admin:orders_order_changelist"))
+        self.assertIn("admin column OrderAdmin.package", [entry.origin for entry in tracker.repeated()])
+
+    @override_settings(ALTIQ_NPLUSONE="raise")
+    def test_middleware_can_fail_requests(self) -> None:
+        admin = get_user_model().objects.create_superuser("admin", "admin@example.com", "testpass123")
+        self.client.force_login(admin)
+        with mock.patch.object(OrderAdmin, "list_select_related", False), self.assertRaises(NPlusOneError):
+            self.client.get(reverse("admin:orders_order_changelist"))
+
+    @override_settings(ALTIQ_NPLUSONE="raise")
+    async def test_async_stack_is_checked(self) -> None:
+        def packages():
+            return [str(order.package) for order in Order.objects.all()]
+
+        async def view(request):
+            return HttpResponse(", ".join(await sync_to_async(packages)()))
+
+        middleware = NPlusOneMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        with self.assertRaisesMessage(NPlusOneError, "3x from core/tests.py"):
+            await middleware(RequestFactory().get("/"))
+
+
+class AsgiStackTests(TestCase):
+    @override_settings(DEBUG=True)
+    def test_middleware_runs_without_sync_adapters(self) -> None:
+        # Django logs each sync-only middleware it has to wrap (DEBUG only).
+        with self.assertNoLogs("django.request", "DEBUG"):
+            ASGIHandler()
+
+
+class ScalableAdminTests(TestCase):
+    def setUp(self) -> None:
+        package = ServicePackage.objects.create(
+            slug="admin-scale", name_es="Paquete", short_description_es="", price_mxn=100
+        )
+        self.orders = [
+            Order.objects.create(
+                package=package, customer_name=name, email=f"{name.split()[0]}@Example.com", amount=100
+            )
+            for name in ("Ana Ruiz", "Andrea Gil", "Beto Luna", "Carla Paz", "Diego Sol")
+        ]
+        Payment.objects.bulk_create(
+            [Payment(order=order, method="paypal", amount=100, provider_payment_id=f"PP-{order.pk}") for order in self.orders]
+        )
+        admin = get_user_model().objects.create_superuser("admin", "admin@example.com", "testpass123")
+        self.client.force_login(admin)
+        self.url = reverse("admin:orders_order_changelist")
+
+    def _listed(self, response) -> list[int]:
+        return [order.pk for order in response.context["cl"].result_list]
+
+    def test_keyset_pages_follow_the_cursor(self) -> None:
+        with mock.patch.object(OrderAdmin, "list_per_page", 2):
+            first = self.client.get(self.url)
+            cl = first.context["cl"]
+            self.assertEqual(self._listed(first), [self.orders[4].pk, self.orders[3].pk])
+            self.assertEqual(cl.result_count, 5)
+            self.assertContains(first, "Siguiente")
+
+            second = self.client.get(self.url + cl.next_page_url)
+            self.assertEqual(self._listed(second), [self.orders[2].pk, self.orders[1].pk])
+            last = self.client.get(self.url + second.context["cl"].next_page_url)
+            self.assertEqual(self._listed(last), [self.orders[0].pk])
+            self.assertIsNone(last.context["cl"].next_cursor)
+
+    def test_email_and_prefix_search(self) -> None:
+        response = self.client.get(self.url, {"q": " ANA@example.COM "})
+        self.assertEqual(self._listed(response), [self.orders[0].pk])
+
+        response = self.client.get(self.url, {"q": "an"})
+        self.assertEqual(self._listed(response), [self.orders[1].pk, self.orders[0].pk])
+
+        response = self.client.get(reverse("admin:payments_payment_changelist"), {"q": f"PP-{self.orders[2].pk}"})
+        self.assertEqual([payment.order_id for payment in response.context["cl"].result_list], [self.orders[2].pk])
+
+    def test_numeric_search_by_id_and_too_long_for_an_id(self) -> None:
+        response = self.client.get(self.url, {"q": str(self.orders[3].pk)})
+        self.assertEqual(self._listed(response), [self.orders[3].pk])
+        for name in ("orders_order", "payments_payment"):
+            response = self.client.get(reverse(f"admin:{name}_changelist"), {"q": "5215512345678901234567"})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(list(response.context["cl"].result_list), [])
+
+    def test_changelists_have_no_nplusone(self) -> None:
+        for name in ("orders_order", "payments_payment"):
+            with assert_no_nplusone():
+                self.assertEqual(self.client.get(reverse(f"admin:{name}_changelist")).status_code, 200)
+
+
+class ExportTests(TestCase):
+    def setUp(self) -> None:
+        package = ServicePackage.objects.create(slug="export-pkg", name_es="Paquete", short_description_es="", price_mxn=100)
+        self.recent = Order.objects.create(
+            package=package, customer_name="=Ana", email="ana@example.com", amount=Decimal("150.00")
+        )
+        self.old = Order.objects.create(package=package, customer_name="Beto", email="beto@example.com", amount=100)
+        Order.objects.filter(pk=self.old.pk).update(created_at=timezone.now() - timedelta(days=40))
+        Payment.objects.create(order=self.recent, method="paypal", amount=150, provider_payment_id="PP-1")
+        Payment.objects.create(order=self.recent, method="coinbase", amount=150, provider_payment_id="CB-2")
+        admin = get_user_model().objects.create_superuser("admin", "admin@example.com", "testpass123")
+        self.client.force_login(admin)
+
+    def _body(self, response) -> str:
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_csv_with_date_range_and_joined_order_columns(self) -> None:
+        since = (timezone.localdate() - timedelta(days=7)).isoformat()
+        response = self.client.get(reverse("export", args=["payments"]), {"from": since})
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        rows = list(csv.DictReader(io.StringIO(self._body(response).lstrip("\ufeff"))))
+        self.assertEqual([row["provider_payment_id"] for row in rows], ["PP-1", "CB-2"])
+        self.assertEqual(rows[0]["email"], "ana@example.com")
+        self.assertEqual(rows[0]["customer_name"], "'=Ana")
+
+        response = self.client.get(reverse("export", args=["orders"]), {"to": since})
+        self.assertIn("beto@example.com", self._body(response))
+
+    def test_ndjson_orders_carry_latest_payment(self) -> None:
+        response = self.client.get(reverse("export", args=["orders"]), {"format": "ndjson"})
+        rows = [json.loads(line) for line in self._body(response).splitlines()]
+        self.assertEqual([row["id"] for row in rows], [self.recent.pk, self.old.pk])
+        self.assertEqual(rows[0]["payment_method"], "coinbase")
+        self.assertEqual(rows[0]["amount"], "150.00")
+        self.assertIsNone(rows[1]["payment_method"])
+
+        self.assertEqual(self.client.get(reverse("export", args=["orders"]), {"from": "ayer"}).status_code, 400)
+
+    def test_admin_action_exports_selection(self) -> None:
+        response = self.client.post(
+            reverse("admin:orders_order_changelist"),
+            {"action": "export_csv", "_selected_action": [self.old.pk]},
+        )
+        body = self._body(response)
+        self.assertIn("beto@example.com", body)
+        self.assertNotIn("ana@example.com", body)
@@ -6,5 +6,9 @@ from . import views
 
 urlpatterns = [
     path("", views.home, name="home"),
+    path("metrics", views.metrics, name="metrics"),
+    path("staff/export/<slug:name>/", views.export, name="export"),
+    path("staff/profiles/", views.profiles, name="profiles"),
+    path("staff/profiles/<str:capture_id>/<str:kind>/", views.profile_download, name="profile_download"),
 ]
 
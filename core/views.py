@@ -1,9 +1,92 @@
 from __future__ import annotations
 
+import hmac
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
 from django.shortcuts import render
+from django.utils.dateparse import parse_date
+from django.views.decorators.cache import never_cache
+
+from .exports import EXPORTS, FORMATS, export_response, filter_created
+from .instrumentation import render_metrics
+from .page_cache import cache_public_page
+from .profiling import capture_path, list_captures
 
 
+@cache_public_page()
 def home(request):
     """AltIQ main landing page with the full SI-piloted hero."""
     return render(request, "core/landing.html")
 
+
+@never_cache
+def metrics(request):
+    """Request timings of this process in the Prometheus text format."""
+
+    token = settings.ALTIQ_METRICS_TOKEN
+    supplied = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    if not (token and hmac.compare_digest(supplied, token)) and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@staff_member_required
+def profiles(request):
+    """Captured request profiles (core.profiling), slowest first, optionally for one view."""
+
+    captures = list_captures()
+    by_view: dict[str, dict] = {}
+    for capture in captures:
+        summary = by_view.setdefault(capture["view"], {"view": capture["view"], "count": 0, "slowest_ms": 0.0})
+        summary["count"] += 1
+        summary["slowest_ms"] = max(summary["slowest_ms"], capture["duration_ms"])
+
+    selected = request.GET.get("view", "")
+    if selected:
+        captures = [capture for capture in captures if capture["view"] == selected]
+    return render(
+        request,
+        "core/profiles.html",
+        {
+            "captures": captures[:100],
+            "views": sorted(by_view.values(), key=lambda summary: summary["slowest_ms"], reverse=True),
+            "selected_view": selected,
+        },
+    )
+
+
+@staff_member_required
+def profile_download(request, capture_id: str, kind: str):
+    path = capture_path(capture_id, {"pstats": ".prof", "collapsed": ".collapsed"}.get(kind, ""))
+    if path is None:
+        raise Http404("Unknown profile")
+    return FileResponse(path.open("rb"), as_attachment=True, filename=path.name)
+
+
+@staff_member_required
+def export(request, name: str):
+    """Stream every ``name`` row (see core.exports.EXPORTS) as CSV or NDJSON.
+
+    Query parameters: ``format`` (csv or ndjson), ``from`` and ``to``
+    (inclusive YYYY-MM-DD creation dates).
+    """
+
+    export_spec = EXPORTS.get(name)
+    if export_spec is None:
+        raise Http404("Unknown export")
+    fmt = request.GET.get("format", "csv")
+    if fmt not in FORMATS:
+        return HttpResponseBadRequest("format must be csv or ndjson")
+    dates = {}
+    for param in ("from", "to"):
+        value = request.GET.get(param, "")
+        try:
+            dates[param] = parse_date(value) if value else None
+        except ValueError:
+            dates[param] = None
+        if value and dates[param] is None:
+            return HttpResponseBadRequest(f"{param} must be a YYYY-MM-DD date")
+    queryset = filter_created(export_spec.queryset(), dates["from"], dates["to"])
+    return export_response(export_spec, queryset, fmt)
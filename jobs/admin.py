@@ -0,0 +1,23 @@
+from __future__ import annotations
+
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "queue", "priority", "status", "attempts", "run_at", "finished_at", "created_at")
+    list_filter = ("status", "queue", "name")
+    search_fields = ("name", "unique_key")
+    readonly_fields = ("locked_by", "locked_until", "started_at", "finished_at", "created_at")
+    actions = ["retry_now"]
+
+    @admin.action(description="Retry selected jobs now")
+    def retry_now(self, request, queryset):
+        count = queryset.exclude(status="running").update(
+            # Without the key, so a queued job with the same key is no conflict.
+            status="queued", run_at=timezone.now(), attempts=0, last_error="", finished_at=None, unique_key=None
+        )
+        self.message_user(request, f"{count} job(s) queued.")
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import json
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from jobs.worker import Worker, queue_stats
+
+
+def _work(queues, threads, loop, sleep) -> dict[str, int]:
+    worker = Worker(queues=queues, threads=threads)
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    return worker.run(loop=loop, sleep=sleep)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background jobs (jobs.models.Job). Exits once nothing is due unless --loop is "
+        "given. SIGTERM finishes the running jobs and stops."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queue", action="append", dest="queues", help="Only these queues (repeatable).")
+        parser.add_argument("--threads", type=int, default=1, help="Jobs run concurrently per process.")
+        parser.add_argument("--processes", type=int, default=1, help="Worker processes (forked).")
+        parser.add_argument("--loop", action="store_true", help="Keep polling instead of exiting when drained.")
+        parser.add_argument("--sleep", type=float, default=1.0, help="Seconds between polls when idle.")
+        parser.add_argument("--stats", action="store_true", help="Print queue depth and latency as JSON and exit.")
+
+    def handle(self, *args, **options):
+        if options["stats"]:
+            self.stdout.write(json.dumps(queue_stats(), indent=2))
+            return
+
+        work_args = (options["queues"], options["threads"], options["loop"], options["sleep"])
+        if options["processes"] <= 1:
+            counts = _work(*work_args)
+            self.stdout.write(self.style.SUCCESS(
+                f"Jobs: succeeded={counts['succeeded']}, retry={counts['retry']}, failed={counts['failed']}"
+            ))
+            return
+
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise CommandError("--processes needs the fork start method; use --threads instead.")
+        # Children must not share the parent's database connections.
+        connections.close_all()
+        context = multiprocessing.get_context("fork")
+        children = [context.Process(target=_work, args=work_args) for _ in range(options["processes"])]
+        for child in children:
+            child.start()
+        try:
+            for child in children:
+                child.join()
+        except KeyboardInterrupt:
+            for child in children:
+                child.terminate()
+                child.join()
+        self.stdout.write(self.style.SUCCESS(f"{len(children)} worker processes finished."))
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """A call to a registered job function, run by ``manage.py runworker``.
+
+    Jobs are claimed highest ``priority`` first, then by ``run_at``. Failed
+    attempts are retried with backoff until ``max_attempts``.
+    """
+
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("succeeded", "Succeeded"),
+        ("failed", "Failed"),
+    ]
+
+    name = models.CharField(max_length=120, help_text="Registered job name, e.g. orders.deliver_outbox")
+    kwargs = models.JSONField(default=dict, blank=True)
+    queue = models.CharField(max_length=50, default="default")
+    priority = models.SmallIntegerField(default=0, help_text="Higher runs first")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="queued")
+    # At most one queued job per key; enqueueing another is a no-op. Cleared
+    # when a worker claims the job.
+    unique_key = models.CharField(max_length=120, null=True, blank=True)
+
+    # Earliest start of the next attempt.
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    last_error = models.TextField(blank=True)
+    # While running: the worker and the lease expiry after which a crashed
+    # worker's job is claimed again.
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(blank=True, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["status", "queue", "-priority", "run_at"], name="job_due_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["unique_key"], condition=Q(status="queued"), name="job_unique_queued"),
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"Job #{self.pk} {self.name} - {self.status}"
@@ -0,0 +1,84 @@
+"""Job registration and enqueueing.
+
+Register a function in your app's ``jobs.py``::
+
+    @job("orders.deliver_outbox", queue="email")
+    def deliver_outbox(batch_size=50): ...
+
+and queue calls with ``enqueue("orders.deliver_outbox", {"batch_size": 20})``.
+Keyword arguments are stored as JSON. Enqueueing inside a transaction makes
+the job visible to workers only once it commits.
+"""
+from __future__ import annotations
+
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+
+from .models import Job
+
+
+@dataclass(frozen=True)
+class JobSpec:
+    name: str
+    func: Callable[..., object]
+    queue: str = "default"
+    priority: int = 0
+    max_attempts: int = 5
+
+
+_registry: dict[str, JobSpec] = {}
+
+
+def job(name: str, *, queue: str = "default", priority: int = 0, max_attempts: int = 5):
+    """Register the decorated function as job ``name``."""
+
+    def register(func):
+        _registry[name] = JobSpec(name, func, queue, priority, max_attempts)
+        return func
+
+    return register
+
+
+def get_job(name: str) -> JobSpec | None:
+    return _registry.get(name)
+
+
+def enqueue(
+    name: str,
+    kwargs: dict | None = None,
+    *,
+    delay: timedelta | None = None,
+    run_at: datetime | None = None,
+    priority: int | None = None,
+    queue: str | None = None,
+    unique_key: str | None = None,
+) -> None:
+    """Queue a call to job ``name``.
+
+    ``delay``/``run_at`` schedule it for later. With ``unique_key`` the call
+    is dropped while another job with that key is still queued (not yet
+    running), which coalesces "something changed, process it" signals.
+    """
+
+    spec = _registry.get(name)
+    if spec is None:
+        raise KeyError(f"Unknown job {name!r}")
+    if run_at is None:
+        run_at = timezone.now() + (delay or timedelta())
+    Job.objects.bulk_create(
+        [
+            Job(
+                name=name,
+                kwargs=kwargs or {},
+                queue=queue or spec.queue,
+                priority=spec.priority if priority is None else priority,
+                max_attempts=spec.max_attempts,
+                run_at=run_at,
+                unique_key=unique_key,
+            )
+        ],
+        ignore_conflicts=unique_key is not None,
+    )
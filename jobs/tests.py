@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import io
+import threading
+import unittest
+from datetime import timedelta
+
+from django.core import mail
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from orders.emails import OUTBOX_JOB, enqueue_email
+from .models import Job
+from .registry import enqueue, job
+from .worker import Worker, claim_jobs, queue_stats, run_job
+
+calls: list[tuple[str, int]] = []
+calls_lock = threading.Lock()
+
+
+@job("tests.record")
+def record(label: str = "", value: int = 0) -> None:
+    with calls_lock:
+        calls.append((label, value))
+
+
+@job("tests.explode", max_attempts=2)
+def explode() -> None:
+    raise RuntimeError("boom")
+
+
+class JobQueueTests(TestCase):
+    def setUp(self) -> None:
+        calls.clear()
+
+    def test_priority_then_schedule_order(self) -> None:
+        enqueue("tests.record", {"label": "low"})
+        enqueue("tests.record", {"label": "high"}, priority=5)
+        enqueue("tests.record", {"label": "later"}, delay=timedelta(hours=1))
+
+        counts = Worker().run()
+        self.assertEqual(counts["succeeded"], 2)
+        self.assertEqual([label for label, _ in calls], ["high", "low"])
+        self.assertEqual(Job.objects.filter(status="queued").get().kwargs, {"label": "later"})
+
+    def test_failures_retry_with_backoff_then_fail(self) -> None:
+        enqueue("tests.explode")
+        with self.assertLogs("jobs.worker", "WARNING"):
+            self.assertEqual(Worker().run()["retry"], 1)
+        queued = Job.objects.get()
+        self.assertEqual((queued.status, queued.attempts), ("queued", 1))
+        self.assertGreater(queued.run_at, timezone.now())
+        self.assertIn("boom", queued.last_error)
+
+        Job.objects.update(run_at=timezone.now())
+        with self.assertLogs("jobs.worker", "WARNING"):
+            self.assertEqual(Worker().run()["failed"], 1)
+        self.assertEqual(Job.objects.get().status, "failed")
+
+    def test_unique_key_coalesces_queued_jobs(self) -> None:
+        enqueue("tests.record", unique_key="sync")
+        enqueue("tests.record", unique_key="sync")
+        self.assertEqual(Job.objects.count(), 1)
+
+        claim_jobs("worker-a", 1)
+        enqueue("tests.record", unique_key="sync")
+        self.assertEqual(Job.objects.filter(status="queued").count(), 1)
+
+    def test_claimed_jobs_are_not_claimed_twice_until_lease_expires(self) -> None:
+        enqueue("tests.record")
+        self.assertEqual(len(claim_jobs("worker-a", 5)), 1)
+        self.assertEqual(claim_jobs("worker-b", 5), [])
+
+        Job.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        [reclaimed] = claim_jobs("worker-b", 5)
+        self.assertEqual((reclaimed.locked_by, reclaimed.attempts), ("worker-b", 2))
+
+    def test_expired_run_does_not_overwrite_the_reclaimed_one(self) -> None:
+        enqueue("tests.record")
+        [stale] = claim_jobs("worker-a", 1)
+        Job.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        claim_jobs("worker-b", 1)
+
+        run_job(stale)
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.locked_by), ("running", "worker-b"))
+
+    def test_retry_while_a_job_with_the_same_key_is_queued(self) -> None:
+        enqueue("tests.explode", unique_key="sync")
+        [running] = claim_jobs("worker-a", 1)
+        enqueue("tests.explode", unique_key="sync")
+
+        with self.assertLogs("jobs.worker", "WARNING"):
+            self.assertEqual(run_job(running), "retry")
+        self.assertEqual(Job.objects.filter(status="queued").count(), 2)
+
+    def test_stats_and_runworker(self) -> None:
+        enqueue("tests.record", queue="reports")
+        enqueue("tests.record", queue="reports", delay=timedelta(minutes=5))
+        stats = queue_stats()["reports"]
+        self.assertEqual((stats["queued"], stats["scheduled"]), (1, 1))
+
+        out = io.StringIO()
+        call_command("runworker", queues=["reports"], stdout=out)
+        self.assertIn("succeeded=1", out.getvalue())
+        self.assertEqual(queue_stats()["reports"]["succeeded_recently"], 1)
+
+    def test_outbox_delivery_is_queued(self) -> None:
+        enqueue_email("Hola", "Cuerpo", ["cliente@example.com"])
+        enqueue_email("Otra", "Cuerpo", ["cliente@example.com"])
+        self.assertEqual(Job.objects.filter(name=OUTBOX_JOB, status="queued").count(), 1)
+
+        Worker(queues=["email"]).run()
+        self.assertEqual(len(mail.outbox), 2)
+
+
+# Shared-cache in-memory SQLite raises "table is locked" on concurrent writes
+# instead of waiting for the busy timeout like a database file does.
+@unittest.skipIf(connection.vendor == "sqlite" and connection.is_in_memory_db(), "needs a real database")
+class ThreadedWorkerTests(TransactionTestCase):
+    def test_each_job_runs_once_across_threads(self) -> None:
+        calls.clear()
+        for value in range(30):
+            enqueue("tests.record", {"value": value})
+
+        counts = Worker(threads=4).run()
+        self.assertEqual(counts["succeeded"], 30)
+        self.assertEqual(sorted(value for _, value in calls), list(range(30)))
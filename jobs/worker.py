@@ -0,0 +1,220 @@
+"""Claiming and running jobs (``manage.py runworker``).
+
+Workers claim due jobs by flipping them to "running" with a lease. On
+PostgreSQL the candidates are locked with ``SELECT ... FOR UPDATE SKIP
+LOCKED``, so concurrent workers never wait on or double-claim a row. SQLite
+has no row locks: each candidate is claimed with a conditional UPDATE that
+only matches while the job is still due, and a row another worker took
+first is skipped. Jobs whose worker died are claimed again when the lease
+runs out.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import socket
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Min, Q
+from django.utils import timezone
+
+from .models import Job
+from .registry import get_job
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = 600
+BACKOFF_SECONDS = 10
+MAX_BACKOFF_SECONDS = 3600
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+def _due(now) -> Q:
+    return Q(status="queued", run_at__lte=now) | Q(status="running", locked_until__lte=now)
+
+
+def claim_jobs(worker_id: str, limit: int, queues: list[str] | None = None) -> list[Job]:
+    """Reserve up to ``limit`` due jobs for ``worker_id``."""
+
+    if limit <= 0:
+        return []
+    now = timezone.now()
+    candidates = Job.objects.filter(_due(now)).order_by("-priority", "run_at", "id")
+    if queues:
+        candidates = candidates.filter(queue__in=queues)
+    claim = {
+        "status": "running",
+        "locked_by": worker_id,
+        "locked_until": now + timedelta(seconds=LEASE_SECONDS),
+        "attempts": F("attempts") + 1,
+        "started_at": now,
+        # The key only coalesces queued jobs; releasing it lets this run be
+        # requeued (retry) while a newer job with the same key is waiting.
+        "unique_key": None,
+    }
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            jobs = list(candidates.select_for_update(skip_locked=True)[:limit])
+            Job.objects.filter(pk__in=[job.pk for job in jobs]).update(**claim)
+    else:
+        jobs = []
+        for job in candidates[: limit * 2]:
+            if Job.objects.filter(_due(now), pk=job.pk).update(**claim):
+                jobs.append(job)
+                if len(jobs) == limit:
+                    break
+    for job in jobs:
+        job.attempts += 1
+        job.status, job.locked_by, job.started_at, job.unique_key = "running", worker_id, now, None
+    return jobs
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * 2 ** (attempts - 1)))
+
+
+def run_job(job: Job) -> str:
+    """Run one claimed job and record the outcome ("succeeded", "retry" or "failed")."""
+
+    spec = get_job(job.name)
+    # Only while this run still holds the lease: after it expired, another
+    # worker may have reclaimed the job and owns its outcome.
+    mine = Job.objects.filter(pk=job.pk, locked_by=job.locked_by)
+    try:
+        if spec is None:
+            raise LookupError(f"Unknown job {job.name!r}")
+        if job.attempts > job.max_attempts:
+            # Only reachable by reclaiming expired leases: the job keeps
+            # taking its worker down (or outlives LEASE_SECONDS).
+            raise RuntimeError(f"Lease expired on all {job.max_attempts} attempts")
+        spec.func(**job.kwargs)
+    except Exception as exc:  # noqa: BLE001 - recorded on the row and retried
+        logger.warning("Job %s (%s) failed on attempt %s", job.pk, job.name, job.attempts, exc_info=True)
+        finished = {"last_error": repr(exc)[:2000], "locked_by": "", "locked_until": None}
+        if spec is not None and job.attempts < job.max_attempts:
+            mine.update(
+                status="queued", run_at=timezone.now() + _retry_delay(job.attempts), **finished
+            )
+            return "retry"
+        mine.update(status="failed", finished_at=timezone.now(), **finished)
+        return "failed"
+
+    mine.update(
+        status="succeeded", finished_at=timezone.now(), last_error="", locked_by="", locked_until=None
+    )
+    return "succeeded"
+
+
+class Worker:
+    """Claim and run jobs on ``threads`` threads (inline when 1)."""
+
+    def __init__(
+        self, *, queues: list[str] | None = None, threads: int = 1, worker_id: str | None = None
+    ) -> None:
+        self.queues = queues
+        self.threads = max(1, threads)
+        self.worker_id = worker_id or default_worker_id()
+        self.counts = {"succeeded": 0, "retry": 0, "failed": 0}
+        self.stopping = False
+
+    def _record(self, outcome: str) -> None:
+        self.counts[outcome] += 1
+
+    def run(self, *, loop: bool = False, sleep: float = 1.0) -> dict[str, int]:
+        """Run due jobs; return when none are due (or on ``stop()`` with ``loop``)."""
+
+        if self.threads == 1:
+            while not self.stopping:
+                jobs = claim_jobs(self.worker_id, 1, self.queues)
+                if jobs:
+                    self._record(run_job(jobs[0]))
+                elif loop:
+                    time.sleep(sleep)
+                else:
+                    break
+            return self.counts
+
+        with ThreadPoolExecutor(self.threads, thread_name_prefix="altiq-job") as pool:
+            running = set()
+            while not self.stopping:
+                jobs = claim_jobs(self.worker_id, self.threads - len(running), self.queues)
+                running |= {pool.submit(self._run_in_thread, job) for job in jobs}
+                if not running:
+                    if not loop:
+                        break
+                    time.sleep(sleep)
+                    continue
+                done, running = wait(running, timeout=sleep, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._record(future.result())
+            for future in running:
+                self._record(future.result())
+        return self.counts
+
+    def _run_in_thread(self, job: Job) -> str:
+        close_old_connections()
+        try:
+            return run_job(job)
+        finally:
+            close_old_connections()
+
+    def stop(self) -> None:
+        self.stopping = True
+
+
+def queue_stats(window: timedelta = timedelta(hours=1)) -> dict[str, dict]:
+    """Depth, age of the oldest due job and recent latency per queue."""
+
+    now = timezone.now()
+    stats: dict[str, dict] = {}
+    rows = Job.objects.filter(status__in=("queued", "running", "failed")).values("queue", "status")
+    for row in rows.annotate(
+        count=Count("id"),
+        due=Count("id", filter=Q(run_at__lte=now)),
+        oldest_due=Min("run_at", filter=Q(run_at__lte=now)),
+    ).order_by():
+        queue = stats.setdefault(row["queue"], _empty_stats())
+        if row["status"] == "queued":
+            queue["queued"] = row["due"]
+            queue["scheduled"] = row["count"] - row["due"]
+            if row["oldest_due"] is not None:
+                queue["oldest_due_seconds"] = round((now - row["oldest_due"]).total_seconds(), 1)
+        else:
+            queue[row["status"]] = row["count"]
+
+    recent = Job.objects.filter(status="succeeded", finished_at__gte=now - window).values("queue")
+    for row in recent.annotate(
+        succeeded=Count("id"),
+        wait=Avg(_duration("run_at", "started_at")),
+        run=Avg(_duration("started_at", "finished_at")),
+    ).order_by():
+        queue = stats.setdefault(row["queue"], _empty_stats())
+        queue["succeeded_recently"] = row["succeeded"]
+        queue["avg_wait_ms"] = round(row["wait"].total_seconds() * 1000, 1) if row["wait"] else 0.0
+        queue["avg_run_ms"] = round(row["run"].total_seconds() * 1000, 1) if row["run"] else 0.0
+    return stats
+
+
+def _duration(start: str, end: str) -> ExpressionWrapper:
+    return ExpressionWrapper(F(end) - F(start), output_field=DurationField())
+
+
+def _empty_stats() -> dict:
+    return {
+        "queued": 0,
+        "scheduled": 0,
+        "running": 0,
+        "failed": 0,
+        "oldest_due_seconds": 0.0,
+        "succeeded_recently": 0,
+        "avg_wait_ms": 0.0,
+        "avg_run_ms": 0.0,
+    }
@@ -3,7 +3,10 @@ from __future__ import annotations
 from django.http import HttpRequest, HttpResponse
 from django.shortcuts import render
 
+from core.page_cache import cache_public_page
 
+
+@cache_public_page()
 def article_list(request: HttpRequest) -> HttpResponse:
     """Simple public listing of newsletter / article content.
 
@@ -2,12 +2,23 @@ from __future__ import annotations
 
 from django.contrib import admin
 
-from .models import Order
+from core.admin_tools import CachedValuesFilter, ScalableAdmin
+from .models import EmailOutbox, Order
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(ScalableAdmin):
     list_display = ("id", "package", "customer_name", "status", "amount", "currency", "created_at")
-    list_filter = ("status", "currency", "created_at")
+    list_filter = ("status", ("currency", CachedValuesFilter), "created_at")
+    list_select_related = ("package",)
     search_fields = ("customer_name", "company_name", "email")
+    prefix_search_fields = ("customer_name", "company_name")
+    export_name = "orders"
 
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ("id", "subject", "status", "attempts", "next_attempt_at", "sent_at", "created_at")
+    list_filter = ("status", "created_at")
+    search_fields = ("subject", "dedupe_key")
+    raw_id_fields = ("order",)
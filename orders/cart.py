@@ -0,0 +1,152 @@
+"""Multi-item cart kept in a signed cookie.
+
+Browsing and editing the cart never touches the database: the cookie only
+holds ``{"package:<slug>": qty, "service:<slug>": qty}`` and prices/names are
+resolved from the in-process catalog snapshot. The ``Order`` and its
+``OrderItem`` rows are only written at checkout (see ``materialize_order``).
+"""
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.db import transaction
+
+from services.catalog import CatalogItem, get_catalog
+from .models import Order, OrderItem
+
+CART_COOKIE = "altiq_cart"
+CART_SALT = "orders.cart"
+CART_MAX_AGE = 14 * 24 * 3600
+CART_KINDS = ("package", "service")
+# Bounds keep the cookie well under the 4 KB browser limit.
+MAX_LINES = 20
+MAX_QUANTITY = 10
+
+
+@dataclass(frozen=True)
+class CartLine:
+    kind: str
+    item: CatalogItem
+    quantity: int
+
+    @property
+    def subtotal(self) -> Decimal:
+        return self.item.price_mxn * self.quantity
+
+
+class Cart:
+    def __init__(self, quantities: dict[str, int] | None = None) -> None:
+        self.quantities: dict[str, int] = dict(quantities or {})
+        self.modified = False
+
+    @classmethod
+    def from_request(cls, request) -> "Cart":
+        raw = request.get_signed_cookie(CART_COOKIE, default=None, salt=CART_SALT, max_age=CART_MAX_AGE)
+        if not raw:
+            return cls()
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            return cls()
+        if not isinstance(data, dict):
+            return cls()
+        return cls(
+            {
+                key: value
+                for key, value in data.items()
+                if isinstance(key, str) and isinstance(value, int) and 0 < value <= MAX_QUANTITY
+            }
+        )
+
+    @staticmethod
+    def _key(kind: str, slug: str) -> str:
+        if kind not in CART_KINDS:
+            raise ValueError(f"Unknown cart item kind {kind!r}")
+        return f"{kind}:{slug}"
+
+    def set_quantity(self, kind: str, slug: str, quantity: int) -> bool:
+        """Set a line's quantity (0 removes it); returns False if not allowed."""
+
+        key = self._key(kind, slug)
+        if quantity <= 0:
+            self.modified = self.quantities.pop(key, None) is not None or self.modified
+            return True
+        if get_catalog().find(kind, slug) is None:
+            return False
+        if key not in self.quantities and len(self.quantities) >= MAX_LINES:
+            return False
+        self.quantities[key] = min(quantity, MAX_QUANTITY)
+        self.modified = True
+        return True
+
+    def add(self, kind: str, slug: str, quantity: int = 1) -> bool:
+        return self.set_quantity(kind, slug, self.quantities.get(self._key(kind, slug), 0) + quantity)
+
+    def clear(self) -> None:
+        self.modified = bool(self.quantities) or self.modified
+        self.quantities = {}
+
+    def lines(self) -> list[CartLine]:
+        """Resolve the cart against the active catalog, dropping stale items."""
+
+        catalog = get_catalog()
+        lines = []
+        for key, quantity in self.quantities.items():
+            kind, _, slug = key.partition(":")
+            item = catalog.find(kind, slug)
+            if item is not None:
+                lines.append(CartLine(kind, item, quantity))
+        return lines
+
+    @property
+    def count(self) -> int:
+        return sum(self.quantities.values())
+
+    def save(self, response) -> None:
+        """Persist the cart on ``response`` if it changed."""
+
+        if not self.modified:
+            return
+        if self.quantities:
+            response.set_signed_cookie(
+                CART_COOKIE,
+                json.dumps(self.quantities, separators=(",", ":")),
+                salt=CART_SALT,
+                max_age=CART_MAX_AGE,
+                httponly=True,
+                samesite="Lax",
+            )
+        else:
+            response.delete_cookie(CART_COOKIE, samesite="Lax")
+
+
+def materialize_order(lines: list[CartLine], **order_fields) -> tuple[Order, list[OrderItem]]:
+    """Create the ``Order`` and all of its ``OrderItem`` rows.
+
+    One INSERT for the order and one ``bulk_create`` for the items, in a
+    single transaction.
+    """
+
+    first_package = next((line.item for line in lines if line.kind == "package"), None)
+    with transaction.atomic():
+        order = Order.objects.create(
+            package_id=first_package.id if first_package else None,
+            amount=sum((line.subtotal for line in lines), Decimal("0")),
+            **order_fields,
+        )
+        items = OrderItem.objects.bulk_create(
+            [
+                OrderItem(
+                    order=order,
+                    package_id=line.item.id if line.kind == "package" else None,
+                    service_id=line.item.id if line.kind == "service" else None,
+                    name=line.item.name_es,
+                    quantity=line.quantity,
+                    unit_price=line.item.price_mxn,
+                )
+                for line in lines
+            ]
+        )
+    return order, items
@@ -0,0 +1,76 @@
+"""Human-friendly, collision-free access codes per (order, package).
+
+Codes are not random: the pair ``(order_id, package_id)`` is packed into a
+60-bit integer, scrambled with a keyed 4-round Feistel permutation (derived
+from ``SECRET_KEY``) and spelled in Crockford base32, e.g. ``7KQ2-M9XD-4H0T``.
+A permutation is a bijection, so two pairs can never share a code and there is
+nothing to check before inserting; the existing ``unique_together`` on
+``OrderCode`` makes re-generation for the same order a no-op.
+"""
+from __future__ import annotations
+
+import hashlib
+from functools import lru_cache
+
+from django.conf import settings
+
+from .models import Order, OrderCode
+
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"  # Crockford base32: no I, L, O, U
+PACKAGE_BITS = 20
+ORDER_BITS = 40
+HALF_BITS = (PACKAGE_BITS + ORDER_BITS) // 2
+HALF_MASK = (1 << HALF_BITS) - 1
+ROUNDS = 4
+CODE_LENGTH = (PACKAGE_BITS + ORDER_BITS) // 5
+
+
+@lru_cache(maxsize=4)
+def _round_key(secret: str) -> bytes:
+    return hashlib.sha256(f"altiq-order-codes:{secret}".encode()).digest()
+
+
+def _round(key: bytes, round_no: int, half: int) -> int:
+    digest = hashlib.blake2b(bytes([round_no]) + half.to_bytes(4, "big"), key=key, digest_size=4).digest()
+    return int.from_bytes(digest, "big") & HALF_MASK
+
+
+def generate_code(order_id: int, package_id: int) -> str:
+    """Return the code for ``(order_id, package_id)``; unique for every pair."""
+
+    if not 0 < order_id < (1 << ORDER_BITS) or not 0 < package_id < (1 << PACKAGE_BITS):
+        raise ValueError("order_id/package_id out of range for code generation")
+
+    key = _round_key(settings.SECRET_KEY)
+    value = (order_id << PACKAGE_BITS) | package_id
+    left, right = value >> HALF_BITS, value & HALF_MASK
+    for round_no in range(ROUNDS):
+        left, right = right, left ^ _round(key, round_no, right)
+    value = (left << HALF_BITS) | right
+
+    chars = []
+    for _ in range(CODE_LENGTH):
+        value, index = divmod(value, 32)
+        chars.append(ALPHABET[index])
+    code = "".join(reversed(chars))
+    return "-".join(code[i:i + 4] for i in range(0, CODE_LENGTH, 4))
+
+
+def create_order_codes(order: Order) -> list[OrderCode]:
+    """Create the codes for every package in ``order`` with one INSERT.
+
+    Individual services in cart orders have no codes.
+
+    Safe to call repeatedly: existing ``(order, package)`` rows are skipped
+    by the database. Returns all codes of the order, packages included.
+    """
+
+    package_ids = {order.package_id, *order.items.values_list("package_id", flat=True)} - {None}
+    OrderCode.objects.bulk_create(
+        [
+            OrderCode(order_id=order.pk, package_id=package_id, code=generate_code(order.pk, package_id))
+            for package_id in sorted(package_ids)
+        ],
+        ignore_conflicts=True,
+    )
+    return list(order.codes.select_related("package"))
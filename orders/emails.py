@@ -1,23 +1,138 @@
 from __future__ import annotations
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
+
+from datetime import timedelta
+
 from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.template.loader import render_to_string
+from django.utils import timezone
 
+from jobs.registry import enqueue
+from .codes import create_order_codes
+from .models import EmailOutbox, Order
 
-def send_order_confirmation(order):
-    """Send order confirmation email to customer."""
-    subject = f"AltIQ - Confirmación de pedido #{order.id}"
-    message = render_to_string("emails/order_thank_you.txt", {"order": order})
-    send_mail(
-        subject,
-        message,
-        settings.DEFAULT_FROM_EMAIL if hasattr(settings, 'DEFAULT_FROM_EMAIL') else 'noreply@altiq.mx',
-        [order.email],
-        fail_silently=True,
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_BACKOFF_SECONDS = 60
+OUTBOX_MAX_BACKOFF_SECONDS = 3600
+# How long a claimed batch stays reserved for the worker that claimed it.
+OUTBOX_LEASE_SECONDS = 300
+# Job (orders/jobs.py) that delivers the outbox under ``manage.py runworker``.
+OUTBOX_JOB = "orders.deliver_outbox"
+
+
+def enqueue_email(subject, body, to, *, order=None, dedupe_key=None, from_email=None) -> None:
+    """Add a rendered email to the outbox (ignored if ``dedupe_key`` exists) and queue its delivery."""
+    EmailOutbox.objects.bulk_create(
+        [
+            EmailOutbox(
+                subject=subject,
+                body=body,
+                to=list(to),
+                from_email=from_email
+                or (settings.DEFAULT_FROM_EMAIL if hasattr(settings, 'DEFAULT_FROM_EMAIL') else 'noreply@altiq.mx'),
+                order=order,
+                dedupe_key=dedupe_key,
+            )
+        ],
+        ignore_conflicts=True,
     )
+    enqueue(OUTBOX_JOB, unique_key=OUTBOX_JOB)
+
+
+def send_order_confirmation(order, codes=()):
+    """Queue the order confirmation email for the customer."""
+    subject = f"AltIQ - Confirmación de pedido #{order.id}"
+    message = render_to_string("emails/order_thank_you.txt", {"order": order, "codes": codes})
+    enqueue_email(subject, message, [order.email], order=order, dedupe_key=f"order-confirmation:{order.id}")
 
 
 def send_order_thank_you_email_with_codes(order):
-    """Send order confirmation with service codes."""
-    send_order_confirmation(order)
+    """Queue the order confirmation with service codes, at most once per order.
+
+    Webhook events can be delivered or replayed more than once, so the
+    ``thank_you_email_sent`` flag is claimed with a conditional UPDATE first.
+    """
+    claimed = Order.objects.filter(pk=order.pk, thank_you_email_sent=False).update(thank_you_email_sent=True)
+    if not claimed:
+        return
+    order.thank_you_email_sent = True
+    send_order_confirmation(order, create_order_codes(order))
+
+
+# ---------------------------------------------------------------------------
+# Outbox delivery
+# ---------------------------------------------------------------------------
+
+
+def claim_outbox_batch(batch_size: int = 50) -> list[EmailOutbox]:
+    """Reserve up to ``batch_size`` due emails for this worker.
+
+    Rows stuck in "sending" past their lease (crashed worker) are reclaimed.
+    On Postgres concurrent workers skip each other's rows via ``SKIP LOCKED``;
+    SQLite has no row locks, so run a single sender there.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        queryset = EmailOutbox.objects.filter(
+            Q(status="pending") | Q(status="sending"), next_attempt_at__lte=now
+        ).order_by("next_attempt_at", "id")
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        emails = list(queryset[:batch_size])
+        if emails:
+            EmailOutbox.objects.filter(pk__in=[email.pk for email in emails]).update(
+                status="sending",
+                attempts=F("attempts") + 1,
+                next_attempt_at=now + timedelta(seconds=OUTBOX_LEASE_SECONDS),
+            )
+    return emails
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(OUTBOX_MAX_BACKOFF_SECONDS, OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1)))
+
+
+def _record_failure(email: EmailOutbox, exc: Exception, counts: dict[str, int]) -> None:
+    attempts = email.attempts + 1  # the claim already incremented the row
+    if attempts >= OUTBOX_MAX_ATTEMPTS:
+        EmailOutbox.objects.filter(pk=email.pk).update(status="failed", last_error=repr(exc)[:2000])
+        counts["failed"] += 1
+    else:
+        EmailOutbox.objects.filter(pk=email.pk).update(
+            status="pending",
+            last_error=repr(exc)[:2000],
+            next_attempt_at=timezone.now() + _retry_delay(attempts),
+        )
+        counts["retry"] += 1
+
+
+def deliver_outbox_batch(batch_size: int = 50) -> dict[str, int]:
+    """Send one batch of due emails over a single SMTP connection."""
+    emails = claim_outbox_batch(batch_size)
+    counts = {"sent": 0, "retry": 0, "failed": 0}
+    if not emails:
+        return counts
+
+    mail_connection = get_connection(fail_silently=False)
+    try:
+        mail_connection.open()
+    except Exception as exc:  # noqa: BLE001 - SMTP down: back off the whole batch
+        for email in emails:
+            _record_failure(email, exc, counts)
+        return counts
 
+    try:
+        for email in emails:
+            message = EmailMessage(email.subject, email.body, email.from_email, email.to, connection=mail_connection)
+            try:
+                mail_connection.send_messages([message])
+            except Exception as exc:  # noqa: BLE001 - recorded on the row and retried
+                _record_failure(email, exc, counts)
+            else:
+                EmailOutbox.objects.filter(pk=email.pk).update(status="sent", last_error="", sent_at=timezone.now())
+                counts["sent"] += 1
+    finally:
+        mail_connection.close()
+    return counts
@@ -0,0 +1,20 @@
+from __future__ import annotations
+
+from django.db.models import Min
+
+from jobs.registry import enqueue, job
+from .emails import OUTBOX_JOB, deliver_outbox_batch
+from .models import EmailOutbox
+
+
+@job(OUTBOX_JOB, queue="email", priority=10)
+def deliver_outbox(batch_size: int = 50) -> None:
+    """Send every due outbox email, then schedule the next retry, if any."""
+
+    while any(deliver_outbox_batch(batch_size).values()):
+        pass
+    next_retry = EmailOutbox.objects.filter(status__in=("pending", "sending")).aggregate(
+        at=Min("next_attempt_at")
+    )["at"]
+    if next_retry is not None:
+        enqueue(OUTBOX_JOB, run_at=next_retry, unique_key=OUTBOX_JOB)
@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import asyncio
+import importlib
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.test import Client, override_settings
+from django.urls import clear_url_caches, reverse
+
+from core.benchmark import ASGIClient, WSGIClient, post_form, unique_id
+from orders.models import Order
+from payments.simulator import GatewaySimulator, SimulatorConfig
+from services.models import ServicePackage
+
+BENCHMARK_USERNAME = "benchmark-checkout"
+
+
+@contextmanager
+def checkout_view(is_async: bool):
+    """Route /checkout/<slug>/ as ``ALTIQ_ASYNC_CHECKOUT=is_async`` would."""
+
+    def reroute() -> None:
+        importlib.reload(importlib.import_module("orders.urls"))
+        importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+        clear_url_caches()
+
+    with override_settings(ALTIQ_ASYNC_CHECKOUT=is_async):
+        reroute()
+        try:
+            yield
+        finally:
+            reroute()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare sync and async checkout throughput against a local gateway stub with a fixed "
+        "latency. Both runs POST the checkout form through the full middleware stack: the sync "
+        "view through the WSGI handler on a fixed pool of threads, like gunicorn sync workers, "
+        "and the async view through the ASGI handler with every checkout in flight on one event "
+        "loop. Orders are written (removed afterwards), so prefer a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=400, help="Checkouts per run.")
+        parser.add_argument("--latency", type=float, default=0.2, help="Stub gateway latency in seconds.")
+        parser.add_argument("--workers", type=int, default=8, help="Threads for the sync run.")
+        parser.add_argument("--concurrency", type=int, default=200, help="Max in-flight checkouts for the async run.")
+        parser.add_argument("--gateway", choices=["paypal", "coinbase"], default="paypal")
+
+    def handle(self, *args, **options):
+        package = ServicePackage.objects.filter(is_active=True).order_by("display_order").first()
+        if package is None:
+            raise CommandError("No active service package to check out.")
+        path = reverse("orders:checkout", kwargs={"package_slug": package.slug})
+
+        user, _ = get_user_model().objects.get_or_create(
+            username=BENCHMARK_USERNAME, defaults={"email": "benchmark@example.com"}
+        )
+        browser = Client()
+        browser.force_login(user)
+        session = browser.cookies[settings.SESSION_COOKIE_NAME].value
+
+        def fields(client: WSGIClient) -> dict:
+            return {
+                "csrfmiddlewaretoken": client.cookies.get(settings.CSRF_COOKIE_NAME, ""),
+                "customer_name": "Benchmark",
+                "email": "benchmark@example.com",
+                "payment_method": options["gateway"],
+                "idempotency_key": unique_id(),
+            }
+
+        checkout = post_form(path, fields)
+
+        try:
+            with GatewaySimulator(SimulatorConfig(latency=options["latency"])) as stub:
+                overrides = {
+                    "PAYPAL_API_BASE": stub.base_url,
+                    "PAYPAL_CLIENT_ID": "benchmark",
+                    "PAYPAL_CLIENT_SECRET": "benchmark",
+                    "COINBASE_API_BASE": stub.base_url,
+                    "COINBASE_COMMERCE_API_KEY": "benchmark",
+                    # Let every benchmark call through the gateway bulkhead.
+                    "GATEWAY_MAX_CONCURRENT": str(max(options["workers"], options["concurrency"])),
+                    "GATEWAY_BULKHEAD": "local",
+                }
+                previous = {name: os.environ.get(name) for name in overrides}
+                os.environ.update(overrides)
+                try:
+                    with checkout_view(is_async=False):
+                        sync_stats = self._run_sync(
+                            get_wsgi_application(), path, session, checkout, options["requests"], options["workers"]
+                        )
+                    with checkout_view(is_async=True):
+                        async_stats = asyncio.run(self._run_async(
+                            get_asgi_application(), path, session, checkout, options["requests"], options["concurrency"]
+                        ))
+                finally:
+                    for name, value in previous.items():
+                        if value is None:
+                            os.environ.pop(name, None)
+                        else:
+                            os.environ[name] = value
+        finally:
+            Order.objects.filter(user=user).delete()
+            user.delete()
+
+        self._report(f"sync  ({options['workers']} workers)", sync_stats)
+        self._report(f"async ({options['concurrency']} in flight)", async_stats)
+        self.stdout.write(f"speedup: {async_stats[0] / sync_stats[0]:.1f}x")
+
+    @staticmethod
+    def _shares(requests: int, clients: int) -> list[int]:
+        return [requests // clients + (1 if i < requests % clients else 0) for i in range(clients)]
+
+    def _run_sync(self, app, path: str, session: str, checkout, requests: int, workers: int):
+        def client_main(count: int) -> list[tuple[float, int]]:
+            client = WSGIClient(app)
+            client.cookies[settings.SESSION_COOKIE_NAME] = session
+            samples = []
+            try:
+                # Rendering the form sets the CSRF cookie.
+                client.request("GET", path)
+                for _ in range(count):
+                    method, _path, body, headers = checkout(client)
+                    started = time.perf_counter()
+                    status, _headers, _content = client.request(method, path, body, headers)
+                    samples.append((time.perf_counter() - started, status))
+            finally:
+                connections.close_all()
+            return samples
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            samples = [s for batch in pool.map(client_main, self._shares(requests, workers)) for s in batch]
+        return self._stats(samples, time.perf_counter() - started)
+
+    async def _run_async(self, app, path: str, session: str, checkout, requests: int, concurrency: int):
+        async def client_main(count: int) -> list[tuple[float, int]]:
+            client = ASGIClient(app)
+            client.cookies[settings.SESSION_COOKIE_NAME] = session
+            await client.request("GET", path)
+            samples = []
+            for _ in range(count):
+                method, _path, body, headers = checkout(client)
+                started = time.perf_counter()
+                status, _headers, _content = await client.request(method, path, body, headers)
+                samples.append((time.perf_counter() - started, status))
+            return samples
+
+        started = time.perf_counter()
+        batches = await asyncio.gather(*(client_main(count) for count in self._shares(requests, concurrency)))
+        return self._stats([s for batch in batches for s in batch], time.perf_counter() - started)
+
+    @staticmethod
+    def _stats(samples: list[tuple[float, int]], elapsed: float):
+        # A successful checkout redirects to the gateway's approval page.
+        failed = sum(1 for _latency, status in samples if status != 302)
+        return len(samples) / elapsed, [latency for latency, _status in samples], failed
+
+    def _report(self, label: str, stats) -> None:
+        throughput, latencies, failed = stats
+        quantiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f"{label}: {throughput:,.1f} checkouts/s, "
+            f"p50={quantiles[49] * 1000:.0f}ms p95={quantiles[94] * 1000:.0f}ms  errors={failed}"
+        )
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from orders.codes import generate_code
+from orders.models import Order, OrderCode
+from services.models import ServicePackage
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate order codes in memory to measure throughput and confirm there are no "
+        "collisions (hence no retries), then time bulk inserts inside a rolled-back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=1_000_000, help="Codes to generate in memory.")
+        parser.add_argument("--packages", type=int, default=3, help="Packages per order.")
+        parser.add_argument("--db-orders", type=int, default=10_000, help="Orders to insert codes for (0 to skip).")
+
+    def handle(self, *args, **options):
+        packages = options["packages"]
+        count = options["count"]
+
+        seen: set[str] = set()
+        collisions = 0
+        started = time.perf_counter()
+        for i in range(count):
+            code = generate_code(i // packages + 1, i % packages + 1)
+            if code in seen:
+                collisions += 1
+            seen.add(code)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"generated {count} codes in {elapsed:.2f}s ({count / elapsed:,.0f}/s); "
+            f"collisions={collisions}, retries needed={collisions}"
+        )
+
+        if options["db_orders"]:
+            try:
+                with transaction.atomic():
+                    self._benchmark_db(options["db_orders"], packages)
+                    raise _Rollback
+            except _Rollback:
+                pass
+
+    def _benchmark_db(self, order_count: int, package_count: int) -> None:
+        package_objs = [
+            ServicePackage.objects.create(
+                slug=f"benchmark-codes-{i}", name_es=f"Benchmark {i}", short_description_es="", price_mxn=Decimal("1")
+            )
+            for i in range(package_count)
+        ]
+        orders = Order.objects.bulk_create(
+            [
+                Order(package=package_objs[0], customer_name="Benchmark", email="benchmark@example.com", amount=1)
+                for _ in range(order_count)
+            ]
+        )
+
+        started = time.perf_counter()
+        for order in orders:
+            # One INSERT per order, as in fulfilment.
+            OrderCode.objects.bulk_create(
+                [OrderCode(order=order, package=p, code=generate_code(order.pk, p.pk)) for p in package_objs],
+                ignore_conflicts=True,
+            )
+        elapsed = time.perf_counter() - started
+        total = order_count * package_count
+        self.stdout.write(
+            f"inserted {total} codes for {order_count} orders in {elapsed:.2f}s "
+            f"({order_count / elapsed:,.0f} orders/s)"
+        )
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.emails import deliver_outbox_batch
+
+
+class Command(BaseCommand):
+    help = "Deliver queued transactional emails from the outbox in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument(
+            "--loop", action="store_true", help="Keep polling for due emails instead of exiting when drained."
+        )
+        parser.add_argument("--sleep", type=float, default=5.0, help="Seconds to wait between polls with --loop.")
+
+    def handle(self, *args, **options):
+        totals = {"sent": 0, "retry": 0, "failed": 0}
+        while True:
+            counts = deliver_outbox_batch(options["batch_size"])
+            for outcome, count in counts.items():
+                totals[outcome] += count
+            if any(counts.values()):
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["sleep"])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Outbox: sent={totals['sent']}, retry={totals['retry']}, failed={totals['failed']}"
+        ))
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.26 on 2026-10-18 07:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0004_sync_default_catalog'),
+        ('orders', '0004_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='name',
+            field=models.CharField(blank=True, max_length=120),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='service',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='order_items', to='services.individualservice'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='package',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='orders', to='services.servicepackage'),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='package',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='order_items', to='services.servicepackage'),
+        ),
+        migrations.AddConstraint(
+            model_name='orderitem',
+            constraint=models.CheckConstraint(check=models.Q(models.Q(('package__isnull', False), ('service__isnull', True)), models.Q(('package__isnull', True), ('service__isnull', False)), _connector='OR'), name='order_item_package_xor_service'),
+        ),
+    ]
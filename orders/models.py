@@ -2,13 +2,17 @@ from __future__ import annotations
 
 from django.conf import settings
 from django.db import models
+from django.db.models.functions import Lower
+from django.utils import timezone
 
-from services.models import ServicePackage
+from services.models import IndividualService, ServicePackage
 
 
 class Order(models.Model):
-    """Represents a purchase intent for a ServicePackage.
+    """Represents a purchase intent for a ServicePackage or a cart of items.
 
+    Single-package checkouts set ``package``; cart checkouts store their lines
+    as ``OrderItem`` rows and set ``package`` to the first package, if any.
     User data is kept minimal for now; later we can connect to an authenticated user
     model or a separate CRM.
     """
@@ -21,7 +25,9 @@ class Order(models.Model):
         ("cancelled", "Cancelled"),
     ]
 
-    package = models.ForeignKey(ServicePackage, on_delete=models.PROTECT, related_name="orders")
+    package = models.ForeignKey(
+        ServicePackage, on_delete=models.PROTECT, null=True, blank=True, related_name="orders"
+    )
 
     # Basic contact / billing fields (Spanish labels handled at form/template level).
     customer_name = models.CharField(max_length=150)
@@ -44,11 +50,26 @@ class Order(models.Model):
         settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="altiq_orders"
     )
 
+    # Random token rendered into each checkout form. A repeated submission of
+    # the same form hits the unique index and is answered from this order
+    # instead of creating another one (see orders.views).
+    idempotency_key = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # checkout_success / admin filters: latest orders in a status.
+            models.Index(fields=["status", "-created_at"], name="order_status_created_idx"),
+            # A customer's order history, newest first.
+            models.Index(fields=["user", "-created_at"], name="order_user_created_idx"),
+            # Admin search (core.admin_tools): exact email, name/company prefixes.
+            models.Index(Lower("email"), name="order_email_lower_idx"),
+            models.Index(Lower("customer_name"), name="order_customer_lower_idx"),
+            models.Index(Lower("company_name"), name="order_company_lower_idx"),
+        ]
 
     def __str__(self) -> str:  # pragma: no cover
         return f"Order #{self.pk} - {self.package} - {self.status}"
@@ -57,11 +78,19 @@ class Order(models.Model):
 class OrderItem(models.Model):
     """Individual line item within an Order.
 
-    This lets a single order contain multiple service packages with quantities.
+    This lets a single order contain multiple service packages and individual
+    services with quantities. Exactly one of ``package`` / ``service`` is set.
     """
 
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items")
-    package = models.ForeignKey(ServicePackage, on_delete=models.PROTECT, related_name="order_items")
+    package = models.ForeignKey(
+        ServicePackage, on_delete=models.PROTECT, null=True, blank=True, related_name="order_items"
+    )
+    service = models.ForeignKey(
+        IndividualService, on_delete=models.PROTECT, null=True, blank=True, related_name="order_items"
+    )
+    # Name at purchase time, so receipts and gateway line items need no join.
+    name = models.CharField(max_length=120, blank=True)
     quantity = models.PositiveIntegerField(default=1)
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
 
@@ -70,9 +99,16 @@ class OrderItem(models.Model):
 
     class Meta:
         ordering = ["id"]
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(package__isnull=False, service__isnull=True)
+                | models.Q(package__isnull=True, service__isnull=False),
+                name="order_item_package_xor_service",
+            ),
+        ]
 
     def __str__(self) -> str:  # pragma: no cover
-        return f"Item x{self.quantity} - {self.package} (order {self.order_id})"
+        return f"Item x{self.quantity} - {self.name or self.package or self.service} (order {self.order_id})"
 
     @property
     def subtotal(self):
@@ -97,3 +133,46 @@ class OrderCode(models.Model):
     def __str__(self) -> str:  # pragma: no cover
         return f"Code {self.code} for {self.package} (order {self.order_id})"
 
+
+class EmailOutbox(models.Model):
+    """Rendered transactional email waiting to be delivered.
+
+    Emails are rendered and inserted in the same transaction as the change
+    that triggers them; ``manage.py send_outbox`` delivers them in batches
+    over a single SMTP connection and retries failures with backoff.
+    """
+
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("sending", "Sending"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+    ]
+
+    # Optional idempotency key, e.g. "order-confirmation:42".
+    dedupe_key = models.CharField(max_length=120, unique=True, null=True, blank=True)
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name="emails")
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    to = models.JSONField(help_text="List of recipient addresses")
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # Earliest time the next delivery attempt may run; while "sending" it is
+    # the lease expiry after which a crashed worker's rows are reclaimed.
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="email_outbox_due_idx"),
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"Email '{self.subject}' to {', '.join(self.to)} - {self.status}"
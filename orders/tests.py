@@ -1,15 +1,23 @@
 from __future__ import annotations
 
+import time
 from unittest import mock
 
-from django.test import TestCase
+from django.core import mail
+from django.conf import settings
+from django.test import AsyncRequestFactory, Client, TestCase
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 
-from services.models import ServicePackage
-from .models import Order
+from services.models import IndividualService, ServicePackage
+from .codes import create_order_codes, generate_code
+from .emails import OUTBOX_MAX_ATTEMPTS, deliver_outbox_batch, send_order_thank_you_email_with_codes
+from .cart import CART_COOKIE
+from .models import EmailOutbox, Order
+from payments.simulator import GatewaySimulator
 from payments.models import Payment
 from payments.utils import PaymentGatewayError
+from .views import checkout_async
 
 
 class CheckoutFlowTests(TestCase):
@@ -91,3 +99,238 @@ class CheckoutFlowTests(TestCase):
         self.assertEqual(order.status, "failed")
         self.assertEqual(payment.status, "failed")
 
+    @mock.patch("orders.views.gateway_available", side_effect=lambda gateway: gateway != "paypal")
+    def test_unavailable_gateway_offers_the_other_one(self, _mock_available):
+        url = reverse("orders:checkout", kwargs={"package_slug": self.package.slug})
+        self.client.login(username="buyer", password="testpass123")
+        payload = {"customer_name": "Test User", "email": "test@example.com", "payment_method": "paypal"}
+
+        response = self.client.post(url, data=payload)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.context["payment_method"], "coinbase")
+        self.assertFalse(Order.objects.exists())
+
+    @mock.patch("orders.views.create_paypal_order")
+    def test_repeated_submission_replays_first_redirect(self, mock_create_paypal):
+        mock_create_paypal.return_value = ("https://paypal.test/approve", "PAYPAL-ID-123")
+        url = reverse("orders:checkout", kwargs={"package_slug": self.package.slug})
+        self.client.login(username="buyer", password="testpass123")
+        key = self.client.get(url).context["idempotency_key"]
+        payload = {"customer_name": "Test User", "email": "test@example.com", "idempotency_key": key}
+
+        first = self.client.post(url, data=payload)
+        second = self.client.post(url, data=payload)
+
+        self.assertEqual(second["Location"], first["Location"])
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Payment.objects.get().approval_url, "https://paypal.test/approve")
+        mock_create_paypal.assert_called_once()
+        self.assertEqual(mock_create_paypal.call_args.kwargs["request_id"], key)
+
+    def test_submission_still_in_progress_gets_a_retrying_page(self):
+        url = reverse("orders:checkout", kwargs={"package_slug": self.package.slug})
+        self.client.login(username="buyer", password="testpass123")
+        order = Order.objects.create(package=self.package, customer_name="Test User", email="test@example.com",
+                                     amount=100, user=self.user, idempotency_key="in-flight")
+        Payment.objects.create(order=order, method="paypal", amount=100, status="created")
+        payload = {"customer_name": "Test User", "email": "test@example.com", "idempotency_key": "in-flight"}
+
+        started = time.monotonic()
+        response = self.client.post(url, data=payload)
+
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response["Retry-After"], "2")
+        self.assertContains(response, 'id="checkout-retry"', status_code=409)
+        self.assertContains(response, '<input type="hidden" name="idempotency_key" value="in-flight">', status_code=409)
+
+
+class AsyncCheckoutTests(TestCase):
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(username="async-buyer", password="testpass123")
+        self.package = ServicePackage.objects.create(
+            slug="async-pilot", name_es="Piloto", short_description_es="", price_mxn=15000, is_active=True
+        )
+        self.stub = GatewaySimulator().__enter__()
+        self.addCleanup(self.stub.__exit__, None, None, None)
+        env = mock.patch.dict(
+            "os.environ",
+            {
+                "PAYPAL_API_BASE": self.stub.base_url,
+                "PAYPAL_CLIENT_ID": "test",
+                "PAYPAL_CLIENT_SECRET": "test",
+                "COINBASE_API_BASE": self.stub.base_url,
+                "COINBASE_COMMERCE_API_KEY": "test",
+            },
+        )
+        env.start()
+        self.addCleanup(env.stop)
+
+    def _post(self, payment_method: str, **extra):
+        request = AsyncRequestFactory().post(
+            f"/checkout/{self.package.slug}/",
+            {"customer_name": "Async User", "email": "async@example.com", "payment_method": payment_method, **extra},
+        )
+        request.user = self.user
+        return request
+
+    async def test_async_checkout_creates_order_and_redirects(self) -> None:
+        for method in ("paypal", "coinbase"):
+            response = await checkout_async(self._post(method), package_slug=self.package.slug)
+            self.assertEqual(response.status_code, 302)
+            self.assertTrue(response["Location"].startswith(self.stub.base_url))
+
+        payments = [p async for p in Payment.objects.select_related("order").order_by("pk")]
+        self.assertEqual([p.method for p in payments], ["paypal", "coinbase"])
+        for payment in payments:
+            self.assertEqual(payment.status, "pending")
+            self.assertTrue(payment.provider_payment_id.startswith("SIM"))
+            self.assertEqual(payment.order.package_id, self.package.pk)
+
+    async def test_async_repeated_submission_skips_gateway(self) -> None:
+        first = await checkout_async(self._post("paypal", idempotency_key="k1"), package_slug=self.package.slug)
+        calls = len(self.stub.received)
+        second = await checkout_async(self._post("paypal", idempotency_key="k1"), package_slug=self.package.slug)
+
+        self.assertEqual(second["Location"], first["Location"])
+        self.assertEqual(len(self.stub.received), calls)
+        self.assertEqual(await Payment.objects.acount(), 1)
+        path, headers = self.stub.received[-1]
+        self.assertEqual(path, "/v2/checkout/orders")
+        self.assertEqual(headers["PayPal-Request-Id"], "k1")
+
+    async def test_async_checkout_gateway_error_sends_to_failure(self) -> None:
+        with mock.patch.dict("os.environ", {"PAYPAL_API_BASE": f"{self.stub.base_url}/missing"}):
+            response = await checkout_async(self._post("paypal"), package_slug=self.package.slug)
+        self.assertEqual(response["Location"], reverse("orders:failure"))
+        payment = await Payment.objects.select_related("order").aget()
+        self.assertEqual(payment.status, "failed")
+        self.assertEqual(payment.order.status, "failed")
+
+
+class EmailOutboxTests(TestCase):
+    def setUp(self) -> None:
+        package = ServicePackage.objects.create(
+            slug="outbox-test", name_es="Paquete outbox", short_description_es="", price_mxn=100
+        )
+        self.order = Order.objects.create(
+            package=package, customer_name="Test User", email="test@example.com", amount=100
+        )
+
+    def test_thank_you_email_is_queued_once_and_delivered(self) -> None:
+        send_order_thank_you_email_with_codes(self.order)
+        send_order_thank_you_email_with_codes(self.order)
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+        self.assertEqual(len(mail.outbox), 0)
+
+        self.assertEqual(deliver_outbox_batch(), {"sent": 1, "retry": 0, "failed": 0})
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["test@example.com"])
+        self.assertIn(self.order.codes.get().code, mail.outbox[0].body)
+        self.assertEqual(EmailOutbox.objects.get().status, "sent")
+
+    def test_failed_delivery_is_retried_later_then_marked_failed(self) -> None:
+        send_order_thank_you_email_with_codes(self.order)
+        with mock.patch(
+            "django.core.mail.backends.locmem.EmailBackend.send_messages", side_effect=OSError("smtp down")
+        ):
+            self.assertEqual(deliver_outbox_batch(), {"sent": 0, "retry": 1, "failed": 0})
+            # Backed off: not due yet.
+            self.assertEqual(deliver_outbox_batch(), {"sent": 0, "retry": 0, "failed": 0})
+
+            EmailOutbox.objects.update(attempts=OUTBOX_MAX_ATTEMPTS - 1, next_attempt_at=self.order.created_at)
+            self.assertEqual(deliver_outbox_batch(), {"sent": 0, "retry": 0, "failed": 1})
+
+        email = EmailOutbox.objects.get()
+        self.assertEqual(email.status, "failed")
+        self.assertIn("smtp down", email.last_error)
+
+
+class OrderCodeTests(TestCase):
+    def test_codes_are_distinct_and_readable(self) -> None:
+        codes = {generate_code(order_id, package_id) for order_id in range(1, 200) for package_id in range(1, 6)}
+        self.assertEqual(len(codes), 199 * 5)
+        self.assertRegex(next(iter(codes)), r"^[0-9A-HJKMNP-TV-Z]{4}-[0-9A-HJKMNP-TV-Z]{4}-[0-9A-HJKMNP-TV-Z]{4}$")
+
+    def test_create_order_codes_is_idempotent(self) -> None:
+        package = ServicePackage.objects.create(
+            slug="codes-test", name_es="Paquete codigos", short_description_es="", price_mxn=100
+        )
+        order = Order.objects.create(package=package, customer_name="Test User", email="test@example.com", amount=100)
+        first = create_order_codes(order)
+        with self.assertNumQueries(3):  # items lookup, INSERT ... ON CONFLICT, read back
+            second = create_order_codes(order)
+        self.assertEqual([code.code for code in first], [code.code for code in second])
+        self.assertEqual(first[0].code, generate_code(order.pk, package.pk))
+
+
+class CartTests(TestCase):
+    def setUp(self) -> None:
+        User = get_user_model()
+        self.user = User.objects.create_user(username="buyer", email="buyer@example.com", password="testpass123")
+        self.package = ServicePackage.objects.create(
+            slug="cart-package", name_es="Paquete carrito", short_description_es="", price_mxn=1000
+        )
+        self.service = IndividualService.objects.create(
+            slug="cart-service", name_es="Servicio carrito", short_description_es="", price_mxn=250
+        )
+
+    def add(self, url):
+        return self.client.post(url, HTTP_HX_REQUEST="true")
+
+    def test_adding_items_writes_nothing_to_the_database(self) -> None:
+        self.add(reverse("orders:cart_add", args=[self.package.slug]))
+        with self.assertNumQueries(0):
+            response = self.add(reverse("orders:cart_add_service", args=[self.service.slug]))
+        self.assertContains(response, "Carrito (2)")
+        self.assertIn(CART_COOKIE, response.cookies)
+
+    def test_unknown_item_is_rejected(self) -> None:
+        response = self.add(reverse("orders:cart_add", args=["does-not-exist"]))
+        self.assertEqual(response.status_code, 400)
+
+    def test_visitor_adds_with_the_csrf_cookie_and_get_changes_nothing(self) -> None:
+        url = reverse("orders:cart_add", args=[self.package.slug])
+        client = Client(enforce_csrf_checks=True)
+        response = client.get(url)
+        self.assertEqual(response.status_code, 405)
+        self.assertNotIn(CART_COOKIE, response.cookies)
+
+        token = client.get(reverse("orders:cart_summary")).cookies[settings.CSRF_COOKIE_NAME].value
+        response = client.post(url, HTTP_HX_REQUEST="true", HTTP_X_CSRFTOKEN=token)
+        self.assertContains(response, "Carrito (1)")
+
+    def test_update_returns_lines_fragment(self) -> None:
+        self.add(reverse("orders:cart_add", args=[self.package.slug]))
+        url = reverse("orders:cart_update", args=["package", self.package.slug])
+        response = self.client.post(url, {"quantity": "3"}, HTTP_HX_REQUEST="true")
+        self.assertContains(response, "Total: $3000")
+        self.assertNotContains(response, "<html")
+
+        response = self.client.post(url, {"quantity": "0"}, HTTP_HX_REQUEST="true")
+        self.assertContains(response, "Tu carrito está vacío")
+
+    @mock.patch("orders.views.create_paypal_order")
+    def test_checkout_materializes_order_with_items(self, mock_create_paypal) -> None:
+        mock_create_paypal.return_value = ("https://paypal.test/approve", "PAYPAL-CART-1")
+        self.add(reverse("orders:cart_add", args=[self.package.slug]))
+        self.add(reverse("orders:cart_add_service", args=[self.service.slug]))
+        self.add(reverse("orders:cart_add_service", args=[self.service.slug]))
+
+        self.client.login(username="buyer", password="testpass123")
+        response = self.client.post(
+            reverse("orders:cart_checkout"),
+            {"customer_name": "Test User", "email": "test@example.com", "payment_method": "paypal"},
+        )
+        self.assertEqual(response["Location"], "https://paypal.test/approve")
+        self.assertEqual(response.cookies[CART_COOKIE].value, "")
+
+        order = Order.objects.get()
+        self.assertEqual(order.amount, 1500)
+        self.assertEqual(order.package, self.package)
+        self.assertEqual(
+            sorted((item.name, item.quantity) for item in order.items.all()),
+            [("Paquete carrito", 1), ("Servicio carrito", 2)],
+        )
+        self.assertEqual(len(mock_create_paypal.call_args.kwargs["items"]), 2)
+        self.assertEqual(Payment.objects.get().provider_payment_id, "PAYPAL-CART-1")
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from django.conf import settings
 from django.urls import path
 
 from . import views
@@ -7,16 +8,23 @@ from . import views
 app_name = "orders"
 
 urlpatterns = [
-	    # Temporary cart endpoint: currently just redirects into checkout.
-	    # Later we can implement a real session-based cart using this route.
+	    # Signed-cookie cart; editing endpoints answer HTMX requests with fragments.
+	    path("cart/", views.cart_detail, name="cart"),
+	    path("cart/summary/", views.cart_summary, name="cart_summary"),
+	    path("cart/add/service/<slug:service_slug>/", views.cart_add_service, name="cart_add_service"),
 	    path("cart/add/<slug:package_slug>/", views.cart_add, name="cart_add"),
+	    path("cart/update/<str:kind>/<slug:slug>/", views.cart_update, name="cart_update"),
+	    path("cart/checkout/", views.cart_checkout, name="cart_checkout"),
 
 	    # Dedicated status endpoints must come *before* the catch-all slug pattern,
 	    # otherwise "success" / "failure" would be treated as package slugs.
 	    path("success/", views.checkout_success, name="success"),
 	    path("failure/", views.checkout_failure, name="failure"),
 
-	    # /checkout/<package_slug>/
-	    path("<slug:package_slug>/", views.checkout, name="checkout"),
+	    # /checkout/<package_slug>/ (async variant when deployed under ASGI)
+	    path(
+	        "<slug:package_slug>/",
+	        views.checkout_async if settings.ALTIQ_ASYNC_CHECKOUT else views.checkout,
+	        name="checkout",
+	    ),
 	]
-
@@ -1,91 +1,467 @@
 from __future__ import annotations
 
-from django.http import HttpRequest, HttpResponse
+import asyncio
+import secrets
+import time
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpRequest, HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.http import require_POST
 
 from services.models import ServicePackage
 from payments.models import Payment
+from payments.transitions import transition_payment
 from payments.utils import (
     PaymentGatewayError,
+    acreate_coinbase_charge,
+    acreate_paypal_order,
     create_coinbase_charge,
     create_paypal_order,
+    gateway_available,
 )
+from .cart import CART_KINDS, Cart, materialize_order
 from .models import Order
 
+
+def _customer_fields(request: HttpRequest) -> dict[str, str]:
+    return {
+        "customer_name": request.POST.get("customer_name", "").strip(),
+        "company_name": request.POST.get("company_name", "").strip(),
+        "email": request.POST.get("email", "").strip(),
+        "phone": request.POST.get("phone", "").strip(),
+    }
+
+
+# A repeated submission that arrives while the first one is still talking to
+# the gateway waits this long for its approval URL. After that it gets a 409
+# page that resubmits itself every REPLAY_RETRY_SECONDS, so no worker is held
+# for the whole gateway call.
+REPLAY_WAIT_SECONDS = 0.5
+REPLAY_POLL_INTERVAL = 0.5
+REPLAY_RETRY_SECONDS = 2
+
+
+OTHER_GATEWAY = {"paypal": "coinbase", "coinbase": "paypal"}
+
+
+def _payment_method(request: HttpRequest) -> str:
+    return "coinbase" if request.POST.get("payment_method") == "coinbase" else "paypal"
+
+
+def _gateway_unavailable(request: HttpRequest, method: str, key: str | None, template: str, context: dict):
+    """Re-render the form offering the other gateway, or fail fast if it is down too.
+
+    Nothing has been written yet, so the submitted idempotency key is reused.
+    """
+
+    other = OTHER_GATEWAY[method]
+    if not gateway_available(other):
+        return redirect("orders:failure")
+    context = {
+        **context,
+        "unavailable_gateway": method,
+        "payment_method": other,
+        "idempotency_key": key or _new_idempotency_key(),
+    }
+    return render(request, template, context, status=503)
+
+
+def _new_idempotency_key() -> str:
+    return secrets.token_urlsafe(24)
+
+
+def _submitted_idempotency_key(request: HttpRequest) -> str | None:
+    key = request.POST.get("idempotency_key", "").strip()
+    return key if 0 < len(key) <= 64 else None
+
+
+def _create_order_once(create, key: str | None):
+    """Run ``create()`` unless checkout submission ``key`` was already used.
+
+    Returns None for a repeated submission: the unique index on
+    ``Order.idempotency_key`` rejects the second INSERT.
+    """
+
+    try:
+        with transaction.atomic():
+            return create()
+    except IntegrityError:
+        if key is None or not Order.objects.filter(idempotency_key=key).exists():
+            raise
+        return None
+
+
+def _replay_checkout(key: str, user) -> HttpResponse | None:
+    """Answer a repeated submission from the order it created.
+
+    Returns None while the original request has not reached the gateway yet.
+    """
+
+    order = Order.objects.filter(idempotency_key=key).first()
+    if order is None or order.user_id != user.pk:
+        return HttpResponse(status=400)
+    payment = order.payments.order_by("-pk").first()
+    if payment is None or payment.status == "created":
+        return None
+    if payment.status == "failed":
+        return redirect("orders:failure")
+    if payment.status == "completed":
+        return redirect("orders:success")
+    return redirect(payment.approval_url)
+
+
+def _in_progress_context(request: HttpRequest, key: str, context: dict) -> dict:
+    # The submitted fields, so the page can post the same submission again.
+    retry_fields = [
+        (name, value)
+        for name, values in request.POST.lists()
+        if name != "csrfmiddlewaretoken"
+        for value in values
+    ]
+    return {
+        **context,
+        "idempotency_key": key,
+        "in_progress": True,
+        "retry_fields": retry_fields,
+        "retry_seconds": REPLAY_RETRY_SECONDS,
+    }
+
+
+def _replay_response(request: HttpRequest, key: str, user, template: str, context: dict) -> HttpResponse:
+    deadline = time.monotonic() + REPLAY_WAIT_SECONDS
+    while (response := _replay_checkout(key, user)) is None and time.monotonic() < deadline:
+        time.sleep(REPLAY_POLL_INTERVAL)
+    if response is None:
+        response = render(request, template, _in_progress_context(request, key, context), status=409)
+        response["Retry-After"] = str(REPLAY_RETRY_SECONDS)
+    return response
+
+
+def _start_payment(
+    request: HttpRequest, order: Order, payment_method: str, items=(), idempotency_key: str | None = None
+) -> HttpResponse:
+    """Create the Payment for ``order`` and redirect to the chosen gateway."""
+
+    payment = Payment.objects.create(
+        order=order,
+        method=payment_method,
+        amount=order.amount,
+        currency=order.currency,
+        status="created",
+    )
+
+    success_url = request.build_absolute_uri(reverse("orders:success"))
+    cancel_url = request.build_absolute_uri(reverse("orders:failure"))
+
+    try:
+        if payment.method == "paypal":
+            approval_url, provider_id = create_paypal_order(
+                order, success_url, cancel_url, items=items, request_id=idempotency_key or ""
+            )
+        else:
+            approval_url, provider_id = create_coinbase_charge(order, success_url, cancel_url)
+    except PaymentGatewayError:
+        transition_payment(Payment.objects.filter(pk=payment.pk), "failed", order_status="failed")
+        return redirect("orders:failure")
+
+    transition_payment(
+        Payment.objects.filter(pk=payment.pk), "pending", provider_payment_id=provider_id, approval_url=approval_url
+    )
+
+    return redirect(approval_url)
+
+
 @login_required
 def checkout(request: HttpRequest, package_slug: str) -> HttpResponse:
     """Create an Order + Payment and redirect to PayPal or Coinbase.
 
     If gateway configuration is missing or an error occurs, the user is sent to
-    the generic failure page.
+    the generic failure page. Each rendered form carries an idempotency key, so
+    a double-click or browser retry gets the first submission's redirect back.
     """
 
     package = get_object_or_404(ServicePackage, slug=package_slug, is_active=True)
+    context = {"package": package}
 
     if request.method == "POST":
-        customer_name = request.POST.get("customer_name", "").strip()
-        company_name = request.POST.get("company_name", "").strip()
-        email = request.POST.get("email", "").strip()
-        phone = request.POST.get("phone", "").strip()
-        payment_method = request.POST.get("payment_method", "paypal")
-
-        if customer_name and email:
-            order = Order.objects.create(
-                package=package,
-                customer_name=customer_name,
-                company_name=company_name,
-                email=email,
-                phone=phone,
-                currency="MXN",
-                amount=package.price_mxn,
-                status="pending",
-                user=request.user if request.user.is_authenticated else None,
+        customer = _customer_fields(request)
+        payment_method = _payment_method(request)
+        key = _submitted_idempotency_key(request)
+
+        if customer["customer_name"] and customer["email"]:
+            if not gateway_available(payment_method):
+                return _gateway_unavailable(request, payment_method, key, "orders/checkout.html", context)
+            order = _create_order_once(
+                lambda: Order.objects.create(
+                    package=package,
+                    currency="MXN",
+                    amount=package.price_mxn,
+                    status="pending",
+                    user=request.user,
+                    idempotency_key=key,
+                    **customer,
+                ),
+                key,
             )
+            if order is None:
+                return _replay_response(request, key, request.user, "orders/checkout.html", context)
+            return _start_payment(request, order, payment_method, idempotency_key=key)
+
+    context["idempotency_key"] = _new_idempotency_key()
+    return render(request, "orders/checkout.html", context)
+
+
+# ---------------------------------------------------------------------------
+# Async checkout (ASGI)
+# ---------------------------------------------------------------------------
+
+
+async def _arequest_user(request: HttpRequest):
+    # Django 4.2 has no request.auser(); resolving the lazy user hits the
+    # session and user tables, so do it off the event loop.
+    return await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
 
-            payment = Payment.objects.create(
-                order=order,
-                method="coinbase" if payment_method == "coinbase" else "paypal",
-                amount=order.amount,
-                currency=order.currency,
-                status="created",
+
+async def _areplay_response(request: HttpRequest, key: str, user, template: str, context: dict) -> HttpResponse:
+    replay = sync_to_async(_replay_checkout)
+    deadline = time.monotonic() + REPLAY_WAIT_SECONDS
+    while (response := await replay(key, user)) is None and time.monotonic() < deadline:
+        await asyncio.sleep(REPLAY_POLL_INTERVAL)
+    if response is None:
+        context = _in_progress_context(request, key, context)
+        response = await sync_to_async(render)(request, template, context, status=409)
+        response["Retry-After"] = str(REPLAY_RETRY_SECONDS)
+    return response
+
+
+async def _astart_payment(
+    request: HttpRequest, order: Order, payment_method: str, idempotency_key: str | None = None
+) -> HttpResponse:
+    """Async ``_start_payment``: the gateway call never blocks the event loop."""
+
+    payment = await Payment.objects.acreate(
+        order=order,
+        method=payment_method,
+        amount=order.amount,
+        currency=order.currency,
+        status="created",
+    )
+
+    success_url = request.build_absolute_uri(reverse("orders:success"))
+    cancel_url = request.build_absolute_uri(reverse("orders:failure"))
+
+    # Transitions run a small transaction, which the async ORM cannot do yet.
+    atransition_payment = sync_to_async(transition_payment)
+    try:
+        if payment.method == "paypal":
+            approval_url, provider_id = await acreate_paypal_order(
+                order, success_url, cancel_url, request_id=idempotency_key or ""
             )
+        else:
+            approval_url, provider_id = await acreate_coinbase_charge(order, success_url, cancel_url)
+    except PaymentGatewayError:
+        await atransition_payment(Payment.objects.filter(pk=payment.pk), "failed", order_status="failed")
+        return redirect("orders:failure")
+
+    await atransition_payment(
+        Payment.objects.filter(pk=payment.pk), "pending", provider_payment_id=provider_id, approval_url=approval_url
+    )
+
+    return redirect(approval_url)
 
-            success_url = request.build_absolute_uri(reverse("orders:success"))
-            cancel_url = request.build_absolute_uri(reverse("orders:failure"))
 
-            try:
-                if payment.method == "paypal":
-                    approval_url, provider_id = create_paypal_order(order, success_url, cancel_url)
-                else:
-                    approval_url, provider_id = create_coinbase_charge(order, success_url, cancel_url)
-            except PaymentGatewayError:
-                payment.status = "failed"
-                payment.save(update_fields=["status"])
-                order.status = "failed"
-                order.save(update_fields=["status"])
-                return redirect("orders:failure")
+async def checkout_async(request: HttpRequest, package_slug: str) -> HttpResponse:
+    """Async twin of ``checkout``, routed when ``ALTIQ_ASYNC_CHECKOUT`` is on.
 
-            payment.provider_payment_id = provider_id
-            payment.status = "pending"
-            payment.save(update_fields=["provider_payment_id", "status"])
+    Under ASGI (every middleware is async-capable) a checkout waiting on
+    PayPal or Coinbase only parks a coroutine, so slow gateways no longer
+    exhaust the worker pool. ORM calls still run one at a time on Django's
+    sync thread; ``manage.py benchmark_checkout`` compares both views through
+    the full WSGI and ASGI handlers.
+    """
+
+    user = await _arequest_user(request)
+    if user is None:
+        return redirect_to_login(request.get_full_path())
 
-            return redirect(approval_url)
+    package = await ServicePackage.objects.filter(slug=package_slug, is_active=True).afirst()
+    if package is None:
+        raise Http404("No ServicePackage matches the given query.")
 
     context = {"package": package}
-    return render(request, "orders/checkout.html", context)
+    if request.method == "POST":
+        customer = _customer_fields(request)
+        payment_method = _payment_method(request)
+        key = _submitted_idempotency_key(request)
 
-@login_required
+        if customer["customer_name"] and customer["email"]:
+            if not await sync_to_async(gateway_available)(payment_method):
+                return await sync_to_async(_gateway_unavailable)(
+                    request, payment_method, key, "orders/checkout.html", context
+                )
+            # The INSERT needs a savepoint around it (see _create_order_once),
+            # which the async ORM cannot open, so it runs on the ORM thread.
+            order = await sync_to_async(_create_order_once)(
+                lambda: Order.objects.create(
+                    package=package,
+                    currency="MXN",
+                    amount=package.price_mxn,
+                    status="pending",
+                    user=user,
+                    idempotency_key=key,
+                    **customer,
+                ),
+                key,
+            )
+            if order is None:
+                return await _areplay_response(request, key, user, "orders/checkout.html", context)
+            return await _astart_payment(request, order, payment_method, idempotency_key=key)
+
+    # Templates read request.user and the CSRF token: render on a thread.
+    context["idempotency_key"] = _new_idempotency_key()
+    return await sync_to_async(render)(request, "orders/checkout.html", context)
+
+
+# ---------------------------------------------------------------------------
+# Cart (signed cookie, HTMX fragments)
+# ---------------------------------------------------------------------------
+
+
+def _is_htmx_fragment_request(request: HttpRequest) -> bool:
+    # Boosted navigation also sends HX-Request but expects a full page.
+    return bool(request.headers.get("HX-Request")) and not request.headers.get("HX-Boosted")
+
+
+def _cart_context(cart: Cart) -> dict:
+    lines = cart.lines()
+    return {"lines": lines, "cart_total": sum(line.subtotal for line in lines)}
+
+
+def _cart_summary(request: HttpRequest, cart: Cart) -> HttpResponse:
+    response = render(request, "orders/_cart_summary.html", {"cart_count": cart.count})
+    cart.save(response)
+    return response
+
+
+def _add_to_cart(request: HttpRequest, kind: str, slug: str) -> HttpResponse:
+    cart = Cart.from_request(request)
+    if not cart.add(kind, slug):
+        return HttpResponse(status=400)
+    if _is_htmx_fragment_request(request):
+        return _cart_summary(request, cart)
+    response = redirect("orders:cart")
+    cart.save(response)
+    return response
+
+
+@require_POST
 def cart_add(request: HttpRequest, package_slug: str) -> HttpResponse:
-    """Temporary placeholder for a real cart.
+    """Add a package to the cart.
+
+    HTMX posts get the updated header badge back; plain form posts are
+    redirected to the cart page. POST only, so prefetchers and cross-site
+    links cannot change the cart cookie. Visitors on the cached public pages
+    post through HTMX with the token from the CSRF cookie (set by
+    ``cart_summary``).
+    """
+
+    return _add_to_cart(request, "package", package_slug)
+
+
+@require_POST
+def cart_add_service(request: HttpRequest, service_slug: str) -> HttpResponse:
+    """Add an individual service to the cart (see ``cart_add``)."""
+
+    return _add_to_cart(request, "service", service_slug)
+
+
+@require_POST
+def cart_update(request: HttpRequest, kind: str, slug: str) -> HttpResponse:
+    """Change a line's quantity (0 removes it) and return the cart lines fragment."""
+
+    if kind not in CART_KINDS:
+        return HttpResponse(status=404)
+    try:
+        quantity = int(request.POST.get("quantity", "0"))
+    except ValueError:
+        return HttpResponse(status=400)
+
+    cart = Cart.from_request(request)
+    cart.set_quantity(kind, slug, quantity)
+    if _is_htmx_fragment_request(request):
+        response = render(request, "orders/_cart_lines.html", _cart_context(cart))
+        # Lets the header badge refresh itself.
+        response["HX-Trigger"] = "cart-changed"
+    else:
+        response = redirect("orders:cart")
+    cart.save(response)
+    return response
 
-    For now, "Anadir al carrito" behaves like "Comprar ahora" and simply
-    redirects into the single-package checkout flow. This keeps templates and
-    tests working while we gradually introduce a proper multi-item cart.
+
+@ensure_csrf_cookie
+def cart_summary(request: HttpRequest) -> HttpResponse:
+    """Header badge with the number of items in the cart (HTMX fragment).
+
+    Loaded on every page, it also gives visitors of the cached public pages
+    the CSRF cookie their HTMX posts (e.g. ``cart_add``) need.
     """
 
-    return redirect("orders:checkout", package_slug=package_slug)
+    return _cart_summary(request, Cart.from_request(request))
+
+
+def cart_detail(request: HttpRequest) -> HttpResponse:
+    context = _cart_context(Cart.from_request(request))
+    context["idempotency_key"] = _new_idempotency_key()
+    return render(request, "orders/cart.html", context)
+
+
+@login_required
+@require_POST
+def cart_checkout(request: HttpRequest) -> HttpResponse:
+    """Turn the cart into an Order with its items and start the payment."""
+
+    cart = Cart.from_request(request)
+    key = _submitted_idempotency_key(request)
+    replay = lambda: _replay_response(request, key, request.user, "orders/cart.html", _cart_context(cart))  # noqa: E731
+
+    if key is not None and Order.objects.filter(idempotency_key=key).exists():
+        response = replay()
+    else:
+        lines = cart.lines()
+        customer = _customer_fields(request)
+        payment_method = _payment_method(request)
+        if not lines or not customer["customer_name"] or not customer["email"]:
+            return redirect("orders:cart")
+        if not gateway_available(payment_method):
+            return _gateway_unavailable(request, payment_method, key, "orders/cart.html", _cart_context(cart))
+
+        created = _create_order_once(
+            lambda: materialize_order(
+                lines,
+                currency="MXN",
+                status="pending",
+                user=request.user,
+                idempotency_key=key,
+                **customer,
+            ),
+            key,
+        )
+        if created is None:
+            response = replay()
+        else:
+            order, items = created
+            response = _start_payment(request, order, payment_method, items=items, idempotency_key=key)
+
+    if response.status_code == 302 and response.url != reverse("orders:failure"):
+        cart.clear()
+        cart.save(response)
+    return response
 
 
 def checkout_success(request: HttpRequest) -> HttpResponse:
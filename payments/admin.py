@@ -1,13 +1,103 @@
 from __future__ import annotations
 
+from django.conf import settings
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.db.models import Q
+from django.db.models.functions import Length
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
 
-from .models import Payment
+from core.admin_tools import CachedValuesFilter, ScalableAdmin, pk_search
+from jobs.registry import enqueue
+from orders.emails import deliver_outbox_batch
+from .models import Payment, PaymentPayload, WebhookEvent
+from .webhooks import PROCESS_JOB, process_pending_events, requeue_events
+
+
+class PaymentPayloadInline(admin.TabularInline):
+    """Archived payloads, listed without reading (or decompressing) the blobs."""
+
+    model = PaymentPayload
+    fields = readonly_fields = ("created_at", "source", "size", "stored_size", "view_payload")
+    extra = 0
+    can_delete = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer("data").annotate(stored=Length("data"))
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description="Comprimido")
+    def stored_size(self, obj):
+        return obj.stored
+
+    @admin.display(description="JSON")
+    def view_payload(self, obj):
+        url = reverse("admin:payments_payment_payload", args=[obj.pk])
+        return format_html('<a href="{}" target="_blank">Ver</a>', url)
 
 
 @admin.register(Payment)
-class PaymentAdmin(admin.ModelAdmin):
+class PaymentAdmin(ScalableAdmin):
     list_display = ("id", "order", "method", "status", "amount", "currency", "created_at")
-    list_filter = ("method", "status", "currency", "created_at")
-    search_fields = ("provider_payment_id", "provider_session_id")
+    list_filter = ("method", "status", ("currency", CachedValuesFilter), "created_at")
+    # Order.__str__ shows the package.
+    list_select_related = ("order__package",)
+    search_fields = ("provider_payment_id",)
+    email_search_field = "order__email"
+    export_name = "payments"
+    search_help_text = "Email del cliente, ID de pago del proveedor o ID interno."
+    inlines = [PaymentPayloadInline]
+
+    def get_urls(self):
+        urls = [
+            path(
+                "payload/<int:payload_id>/",
+                self.admin_site.admin_view(self.payload_view),
+                name="payments_payment_payload",
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def payload_view(self, request, payload_id: int):
+        """Decompress one archived payload on demand."""
+
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        payload = get_object_or_404(PaymentPayload, pk=payload_id)
+        return JsonResponse(payload.load(), safe=False, json_dumps_params={"indent": 2, "ensure_ascii": False})
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term or "@" in term:
+            return super().get_search_results(request, queryset, search_term)
+        # Listing every method lets the (method, provider_payment_id) index serve the lookup.
+        methods = [value for value, _ in Payment.METHOD_CHOICES]
+        condition = Q(method__in=methods, provider_payment_id=term) | pk_search(term)
+        return queryset.filter(condition), False
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ("id", "provider", "event_type", "event_id", "status", "attempts", "received_at", "processed_at")
+    list_filter = ("provider", "status", "received_at")
+    search_fields = ("event_id",)
+    readonly_fields = ("provider", "event_id", "event_type", "payload", "attempts", "received_at", "processed_at")
+    actions = ["replay_events"]
 
+    @admin.action(description="Replay selected events")
+    def replay_events(self, request, queryset):
+        count = requeue_events(queryset)
+        # Same as a new delivery: processed right away without a worker,
+        # otherwise handed to the jobs queue.
+        if getattr(settings, "ALTIQ_WEBHOOKS_INLINE", True):
+            process_pending_events()
+            deliver_outbox_batch()
+            self.message_user(request, f"{count} event(s) replayed.")
+        else:
+            enqueue(PROCESS_JOB, unique_key=PROCESS_JOB)
+            self.message_user(request, f"{count} event(s) queued for processing.")
@@ -0,0 +1,137 @@
+"""Cancel abandoned checkouts (``manage.py expire_orders``).
+
+Every checkout that is never paid leaves an ``Order`` in "pending" and its
+``Payment`` rows in "created"/"pending". ``expire_stale_orders`` walks the
+pending orders older than the TTL in batches along the
+``order_status_created_idx`` index (keyset on ``created_at`` descending,
+then ``id``, which is the index's own order, so each batch is one bounded
+range scan) and cancels each batch with two conditional UPDATEs: orders to
+"cancelled", their open payments to "failed".
+
+With ``check_gateway`` each open payment that reached the gateway is looked
+up first; payments the gateway reports as paid are completed and fulfilled
+(the webhook was lost) instead of being cancelled. A payment can still
+complete after its order was cancelled (a PayPal capture racing the sweep,
+Coinbase manual resolution days later): the webhook, or
+``reconcile_payments``, then moves the order from "cancelled" to "paid" and
+fulfils it as usual.
+"""
+from __future__ import annotations
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from orders.models import Order
+from .models import Payment
+from .transitions import PAYMENT_TRANSITIONS, transition_order
+from .utils import PaymentGatewayError, get_coinbase_charge, get_paypal_order
+from .webhooks import apply_gateway_state
+
+logger = logging.getLogger(__name__)
+
+# Recurring job (payments/jobs.py) that runs the sweep.
+EXPIRE_JOB = "payments.expire_stale_orders"
+
+OPEN_PAYMENT_STATUSES = PAYMENT_TRANSITIONS["failed"]
+LOOKUPS = {
+    "paypal": get_paypal_order,
+    "coinbase": get_coinbase_charge,
+}
+
+
+def stale_orders(ttl: timedelta, now=None):
+    """Pending orders created more than ``ttl`` ago, in index order (newest first)."""
+
+    cutoff = (now or timezone.now()) - ttl
+    return Order.objects.filter(status="pending", created_at__lt=cutoff).order_by("-created_at", "pk")
+
+
+def _settled_on_gateway(order_ids: list[int], counts: dict[str, int]) -> set[int]:
+    """Look up the batch's open gateway payments; return orders not to cancel."""
+
+    keep: set[int] = set()
+    payments = (
+        Payment.objects.filter(order_id__in=order_ids, status__in=OPEN_PAYMENT_STATUSES)
+        .exclude(provider_payment_id="")
+        .values_list("order_id", "method", "provider_payment_id")
+    )
+    for order_id, method, provider_id in payments:
+        if order_id in keep:
+            continue
+        try:
+            state = apply_gateway_state(method, LOOKUPS[method](provider_id))
+        except PaymentGatewayError as exc:
+            # Unknown state: leave the order alone until the next sweep.
+            logger.warning("Gateway lookup for %s payment %s failed: %s", method, provider_id, exc)
+            counts["skipped"] += 1
+            keep.add(order_id)
+            continue
+        if state == "paid":
+            logger.info("Order %s was paid on %s; completing instead of cancelling", order_id, method)
+            counts["paid"] += 1
+            keep.add(order_id)
+    return keep
+
+
+def cancel_orders(order_ids: list[int]) -> int:
+    """Cancel the still-pending orders among ``order_ids`` and fail their open payments."""
+
+    now = timezone.now()
+    with transaction.atomic():
+        cancelled = transition_order(Order.objects.filter(pk__in=order_ids, status="pending"), "cancelled")
+        Payment.objects.filter(
+            order__in=Order.objects.filter(pk__in=order_ids, status="cancelled"),
+            status__in=OPEN_PAYMENT_STATUSES,
+        ).update(status="failed", updated_at=now)
+    return cancelled
+
+
+def expire_stale_orders(
+    ttl: timedelta | None = None,
+    *,
+    batch_size: int = 500,
+    check_gateway: bool = False,
+    dry_run: bool = False,
+) -> dict[str, int]:
+    """Cancel pending orders older than ``ttl`` (default ``ALTIQ_ORDER_TTL_HOURS``).
+
+    Returns counts: "cancelled", "paid" (completed from the gateway lookup)
+    and "skipped" (lookup failed, retried on the next run). With
+    ``dry_run`` nothing is changed and "cancelled" is the number of orders
+    that would be considered.
+    """
+
+    if ttl is None:
+        ttl = timedelta(hours=settings.ALTIQ_ORDER_TTL_HOURS)
+    queryset = stale_orders(ttl)
+    counts = {"cancelled": 0, "paid": 0, "skipped": 0}
+    if dry_run:
+        counts["cancelled"] = queryset.count()
+        return counts
+
+    cursor = None
+    while True:
+        batch = queryset
+        if cursor is not None:
+            created_at, pk = cursor
+            batch = batch.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__gt=pk))
+        rows = list(batch.values_list("pk", "created_at")[:batch_size])
+        if not rows:
+            break
+        last_pk, last_created_at = rows[-1]
+        cursor = (last_created_at, last_pk)
+
+        order_ids = [pk for pk, _ in rows]
+        if check_gateway:
+            keep = _settled_on_gateway(order_ids, counts)
+            order_ids = [pk for pk in order_ids if pk not in keep]
+        if order_ids:
+            counts["cancelled"] += cancel_orders(order_ids)
+        if len(rows) < batch_size:
+            break
+    return counts
@@ -0,0 +1,295 @@
+"""Non-blocking counterpart of ``payments.gateway_http`` for async views.
+
+Uses asyncio streams (still stdlib-only) to speak plain HTTP/1.1 with
+keep-alive, so a checkout waiting on PayPal or Coinbase parks a coroutine
+instead of a whole worker thread. Retry rules, errors and the recorded call
+history are shared with the synchronous client.
+
+Streams belong to the event loop that opened them, so connection pools are
+kept per running loop. Under ASGI there is one long-lived loop per process
+and connections are reused across requests. Under WSGI, ``async_to_sync``
+runs each async view on a fresh loop through ``asyncio.run``, so a loop's
+pool is closed (and forgotten) when that loop shuts down: connections are
+then only reused within one request.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+import ssl
+import time
+from collections import deque
+from collections.abc import AsyncGenerator
+from typing import Any
+from urllib.parse import urlsplit
+
+from .gateway_http import (
+    IDEMPOTENT_METHODS,
+    RETRY_STATUSES,
+    CallRecord,
+    GatewayHTTPError,
+    GatewayResponse,
+    get_gateway_client,
+    record_call,
+)
+
+_Key = tuple[str, str, int]
+_Stream = tuple[asyncio.StreamReader, asyncio.StreamWriter]
+
+
+class _StaleConnection(Exception):
+    """A pooled keep-alive socket was closed before the response arrived.
+
+    ``sent`` tells whether the request had already gone out: if so the server
+    may have processed it, so only idempotent requests are replayed.
+    """
+
+    def __init__(self, sent: bool) -> None:
+        super().__init__()
+        self.sent = sent
+
+
+class AsyncGatewayHTTPClient:
+    """Keep-alive asyncio HTTP(S) client with a small pool per host and loop."""
+
+    def __init__(
+        self,
+        timeout: float = 10.0,
+        max_retries: int = 2,
+        backoff: float = 0.2,
+        max_backoff: float = 2.0,
+        pool_size: int = 32,
+        calls: deque[CallRecord] | None = None,
+    ) -> None:
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.pool_size = pool_size
+        self.calls: deque[CallRecord] = calls if calls is not None else deque(maxlen=256)
+        self._pools: dict[asyncio.AbstractEventLoop, dict[_Key, list[_Stream]]] = {}
+        # Per loop, the suspended generator that closes its pool on shutdown.
+        self._closers: dict[asyncio.AbstractEventLoop, AsyncGenerator[None, None]] = {}
+        self._ssl_context = ssl.create_default_context()
+
+    # -- connection pooling -------------------------------------------------
+
+    async def _loop_pools(self) -> dict[_Key, list[_Stream]]:
+        loop = asyncio.get_running_loop()
+        pools = self._pools.get(loop)
+        if pools is None:
+            # Loops closed without shutting down their async generators:
+            # drop them, their sockets are closed as the streams are collected.
+            for stale in [other for other in list(self._pools) if other.is_closed()]:
+                self._pools.pop(stale, None)
+                self._closers.pop(stale, None)
+            pools = self._pools[loop] = {}
+            closer = self._close_on_shutdown()
+            await closer.__anext__()
+            self._closers[loop] = closer
+        return pools
+
+    async def _close_on_shutdown(self) -> AsyncGenerator[None, None]:
+        # The loop's shutdown_asyncgens() (run by asyncio.run before closing
+        # the loop) finalizes this suspended generator, closing the pool.
+        try:
+            yield
+        finally:
+            await self.close()
+
+    async def _acquire(self, key: _Key) -> tuple[_Stream, bool]:
+        pool = (await self._loop_pools()).setdefault(key, [])
+        while pool:
+            reader, writer = pool.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return (reader, writer), True
+            writer.close()
+        return await self._open(key), False
+
+    async def _open(self, key: _Key) -> _Stream:
+        scheme, host, port = key
+        return await asyncio.open_connection(host, port, ssl=self._ssl_context if scheme == "https" else None)
+
+    def _release(self, key: _Key, stream: _Stream) -> None:
+        pool = self._pools.get(asyncio.get_running_loop(), {}).get(key)
+        if pool is not None and len(pool) < self.pool_size:
+            pool.append(stream)
+        else:
+            stream[1].close()
+
+    async def close(self) -> None:
+        """Close the connections pooled for the running event loop."""
+
+        loop = asyncio.get_running_loop()
+        self._closers.pop(loop, None)
+        pools = self._pools.pop(loop, {})
+        for pool in pools.values():
+            for _reader, writer in pool:
+                writer.close()
+
+    # -- wire format --------------------------------------------------------
+
+    @staticmethod
+    async def _read_body(reader: asyncio.StreamReader, headers: dict[str, str]) -> bytes:
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";", 1)[0].strip() or b"0", 16)
+                if size == 0:
+                    # Skip optional trailers up to the terminating blank line.
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    return b"".join(chunks)
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+        if "content-length" in headers:
+            return await reader.readexactly(int(headers["content-length"]))
+        return await reader.read()
+
+    async def _exchange(self, stream: _Stream, reused: bool, host: str, method: str, target: str,
+                        body: bytes | None, headers: dict[str, str]) -> tuple[GatewayResponse, bool]:
+        reader, writer = stream
+        body = body or b""
+        lines = [f"{method} {target} HTTP/1.1", f"Host: {host}", f"Content-Length: {len(body)}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        try:
+            await writer.drain()
+        except (ConnectionResetError, BrokenPipeError) as exc:
+            if reused:
+                raise _StaleConnection(sent=False) from exc
+            raise
+        try:
+            status_line = await reader.readline()
+        except ConnectionResetError as exc:
+            if reused:
+                raise _StaleConnection(sent=True) from exc
+            raise
+        if not status_line:
+            if reused:
+                raise _StaleConnection(sent=True)
+            raise ConnectionError("server closed the connection without a response")
+
+        try:
+            status = int(status_line.split(None, 2)[1])
+        except (IndexError, ValueError) as exc:
+            raise ConnectionError(f"malformed status line {status_line!r}") from exc
+        response_headers: dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+        data = await self._read_body(reader, response_headers)
+        keep_alive = (
+            response_headers.get("connection", "").lower() != "close"
+            and not status_line.startswith(b"HTTP/1.0")
+            and ("content-length" in response_headers or "transfer-encoding" in response_headers)
+        )
+        return GatewayResponse(status, response_headers, data), keep_alive
+
+    async def _send_once(self, key, method, target, body, headers, idempotent) -> GatewayResponse:
+        stream, reused = await self._acquire(key)
+        try:
+            try:
+                response, keep_alive = await self._exchange(stream, reused, key[1], method, target, body, headers)
+            except _StaleConnection as exc:
+                if exc.sent and not idempotent:
+                    raise ConnectionError("server closed the connection without a response") from exc
+                stream[1].close()
+                stream = await self._open(key)
+                response, keep_alive = await self._exchange(stream, False, key[1], method, target, body, headers)
+        except BaseException:
+            stream[1].close()
+            raise
+        if keep_alive:
+            self._release(key, stream)
+        else:
+            stream[1].close()
+        return response
+
+    # -- requests -----------------------------------------------------------
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        body: bytes | None = None,
+        headers: dict[str, str] | None = None,
+        idempotent: bool | None = None,
+    ) -> GatewayResponse:
+        """Async ``GatewayHTTPClient.request``: same retry and error rules."""
+
+        method = method.upper()
+        parts = urlsplit(url)
+        scheme = parts.scheme or "https"
+        port = parts.port or (443 if scheme == "https" else 80)
+        key = (scheme, parts.hostname or "", port)
+        target = parts.path or "/"
+        if parts.query:
+            target = f"{target}?{parts.query}"
+
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        attempts_allowed = 1 + (self.max_retries if idempotent else 0)
+
+        started = time.perf_counter()
+        attempt = 0
+        status: int | None = None
+        error = ""
+        try:
+            while True:
+                attempt += 1
+                try:
+                    response = await asyncio.wait_for(
+                        self._send_once(key, method, target, body, headers or {}, idempotent), self.timeout
+                    )
+                except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as exc:
+                    error = f"{type(exc).__name__}: {exc}"
+                    if attempt >= attempts_allowed:
+                        raise GatewayHTTPError(f"{method} {url} failed: {error}") from exc
+                else:
+                    status = response.status
+                    if status < 400:
+                        error = ""
+                        return response
+                    error = f"HTTP {status}"
+                    if status not in RETRY_STATUSES or attempt >= attempts_allowed:
+                        raise GatewayHTTPError(f"{method} {url} returned {status}", status, response.body)
+                # Full jitter, as in the sync client.
+                await asyncio.sleep(random.uniform(0, min(self.max_backoff, self.backoff * (2 ** (attempt - 1)))))
+        finally:
+            record_call(
+                self.calls,
+                CallRecord(key[1], method, parts.path, status, attempt, time.perf_counter() - started, error),
+            )
+
+    async def post_json(self, url: str, payload: Any, headers: dict[str, str] | None = None, **kwargs) -> GatewayResponse:
+        all_headers = {"Content-Type": "application/json", **(headers or {})}
+        return await self.request("POST", url, body=json.dumps(payload).encode(), headers=all_headers, **kwargs)
+
+
+_async_client: AsyncGatewayHTTPClient | None = None
+
+
+def get_async_gateway_client() -> AsyncGatewayHTTPClient:
+    """Return the process-wide async client.
+
+    It takes its timeout and retry settings from the synchronous client and
+    appends to the same ``calls`` history, so latency reporting sees both.
+    """
+
+    global _async_client
+    if _async_client is None:
+        sync_client = get_gateway_client()
+        _async_client = AsyncGatewayHTTPClient(
+            timeout=sync_client.timeout,
+            max_retries=sync_client.max_retries,
+            backoff=sync_client.backoff,
+            max_backoff=sync_client.max_backoff,
+            calls=sync_client.calls,
+        )
+    return _async_client
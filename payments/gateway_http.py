@@ -0,0 +1,252 @@
+"""Small pooled HTTP client shared by the payment gateway helpers.
+
+Still stdlib-only (``http.client``), like the rest of ``payments.utils``, but
+connections are kept alive and reused per host instead of paying a new TLS
+handshake on every ``urlopen`` call. Idempotent calls are retried a bounded
+number of times with jittered exponential backoff, and every call's latency is
+recorded so it can be inspected or exported later.
+"""
+from __future__ import annotations
+
+import http.client
+import json
+import os
+import queue
+import random
+import ssl
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Callable
+from urllib.parse import urlsplit
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Errors that mean a reused keep-alive socket was closed by the server. If it
+# happened while sending, the request never arrived and is replayed on a fresh
+# connection; once sent, the server may have processed it, so only idempotent
+# requests are replayed.
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+
+class GatewayHTTPError(Exception):
+    """Raised when a gateway call fails after all allowed attempts."""
+
+    def __init__(self, message: str, status: int | None = None, body: bytes = b"") -> None:
+        super().__init__(message)
+        self.status = status
+        self.body = body
+
+
+@dataclass
+class GatewayResponse:
+    status: int
+    headers: dict[str, str]
+    body: bytes
+
+    def json(self) -> Any:
+        return json.loads(self.body.decode() or "{}")
+
+
+@dataclass(frozen=True)
+class CallRecord:
+    """Latency record for a single logical gateway call (all attempts)."""
+
+    host: str
+    method: str
+    path: str
+    status: int | None
+    attempts: int
+    elapsed: float
+    error: str = ""
+
+
+# Set by request instrumentation (core.instrumentation) to see the gateway
+# calls made on behalf of the current request; called with each CallRecord.
+call_listener: ContextVar[Callable[[CallRecord], None] | None] = ContextVar("gateway_call_listener", default=None)
+
+
+def record_call(calls: deque[CallRecord], record: CallRecord) -> None:
+    calls.append(record)
+    listener = call_listener.get()
+    if listener is not None:
+        listener(record)
+
+
+class GatewayHTTPClient:
+    """Keep-alive HTTP(S) client with one small connection pool per host."""
+
+    def __init__(
+        self,
+        timeout: float = 10.0,
+        max_retries: int = 2,
+        backoff: float = 0.2,
+        max_backoff: float = 2.0,
+        pool_size: int = 4,
+        history_size: int = 256,
+    ) -> None:
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.pool_size = pool_size
+        self.calls: deque[CallRecord] = deque(maxlen=history_size)
+        self._pools: dict[tuple[str, str, int], queue.LifoQueue] = {}
+        self._pools_lock = threading.Lock()
+        self._ssl_context = ssl.create_default_context()
+
+    # -- connection pooling -------------------------------------------------
+
+    def _pool(self, key: tuple[str, str, int]) -> queue.LifoQueue:
+        pool = self._pools.get(key)
+        if pool is None:
+            with self._pools_lock:
+                pool = self._pools.setdefault(key, queue.LifoQueue(maxsize=self.pool_size))
+        return pool
+
+    def _acquire(self, key: tuple[str, str, int]) -> tuple[http.client.HTTPConnection, bool]:
+        try:
+            return self._pool(key).get_nowait(), True
+        except queue.Empty:
+            scheme, host, port = key
+            if scheme == "https":
+                conn = http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self._ssl_context)
+            else:
+                conn = http.client.HTTPConnection(host, port, timeout=self.timeout)
+            return conn, False
+
+    def _release(self, key: tuple[str, str, int], conn: http.client.HTTPConnection) -> None:
+        try:
+            self._pool(key).put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self) -> None:
+        """Close every pooled connection."""
+
+        with self._pools_lock:
+            pools = list(self._pools.values())
+            self._pools.clear()
+        for pool in pools:
+            while True:
+                try:
+                    pool.get_nowait().close()
+                except queue.Empty:
+                    break
+
+    # -- requests -----------------------------------------------------------
+
+    def _send_once(self, key, method, target, body, headers, idempotent) -> GatewayResponse:
+        conn, reused = self._acquire(key)
+        try:
+            sent = False
+            try:
+                conn.request(method, target, body=body, headers=headers)
+                sent = True
+                resp = conn.getresponse()
+            except STALE_CONNECTION_ERRORS:
+                if not reused or (sent and not idempotent):
+                    raise
+                conn.close()
+                conn.request(method, target, body=body, headers=headers)
+                resp = conn.getresponse()
+            data = resp.read()
+        except BaseException:
+            conn.close()
+            raise
+        if resp.will_close:
+            conn.close()
+        else:
+            self._release(key, conn)
+        return GatewayResponse(resp.status, {k.lower(): v for k, v in resp.getheaders()}, data)
+
+    def _sleep_before_retry(self, attempt: int) -> None:
+        # "Full jitter" backoff: uniform in [0, min(cap, base * 2**attempt)].
+        time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt))))
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        body: bytes | None = None,
+        headers: dict[str, str] | None = None,
+        idempotent: bool | None = None,
+    ) -> GatewayResponse:
+        """Send a request and return the response for any 2xx/3xx status.
+
+        ``idempotent`` defaults to the HTTP method semantics; pass ``True`` for
+        POSTs that are safe to replay (token requests, calls carrying an
+        idempotency key). Non-idempotent calls are attempted exactly once.
+        """
+
+        method = method.upper()
+        parts = urlsplit(url)
+        scheme = parts.scheme or "https"
+        port = parts.port or (443 if scheme == "https" else 80)
+        key = (scheme, parts.hostname or "", port)
+        target = parts.path or "/"
+        if parts.query:
+            target = f"{target}?{parts.query}"
+
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        attempts_allowed = 1 + (self.max_retries if idempotent else 0)
+
+        started = time.perf_counter()
+        attempt = 0
+        status: int | None = None
+        error = ""
+        try:
+            while True:
+                attempt += 1
+                try:
+                    response = self._send_once(key, method, target, body, headers or {}, idempotent)
+                except (OSError, http.client.HTTPException) as exc:
+                    error = f"{type(exc).__name__}: {exc}"
+                    if attempt >= attempts_allowed:
+                        raise GatewayHTTPError(f"{method} {url} failed: {error}") from exc
+                else:
+                    status = response.status
+                    if status < 400:
+                        error = ""
+                        return response
+                    error = f"HTTP {status}"
+                    if status not in RETRY_STATUSES or attempt >= attempts_allowed:
+                        raise GatewayHTTPError(f"{method} {url} returned {status}", status, response.body)
+                self._sleep_before_retry(attempt - 1)
+        finally:
+            record_call(
+                self.calls,
+                CallRecord(key[1], method, parts.path, status, attempt, time.perf_counter() - started, error),
+            )
+
+    def post_json(self, url: str, payload: Any, headers: dict[str, str] | None = None, **kwargs) -> GatewayResponse:
+        all_headers = {"Content-Type": "application/json", **(headers or {})}
+        return self.request("POST", url, body=json.dumps(payload).encode(), headers=all_headers, **kwargs)
+
+
+_client: GatewayHTTPClient | None = None
+_client_lock = threading.Lock()
+
+
+def get_gateway_client() -> GatewayHTTPClient:
+    """Return the process-wide client, configured from the environment.
+
+    Optional environment variables:
+      - PAYMENT_GATEWAY_TIMEOUT (seconds, default 10)
+      - PAYMENT_GATEWAY_MAX_RETRIES (default 2, idempotent calls only)
+    """
+
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = GatewayHTTPClient(
+                    timeout=float(os.getenv("PAYMENT_GATEWAY_TIMEOUT", "10")),
+                    max_retries=int(os.getenv("PAYMENT_GATEWAY_MAX_RETRIES", "2")),
+                )
+    return _client
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+from datetime import timedelta
+
+from jobs.registry import enqueue, job
+from .expiry import EXPIRE_JOB, expire_stale_orders
+from .reconcile import RECONCILE_JOB, reconcile_payments
+from .webhooks import PROCESS_JOB, process_pending_events
+
+
+@job(PROCESS_JOB, queue="webhooks", priority=20)
+def process_webhooks(batch_size: int = 100) -> None:
+    """Drain stored webhook events."""
+
+    while process_pending_events(batch_size):
+        pass
+
+
+@job(EXPIRE_JOB, queue="maintenance")
+def expire_orders(check_gateway: bool = True, every_minutes: int = 60) -> None:
+    """Cancel abandoned checkouts, then schedule the next sweep."""
+
+    expire_stale_orders(check_gateway=check_gateway)
+    enqueue(
+        EXPIRE_JOB,
+        {"check_gateway": check_gateway, "every_minutes": every_minutes},
+        delay=timedelta(minutes=every_minutes),
+        unique_key=EXPIRE_JOB,
+    )
+
+
+@job(RECONCILE_JOB, queue="maintenance", priority=5)
+def reconcile(older_than_minutes: float = 30, every_minutes: int = 15) -> None:
+    """Apply payments settled on the gateway whose webhook never arrived, then reschedule."""
+
+    reconcile_payments(timedelta(minutes=older_than_minutes))
+    enqueue(
+        RECONCILE_JOB,
+        {"older_than_minutes": older_than_minutes, "every_minutes": every_minutes},
+        delay=timedelta(minutes=every_minutes),
+        unique_key=RECONCILE_JOB,
+    )
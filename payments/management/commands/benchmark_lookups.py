@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from orders.models import Order
+from payments.models import Payment
+from services.models import ServicePackage
+
+BATCH_SIZE = 5000
+
+# Indexes/constraints added for the hot paths, removed for the "before" run.
+BENCHMARKED_INDEXES = (
+    "order_status_created_idx",
+    "order_user_created_idx",
+    "payment_provider_id_idx",
+    "payment_status_created_idx",
+)
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed N orders/payments inside a transaction, then report query plans and "
+        "timings for the hot lookups with and without their indexes. Nothing is kept."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=100_000)
+        parser.add_argument("--repeat", type=int, default=200, help="Executions per query and phase.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                lookups = self._seed(options["rows"])
+                self._run("with indexes", lookups, options["repeat"])
+                with transaction.atomic():
+                    self._drop_indexes()
+                    self._run("without indexes", lookups, options["repeat"])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _seed(self, rows: int) -> dict:
+        self.stdout.write(f"Seeding {rows} orders and payments on {connection.vendor}...")
+        package = ServicePackage.objects.create(
+            slug="benchmark-lookups", name_es="Benchmark", short_description_es="", price_mxn=Decimal("1")
+        )
+        users = get_user_model().objects.bulk_create(
+            [get_user_model()(username=f"benchmark-{i}", email=f"benchmark-{i}@example.com") for i in range(100)]
+        )
+        statuses = [value for value, _ in Order.STATUS_CHOICES]
+        rng = random.Random(42)
+
+        for start in range(0, rows, BATCH_SIZE):
+            count = min(BATCH_SIZE, rows - start)
+            orders = Order.objects.bulk_create(
+                [
+                    Order(
+                        package=package,
+                        customer_name="Benchmark",
+                        email="benchmark@example.com",
+                        amount=Decimal("1"),
+                        status=rng.choice(statuses),
+                        user=rng.choice(users),
+                    )
+                    for _ in range(count)
+                ]
+            )
+            Payment.objects.bulk_create(
+                [
+                    Payment(
+                        order=order,
+                        method="paypal" if (start + i) % 2 else "coinbase",
+                        amount=Decimal("1"),
+                        status="pending",
+                        provider_payment_id=f"BENCH-{start + i}",
+                    )
+                    for i, order in enumerate(orders)
+                ]
+            )
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+        return {"provider_id": f"BENCH-{rows - 1}", "method": "paypal" if (rows - 1) % 2 else "coinbase",
+                "user": users[0]}
+
+    def _drop_indexes(self) -> None:
+        # DROP INDEX is transactional on SQLite and Postgres, unlike the
+        # SQLite schema editor which refuses to run inside atomic().
+        with connection.cursor() as cursor:
+            for name in BENCHMARKED_INDEXES:
+                cursor.execute(f"DROP INDEX {connection.ops.quote_name(name)}")
+
+    def _run(self, phase: str, lookups: dict, repeat: int) -> None:
+        queries = {
+            "webhook payment lookup": Payment.objects.filter(
+                provider_payment_id=lookups["provider_id"], method=lookups["method"]
+            ),
+            "latest paid order": Order.objects.filter(status="paid").order_by("-created_at")[:1],
+            "user order history": Order.objects.filter(user=lookups["user"]).order_by("-created_at")[:20],
+        }
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\n== {phase} =="))
+        for label, queryset in queries.items():
+            started = time.perf_counter()
+            for _ in range(repeat):
+                list(queryset.all())
+            elapsed_ms = (time.perf_counter() - started) * 1000 / repeat
+            self.stdout.write(f"{label}: {elapsed_ms:.3f} ms/query")
+            for line in self._explain(queryset, phase):
+                self.stdout.write(f"    {line}")
+
+    def _explain(self, queryset, phase: str) -> list[str]:
+        sql, params = queryset.query.sql_with_params()
+        prefix = "EXPLAIN QUERY PLAN" if connection.vendor == "sqlite" else "EXPLAIN"
+        # The phase comment keeps sqlite3's statement cache from returning the
+        # plan prepared before the indexes were dropped.
+        with connection.cursor() as cursor:
+            cursor.execute(f"{prefix} /* {phase} */ {sql}", params)
+            return [" ".join(str(col) for col in row) for row in cursor.fetchall()]
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from jobs.registry import enqueue
+from payments.expiry import EXPIRE_JOB, expire_stale_orders
+
+
+class Command(BaseCommand):
+    help = "Cancel pending orders (and their open payments) older than a TTL, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ttl-hours",
+            type=float,
+            default=None,
+            help=f"Age after which a pending order is cancelled (default ALTIQ_ORDER_TTL_HOURS, "
+            f"currently {settings.ALTIQ_ORDER_TTL_HOURS:g}).",
+        )
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--check-gateway",
+            action="store_true",
+            help="Look up open payments on PayPal/Coinbase first and complete the ones already paid.",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Only count the orders that would be swept.")
+        parser.add_argument(
+            "--schedule",
+            action="store_true",
+            help="Queue the recurring sweep job (with --check-gateway) for runworker instead of sweeping now.",
+        )
+
+    def handle(self, *args, **options):
+        if options["schedule"]:
+            enqueue(EXPIRE_JOB, {"check_gateway": options["check_gateway"]}, unique_key=EXPIRE_JOB)
+            self.stdout.write(self.style.SUCCESS(f"Queued {EXPIRE_JOB}."))
+            return
+
+        ttl = None if options["ttl_hours"] is None else timedelta(hours=options["ttl_hours"])
+        counts = expire_stale_orders(
+            ttl,
+            batch_size=options["batch_size"],
+            check_gateway=options["check_gateway"],
+            dry_run=options["dry_run"],
+        )
+        if options["dry_run"]:
+            self.stdout.write(f"{counts['cancelled']} stale pending order(s) would be swept.")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Orders: cancelled={counts['cancelled']}, paid={counts['paid']}, skipped={counts['skipped']}"
+        ))
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from payments.models import WebhookEvent
+from payments.webhooks import process_pending_events, requeue_events
+
+
+class Command(BaseCommand):
+    help = "Process stored PayPal/Coinbase webhook events in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--loop", action="store_true", help="Keep polling for new events instead of exiting when drained."
+        )
+        parser.add_argument("--sleep", type=float, default=1.0, help="Seconds to wait between polls with --loop.")
+        replay = parser.add_argument_group("replay")
+        replay.add_argument(
+            "--replay", action="store_true", help="Requeue already stored events before processing."
+        )
+        replay.add_argument("--provider", choices=[value for value, _ in WebhookEvent.PROVIDER_CHOICES])
+        replay.add_argument("--event-id", action="append", dest="event_ids", default=[])
+        replay.add_argument("--status", action="append", dest="statuses", default=[])
+        replay.add_argument("--since-hours", type=float, help="Only replay events received in the last N hours.")
+
+    def handle(self, *args, **options):
+        if options["replay"]:
+            queryset = WebhookEvent.objects.all()
+            if options["provider"]:
+                queryset = queryset.filter(provider=options["provider"])
+            if options["event_ids"]:
+                queryset = queryset.filter(event_id__in=options["event_ids"])
+            if options["statuses"]:
+                queryset = queryset.filter(status__in=options["statuses"])
+            if options["since_hours"] is not None:
+                queryset = queryset.filter(received_at__gte=timezone.now() - timedelta(hours=options["since_hours"]))
+            self.stdout.write(f"Requeued {requeue_events(queryset)} event(s).")
+
+        totals: dict[str, int] = {}
+        while True:
+            counts = process_pending_events(options["batch_size"])
+            for outcome, count in counts.items():
+                totals[outcome] = totals.get(outcome, 0) + count
+            if counts:
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["sleep"])
+
+        summary = ", ".join(f"{outcome}={count}" for outcome, count in sorted(totals.items())) or "nothing to do"
+        self.stdout.write(self.style.SUCCESS(f"Webhook events: {summary}"))
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from jobs.registry import enqueue
+from payments.reconcile import RECONCILE_JOB, reconcile_payments
+
+
+class Command(BaseCommand):
+    help = (
+        "Look up pending payments on PayPal/Coinbase in parallel and apply the ones the gateway already "
+        "settled (missed webhooks). Point PAYPAL_ENV/COINBASE_ENV at the simulator to try it locally."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-minutes", type=float, default=30, help="Only payments pending for at least this long."
+        )
+        parser.add_argument("--workers", type=int, default=4, help="Parallel gateway lookups.")
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument("--limit", type=int, help="Stop after this many lookups.")
+        parser.add_argument("--dry-run", action="store_true", help="Look up and report, but change nothing.")
+        parser.add_argument(
+            "--schedule", action="store_true", help="Queue the recurring reconciliation job for runworker instead."
+        )
+
+    def handle(self, *args, **options):
+        older_than = timedelta(minutes=options["older_than_minutes"])
+        if options["schedule"]:
+            enqueue(RECONCILE_JOB, {"older_than_minutes": options["older_than_minutes"]}, unique_key=RECONCILE_JOB)
+            self.stdout.write(self.style.SUCCESS(f"Queued {RECONCILE_JOB}."))
+            return
+
+        stats = reconcile_payments(
+            older_than,
+            workers=options["workers"],
+            batch_size=options["batch_size"],
+            limit=options["limit"],
+            dry_run=options["dry_run"],
+        )
+        prefix = "Dry run: " if options["dry_run"] else ""
+        style = self.style.WARNING if stats.errors else self.style.SUCCESS
+        self.stdout.write(style(f"{prefix}Reconciliation: {stats.summary()}"))
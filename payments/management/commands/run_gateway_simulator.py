@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments.simulator import DEFAULT_PORT, GatewaySimulator, SimulatorConfig
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local PayPal/Coinbase stand-in with configurable latency, errors and webhook "
+        "delivery patterns. Point the site at it with PAYPAL_ENV=simulator and COINBASE_ENV=simulator."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+        api = parser.add_argument_group("API behaviour")
+        api.add_argument("--latency", type=float, default=0.0, help="Seconds added to every API call.")
+        api.add_argument("--jitter", type=float, default=0.0, help="Extra random latency, up to this many seconds.")
+        api.add_argument("--error-rate", type=float, default=0.0, help="Fraction of API calls answered with 503.")
+        api.add_argument("--timeout-rate", type=float, default=0.0, help="Fraction of API calls that hang.")
+        api.add_argument("--hang-seconds", type=float, default=15.0, help="How long hanging calls hang.")
+        hooks = parser.add_argument_group("payments and webhooks")
+        hooks.add_argument(
+            "--webhook-target", help="Site base URL receiving webhooks, e.g. http://127.0.0.1:8000 (default: none)."
+        )
+        hooks.add_argument(
+            "--auto-complete", type=float, help="Complete payments this many seconds after creation "
+            "instead of waiting for the approval page."
+        )
+        hooks.add_argument("--abandon-rate", type=float, default=0.0, help="Fraction of payments never completed.")
+        hooks.add_argument("--decline-rate", type=float, default=0.0, help="Fraction of Coinbase charges that fail.")
+        hooks.add_argument("--webhook-delay", type=float, default=0.0, help="Seconds before webhooks are sent.")
+        hooks.add_argument("--duplicate-rate", type=float, default=0.0, help="Fraction of webhooks sent twice.")
+        hooks.add_argument(
+            "--out-of-order-rate", type=float, default=0.0, help="Fraction of payments whose events arrive reversed."
+        )
+        hooks.add_argument("--burst-size", type=int, default=1, help="Deliver webhooks in bursts of this size.")
+        hooks.add_argument("--burst-window", type=float, default=1.0, help="Max seconds to hold a partial burst.")
+        hooks.add_argument(
+            "--paypal-webhook-id",
+            default=os.getenv("PAYPAL_WEBHOOK_ID"),
+            help="Sign PayPal webhooks for this webhook id (default PAYPAL_WEBHOOK_ID).",
+        )
+        hooks.add_argument(
+            "--coinbase-webhook-secret",
+            default=os.getenv("COINBASE_COMMERCE_WEBHOOK_SECRET"),
+            help="Sign Coinbase webhooks with this shared secret (default COINBASE_COMMERCE_WEBHOOK_SECRET).",
+        )
+        parser.add_argument("--seed", type=int, help="Random seed for reproducible runs.")
+
+    def handle(self, *args, **options):
+        config = SimulatorConfig(
+            latency=options["latency"],
+            jitter=options["jitter"],
+            error_rate=options["error_rate"],
+            timeout_rate=options["timeout_rate"],
+            hang_seconds=options["hang_seconds"],
+            webhook_target=(options["webhook_target"] or "").rstrip("/") or None,
+            auto_complete=options["auto_complete"],
+            abandon_rate=options["abandon_rate"],
+            decline_rate=options["decline_rate"],
+            webhook_delay=options["webhook_delay"],
+            duplicate_rate=options["duplicate_rate"],
+            out_of_order_rate=options["out_of_order_rate"],
+            burst_size=max(1, options["burst_size"]),
+            burst_window=options["burst_window"],
+            seed=options["seed"],
+            paypal_webhook_id=options["paypal_webhook_id"],
+            coinbase_webhook_secret=options["coinbase_webhook_secret"],
+        )
+        with GatewaySimulator(config, options["host"], options["port"]) as simulator:
+            self.stdout.write(f"Gateway simulator listening on {simulator.base_url}")
+            self.stdout.write(
+                f"Use PAYPAL_ENV=simulator COINBASE_ENV=simulator PAYMENT_SIMULATOR_URL={simulator.base_url}"
+            )
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                pass
+            webhooks = simulator.webhooks
+        self.stdout.write(
+            f"orders={len(simulator.paypal_orders)} charges={len(simulator.coinbase_charges)} "
+            f"webhooks sent={webhooks.sent} failed={webhooks.failed}"
+        )
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.26 on 2026-10-18 08:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0003_payment_payment_provider_id_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='approval_url',
+            field=models.URLField(blank=True, max_length=500),
+        ),
+    ]
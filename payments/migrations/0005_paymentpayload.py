@@ -0,0 +1,29 @@
+# Generated by Django 4.2.26 on 2026-10-18 08:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0004_payment_approval_url'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentPayload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('webhook', 'Webhook'), ('reconcile', 'Reconciliation'), ('legacy', 'Payment.raw_payload')], max_length=20)),
+                ('data', models.BinaryField()),
+                ('size', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('payment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payloads', to='payments.payment')),
+            ],
+            options={
+                'ordering': ['-id'],
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+"""Move Payment.raw_payload into compressed PaymentPayload rows.
+
+Non-atomic on purpose: each batch commits on its own, so a large payments
+table is never locked for the whole backfill and an interrupted run resumes
+where it stopped (moved rows have raw_payload set to NULL).
+"""
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import migrations, transaction
+
+BATCH_SIZE = 500
+
+
+def archive_payloads(apps, schema_editor):
+    Payment = apps.get_model("payments", "Payment")
+    PaymentPayload = apps.get_model("payments", "PaymentPayload")
+    pending = Payment.objects.filter(raw_payload__isnull=False).order_by("pk")
+    last_pk = 0
+    while True:
+        rows = list(pending.filter(pk__gt=last_pk).values_list("pk", "raw_payload", "updated_at")[:BATCH_SIZE])
+        if not rows:
+            break
+        last_pk = rows[-1][0]
+        archived = []
+        for pk, payload, updated_at in rows:
+            raw = json.dumps(payload, separators=(",", ":"), cls=DjangoJSONEncoder).encode()
+            archived.append(PaymentPayload(
+                payment_id=pk, source="legacy", data=zlib.compress(raw), size=len(raw), created_at=updated_at
+            ))
+        with transaction.atomic():
+            PaymentPayload.objects.bulk_create(archived)
+            Payment.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(raw_payload=None)
+
+
+def restore_payloads(apps, schema_editor):
+    Payment = apps.get_model("payments", "Payment")
+    PaymentPayload = apps.get_model("payments", "PaymentPayload")
+    legacy = PaymentPayload.objects.filter(source="legacy").order_by("pk")
+    for payload in legacy.iterator(chunk_size=BATCH_SIZE):
+        Payment.objects.filter(pk=payload.payment_id).update(raw_payload=json.loads(zlib.decompress(payload.data)))
+    legacy.delete()
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('payments', '0005_paymentpayload'),
+    ]
+
+    operations = [
+        migrations.RunPython(archive_payloads, restore_payloads),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.26 on 2026-10-18 08:54
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0006_archive_raw_payloads'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='payment',
+            name='raw_payload',
+        ),
+    ]
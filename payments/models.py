@@ -1,6 +1,12 @@
 from __future__ import annotations
 
+import json
+import zlib
+from typing import Any
+
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.utils import timezone
 
 from orders.models import Order
 
@@ -28,18 +34,107 @@ class Payment(models.Model):
     # External gateway identifiers
     provider_payment_id = models.CharField(max_length=120, blank=True)
     provider_session_id = models.CharField(max_length=120, blank=True)
+    # Where the customer was sent to pay; replayed for repeated submissions.
+    approval_url = models.URLField(max_length=500, blank=True)
 
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     currency = models.CharField(max_length=10, default="MXN")
 
-    raw_payload = models.JSONField(blank=True, null=True)
-
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # Webhook lookups by gateway id. Kept non-unique (and non-partial)
+            # because payments without an id yet share the blank value.
+            models.Index(fields=["method", "provider_payment_id"], name="payment_provider_id_idx"),
+            models.Index(fields=["status", "created_at"], name="payment_status_created_idx"),
+        ]
 
     def __str__(self) -> str:  # pragma: no cover
         return f"Payment #{self.pk} ({self.method}) - {self.status}"
 
+
+class PaymentPayload(models.Model):
+    """Raw gateway JSON for a Payment, kept out of the hot payments table.
+
+    Append-only: every webhook or reconciliation that updates a payment adds
+    a row instead of rewriting the payment. The JSON is stored zlib-
+    compressed and only decompressed on demand (``load()``).
+    """
+
+    SOURCE_CHOICES = [
+        ("webhook", "Webhook"),
+        ("reconcile", "Reconciliation"),
+        ("legacy", "Payment.raw_payload"),
+    ]
+
+    payment = models.ForeignKey(Payment, on_delete=models.CASCADE, related_name="payloads")
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    data = models.BinaryField()
+    # Uncompressed size in bytes.
+    size = models.PositiveIntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["-id"]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"Payload #{self.pk} for payment {self.payment_id} ({self.source})"
+
+    @classmethod
+    def build(cls, payment_id: int, payload: Any, source: str) -> "PaymentPayload":
+        raw = json.dumps(payload, separators=(",", ":"), cls=DjangoJSONEncoder).encode()
+        return cls(payment_id=payment_id, source=source, data=zlib.compress(raw), size=len(raw))
+
+    def load(self) -> Any:
+        return json.loads(zlib.decompress(self.data))
+
+
+class WebhookEvent(models.Model):
+    """Raw gateway webhook delivery, stored before any processing happens.
+
+    Webhook endpoints only insert a row here (deduplicated on the provider's
+    event id) and acknowledge; ``payments.webhooks`` applies the payment/order
+    transitions later. Rows are never deleted so events can be replayed for
+    recovery.
+    """
+
+    PROVIDER_CHOICES = Payment.METHOD_CHOICES
+
+    STATUS_CHOICES = [
+        ("pending", "Pending"),
+        ("processing", "Processing"),
+        ("processed", "Processed"),
+        ("ignored", "Ignored"),
+        ("failed", "Failed"),
+    ]
+
+    provider = models.CharField(max_length=20, choices=PROVIDER_CHOICES)
+    # Provider event id, or a hash of the body when the provider sends none.
+    event_id = models.CharField(max_length=120)
+    event_type = models.CharField(max_length=120, blank=True)
+    payload = models.JSONField()
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # While "processing": when it was claimed. Claims older than
+    # payments.webhooks.CLAIM_LEASE are taken over by the next processor.
+    claimed_at = models.DateTimeField(blank=True, null=True)
+
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ["id"]
+        constraints = [
+            models.UniqueConstraint(fields=["provider", "event_id"], name="uniq_webhook_event_per_provider"),
+        ]
+        indexes = [
+            models.Index(fields=["status", "id"], name="webhook_event_status_idx"),
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.provider} event {self.event_id} - {self.status}"
@@ -0,0 +1,231 @@
+"""Reconcile pending payments with PayPal / Coinbase (``manage.py reconcile_payments``).
+
+A webhook that never arrives leaves its payment "pending" and the order
+unpaid. ``reconcile_payments`` walks the pending payments older than a
+cutoff along ``payment_status_created_idx`` in batches, looks each one up
+on its gateway from a bounded thread pool sharing one keep-alive
+connection pool, and applies each batch's settled payments in a single
+transaction with bulk statements. Fulfilment (codes and the thank-you
+email) runs for every order the correction moved to "paid", exactly as
+the webhook would have. Payments the order sweeper (``payments.expiry``)
+failed are looked up too for ``SWEPT_LOOKBACK`` after the sweep, since a
+capture can race it; their cancelled orders are then reopened as paid.
+
+Lookups still go through ``payments.resilience``: they count against the
+gateway's bulkhead and an open circuit makes them fail fast, so a run never
+crowds out checkouts or hammers a gateway that is down. Failed lookups are
+reported and simply retried on the next run.
+"""
+from __future__ import annotations
+
+import logging
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from orders.emails import send_order_thank_you_email_with_codes
+from orders.models import Order
+from .gateway_http import GatewayHTTPClient, GatewayHTTPError, get_gateway_client
+from .models import Payment, PaymentPayload
+from .transitions import ORDER_TRANSITIONS, PAYMENT_TRANSITIONS, transition_order
+from .utils import GatewayUnavailableError, PaymentGatewayError, get_coinbase_charge, get_paypal_order
+from .webhooks import gateway_state
+
+logger = logging.getLogger(__name__)
+
+# Recurring job (payments/jobs.py) that runs reconciliation.
+RECONCILE_JOB = "payments.reconcile"
+
+LOOKUPS = {
+    "paypal": get_paypal_order,
+    "coinbase": get_coinbase_charge,
+}
+# How long after the order sweeper failed a payment it keeps being looked up:
+# about one sweep interval (payments/jobs.py). The sweeper already asked the
+# gateway before cancelling, so only a capture racing the sweep is left.
+SWEPT_LOOKBACK = timedelta(hours=1)
+# gateway state -> (payment status, order status)
+CORRECTIONS = {
+    "paid": ("completed", "paid"),
+    "failed": ("failed", "failed"),
+}
+
+
+@dataclass
+class ReconcileStats:
+    checked: int = 0
+    # Payments moved by this run (not those a webhook settled meanwhile).
+    paid: int = 0
+    failed: int = 0
+    still_open: int = 0
+    errors: Counter = field(default_factory=Counter)
+    latencies: list[float] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Gateway lookups per second."""
+
+        return self.checked / self.elapsed if self.elapsed else 0.0
+
+    def latency_ms(self, quantile: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))] * 1000
+
+    def summary(self) -> str:
+        errors = ", ".join(f"{reason}={count}" for reason, count in self.errors.most_common()) or "none"
+        return (
+            f"checked={self.checked} paid={self.paid} failed={self.failed} open={self.still_open} "
+            f"errors={sum(self.errors.values())} ({errors}) in {self.elapsed:.2f}s, "
+            f"{self.throughput:.1f} lookups/s, p50={self.latency_ms(0.5):.0f}ms p95={self.latency_ms(0.95):.0f}ms"
+        )
+
+
+def pending_payments(older_than: timedelta, now=None):
+    """Open payments with a gateway id created more than ``older_than`` ago, oldest first.
+
+    Besides "pending" ones this includes payments the order sweeper failed
+    (their order is "cancelled") in the last ``SWEPT_LOOKBACK``, which may
+    still settle. The sweep sets their ``updated_at``.
+    """
+
+    now = now or timezone.now()
+    swept = Q(status="failed", order__status="cancelled", updated_at__gte=now - SWEPT_LOOKBACK)
+    return (
+        Payment.objects.filter(Q(status="pending") | swept, created_at__lt=now - older_than)
+        .exclude(provider_payment_id="")
+        .order_by("created_at", "pk")
+    )
+
+
+def _error_reason(exc: PaymentGatewayError) -> str:
+    if isinstance(exc, GatewayUnavailableError):
+        return f"{exc.gateway} unavailable"
+    cause = exc.__cause__
+    if isinstance(cause, GatewayHTTPError):
+        return f"HTTP {cause.status}" if cause.status else "network"
+    return type(cause or exc).__name__
+
+
+def _lookup(row: tuple[int, str, str], client: GatewayHTTPClient):
+    """Fetch one payment from its gateway (runs on a pool thread, no database access)."""
+
+    pk, method, provider_id = row
+    started = time.perf_counter()
+    try:
+        resource = LOOKUPS[method](provider_id, client=client)
+    except PaymentGatewayError as exc:
+        return pk, None, None, _error_reason(exc), time.perf_counter() - started
+    return pk, gateway_state(method, resource), resource, None, time.perf_counter() - started
+
+
+def apply_corrections(settled: dict[int, tuple[str, dict]]) -> dict[str, int]:
+    """Apply gateway outcomes ``{payment pk: (state, resource)}`` in one transaction.
+
+    Per state this is one locking SELECT and one bulk UPDATE for the
+    payments still open (plus one INSERT archiving the fetched payloads),
+    then the same for their orders; payments or
+    orders a webhook already settled are left alone. Returns the number of
+    payments moved per state.
+    """
+
+    counts = {state: 0 for state in CORRECTIONS}
+    now = timezone.now()
+    with transaction.atomic():
+        for state, (payment_status, order_status) in CORRECTIONS.items():
+            ids = [pk for pk, (outcome, _) in settled.items() if outcome == state]
+            if not ids:
+                continue
+            payments = list(
+                Payment.objects.select_for_update()
+                .filter(pk__in=ids, status__in=PAYMENT_TRANSITIONS[payment_status])
+                .only("pk", "order_id")
+            )
+            Payment.objects.filter(pk__in=[payment.pk for payment in payments]).update(
+                status=payment_status, updated_at=now
+            )
+            PaymentPayload.objects.bulk_create(
+                [PaymentPayload.build(payment.pk, settled[payment.pk][1], "reconcile") for payment in payments]
+            )
+
+            orders = list(
+                Order.objects.select_for_update().filter(
+                    pk__in={payment.order_id for payment in payments},
+                    status__in=ORDER_TRANSITIONS[order_status],
+                )
+            )
+            transition_order(Order.objects.filter(pk__in=[order.pk for order in orders]), order_status)
+            if state == "paid":
+                for order in orders:
+                    send_order_thank_you_email_with_codes(order)
+            counts[state] = len(payments)
+    return counts
+
+
+def reconcile_payments(
+    older_than: timedelta = timedelta(minutes=30),
+    *,
+    workers: int = 4,
+    batch_size: int = 200,
+    limit: int | None = None,
+    dry_run: bool = False,
+) -> ReconcileStats:
+    """Look up pending payments on their gateways and apply the settled ones.
+
+    ``workers`` bounds the parallel lookups (and the connections kept open
+    per gateway host). With ``dry_run`` the lookups run but nothing is
+    written; ``paid``/``failed`` then count what would be corrected.
+    """
+
+    stats = ReconcileStats()
+    started = time.perf_counter()
+    shared = get_gateway_client()
+    client = GatewayHTTPClient(timeout=shared.timeout, max_retries=shared.max_retries, pool_size=workers)
+    queryset = pending_payments(older_than)
+    cursor = None
+    try:
+        with ThreadPoolExecutor(workers, thread_name_prefix="altiq-reconcile") as pool:
+            while limit is None or stats.checked < limit:
+                batch = queryset
+                if cursor is not None:
+                    created_at, pk = cursor
+                    batch = batch.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk))
+                size = batch_size if limit is None else min(batch_size, limit - stats.checked)
+                rows = list(batch.values_list("pk", "created_at", "method", "provider_payment_id")[:size])
+                if not rows:
+                    break
+                cursor = (rows[-1][1], rows[-1][0])
+
+                settled: dict[int, tuple[str, dict]] = {}
+                lookups = [(pk, method, provider_id) for pk, _, method, provider_id in rows]
+                for pk, state, resource, error, elapsed in pool.map(lambda row: _lookup(row, client), lookups):
+                    stats.checked += 1
+                    stats.latencies.append(elapsed)
+                    if error is not None:
+                        stats.errors[error] += 1
+                    elif state is None:
+                        stats.still_open += 1
+                    else:
+                        settled[pk] = (state, resource)
+
+                if dry_run:
+                    counts = Counter(state for state, _ in settled.values())
+                else:
+                    counts = apply_corrections(settled) if settled else {}
+                stats.paid += counts.get("paid", 0)
+                stats.failed += counts.get("failed", 0)
+                if len(rows) < size:
+                    break
+    finally:
+        client.close()
+        stats.elapsed = time.perf_counter() - started
+    logger.info("Payment reconciliation%s: %s", " (dry run)" if dry_run else "", stats.summary())
+    return stats
@@ -0,0 +1,321 @@
+"""Circuit breaker and concurrency bulkhead around the payment gateways.
+
+Each gateway ("paypal", "coinbase") gets a ``GatewayGuard``:
+
+* a ``CircuitBreaker`` over the outcome of its last calls. When the failure
+  rate in the window crosses the threshold the circuit opens and calls are
+  rejected immediately; after a cool-down a few trial calls are let through
+  (half-open) and their outcome closes or re-opens it. Breaker state is kept
+  per process: every worker notices an outage within its own window.
+* a ``Bulkhead`` bounding how many calls may be inside the gateway at once.
+  With the Django cache backend the slots are shared by every worker process,
+  so slow gateway responses cannot tie up more than ``limit`` workers.
+
+Rejected calls raise ``GatewayRejected`` without touching the network.
+``gateway_health()`` reports state and counters for monitoring.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from .gateway_http import RETRY_STATUSES, GatewayHTTPError, get_gateway_client
+from .tokens import REFRESH_LOCK_TIMEOUT, DjangoCacheTokenBackend, LocalTokenBackend, TokenBackend
+
+logger = logging.getLogger(__name__)
+
+GATEWAYS = ("paypal", "coinbase")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Most gateway requests made under one guarded call (payments.utils).
+GUARDED_CALLS = 4
+
+
+class GatewayRejected(Exception):
+    """Raised instead of calling a gateway whose circuit is open or bulkhead full."""
+
+    def __init__(self, gateway: str, reason: str) -> None:
+        super().__init__(f"{gateway} gateway unavailable ({reason})")
+        self.gateway = gateway
+        self.reason = reason
+
+
+def is_gateway_failure(exc: BaseException) -> bool:
+    """Whether ``exc`` says something about the gateway's health.
+
+    Timeouts, connection errors and 5xx/429 answers count; 4xx answers (bad
+    request, expired token) and local configuration errors do not.
+    """
+
+    while exc is not None:
+        if isinstance(exc, GatewayHTTPError):
+            return exc.status is None or exc.status in RETRY_STATUSES or exc.status >= 500
+        exc = exc.__cause__
+    return False
+
+
+class CircuitBreaker:
+    """Count-based failure-rate breaker with closed/open/half-open states."""
+
+    def __init__(
+        self,
+        name: str,
+        window: int = 20,
+        failure_rate: float = 0.5,
+        min_calls: int = 10,
+        open_seconds: float = 30.0,
+        half_open_calls: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self._clock = clock
+        self._outcomes: deque[bool] = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trials = 0
+        self.successes = 0
+        self.failures = 0
+        self.rejected = 0
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and self._clock() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._trials = 0
+        return self._state
+
+    def _open(self) -> None:
+        self._state = OPEN
+        self._opened_at = self._clock()
+        self.times_opened += 1
+        logger.warning("Circuit for %s gateway opened", self.name)
+
+    def allow(self) -> bool:
+        """Reserve a call; False (and counted as rejected) if it must not go out."""
+
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self._trials < self.half_open_calls:
+                self._trials += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def release(self) -> None:
+        """Give back a reserved call that never reached the gateway."""
+
+        with self._lock:
+            if self._state == HALF_OPEN and self._trials:
+                self._trials -= 1
+
+    def record(self, success: bool) -> None:
+        with self._lock:
+            if success:
+                self.successes += 1
+            else:
+                self.failures += 1
+            state = self._current_state()
+            if state == HALF_OPEN:
+                if success:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                    logger.info("Circuit for %s gateway closed", self.name)
+                else:
+                    self._open()
+                return
+            if state == OPEN:
+                # A call admitted before the circuit opened; the window is stale.
+                return
+            self._outcomes.append(success)
+            if len(self._outcomes) >= self.min_calls:
+                failed = self._outcomes.count(False)
+                if failed / len(self._outcomes) >= self.failure_rate:
+                    self._open()
+                    self._outcomes.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            state = self._current_state()
+            window = list(self._outcomes)
+            return {
+                "state": state,
+                "window_calls": len(window),
+                "window_failure_rate": round(window.count(False) / len(window), 3) if window else 0.0,
+                "successes": self.successes,
+                "failures": self.failures,
+                "rejected": self.rejected,
+                "times_opened": self.times_opened,
+                "open_for_seconds": round(self._clock() - self._opened_at, 1) if state != CLOSED else 0.0,
+            }
+
+
+class Bulkhead:
+    """At most ``limit`` concurrent calls, tracked as ``limit`` expiring slots.
+
+    Slots are claimed with ``add`` on a token backend (``payments.tokens``), so
+    a Django cache backend shares them across processes, and a slot held by a
+    crashed worker frees itself after ``slot_timeout``. Each claim stores its
+    own token, so a call that outlived its slot cannot free the slot of the
+    call that claimed it next.
+    """
+
+    def __init__(self, name: str, limit: int, backend: TokenBackend, slot_timeout: float) -> None:
+        self.name = name
+        self.limit = limit
+        self.backend = backend
+        self.slot_timeout = slot_timeout
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+
+    def _slot_key(self, slot: int) -> str:
+        return f"payments:bulkhead:{self.name}:{slot}"
+
+    def try_acquire(self) -> tuple[int, str] | None:
+        """Claim a free slot; returns ``(slot, token)`` for ``release``."""
+
+        token = uuid.uuid4().hex
+        # Probe from a random slot so callers do not all contend on slot 0.
+        start = random.randrange(self.limit) if self.limit else 0
+        for offset in range(self.limit):
+            slot = (start + offset) % self.limit
+            if self.backend.add(self._slot_key(slot), token, self.slot_timeout):
+                with self._lock:
+                    self.in_flight += 1
+                return slot, token
+        with self._lock:
+            self.rejected += 1
+        return None
+
+    def release(self, claim: tuple[int, str]) -> None:
+        slot, token = claim
+        key = self._slot_key(slot)
+        # Cache backends have no compare-and-delete; the window between the
+        # two calls is far shorter than the slot timeout.
+        if self.backend.get(key) == token:
+            self.backend.delete(key)
+        with self._lock:
+            self.in_flight -= 1
+
+    def saturated(self) -> bool:
+        return all(self.backend.get(self._slot_key(slot)) is not None for slot in range(self.limit))
+
+    def snapshot(self) -> dict:
+        # Counters are per process even when the slots are shared.
+        return {"limit": self.limit, "in_flight": self.in_flight, "rejected": self.rejected}
+
+
+class GatewayGuard:
+    def __init__(self, name: str, breaker: CircuitBreaker, bulkhead: Bulkhead) -> None:
+        self.name = name
+        self.breaker = breaker
+        self.bulkhead = bulkhead
+
+    def available(self) -> bool:
+        """Cheap pre-check for views: would a call right now be rejected?"""
+
+        return self.breaker.state != OPEN and not self.bulkhead.saturated()
+
+    @contextmanager
+    def call(self) -> Iterator[None]:
+        """Run the body as one guarded gateway call.
+
+        Non-blocking, so it may also wrap ``await`` calls in async helpers.
+        """
+
+        if not self.breaker.allow():
+            raise GatewayRejected(self.name, "circuit open")
+        claim = self.bulkhead.try_acquire()
+        if claim is None:
+            self.breaker.release()
+            raise GatewayRejected(self.name, "too many concurrent calls")
+        try:
+            yield
+        except Exception as exc:
+            if is_gateway_failure(exc):
+                self.breaker.record(False)
+            else:
+                # Not a verdict on gateway health; just free a half-open trial.
+                self.breaker.release()
+            raise
+        else:
+            self.breaker.record(True)
+        finally:
+            self.bulkhead.release(claim)
+
+    def snapshot(self) -> dict:
+        return {"circuit": self.breaker.snapshot(), "bulkhead": self.bulkhead.snapshot()}
+
+
+_guards: dict[str, GatewayGuard] = {}
+_guards_lock = threading.Lock()
+
+
+def get_gateway_guard(name: str) -> GatewayGuard:
+    """Return the process-wide guard for gateway ``name``.
+
+    Optional environment variables:
+      - GATEWAY_BREAKER_WINDOW (calls considered, default 20)
+      - GATEWAY_BREAKER_FAILURE_RATE (0-1, default 0.5)
+      - GATEWAY_BREAKER_MIN_CALLS (calls before the rate counts, default 10)
+      - GATEWAY_BREAKER_OPEN_SECONDS (cool-down before a trial call, default 30)
+      - GATEWAY_MAX_CONCURRENT (calls in flight per gateway, default 10)
+      - GATEWAY_BULKHEAD ("django" (default) to share slots through the Django
+        cache, or "local" to limit each process separately)
+      - GATEWAY_BULKHEAD_CACHE_ALIAS (Django cache alias, default "default")
+    """
+
+    guard = _guards.get(name)
+    if guard is None:
+        with _guards_lock:
+            guard = _guards.get(name)
+            if guard is None:
+                client = get_gateway_client()
+                if os.getenv("GATEWAY_BULKHEAD", "django").lower() == "local":
+                    backend: TokenBackend = LocalTokenBackend()
+                else:
+                    backend = DjangoCacheTokenBackend(os.getenv("GATEWAY_BULKHEAD_CACHE_ALIAS", "default"))
+                breaker = CircuitBreaker(
+                    name,
+                    window=int(os.getenv("GATEWAY_BREAKER_WINDOW", "20")),
+                    failure_rate=float(os.getenv("GATEWAY_BREAKER_FAILURE_RATE", "0.5")),
+                    min_calls=int(os.getenv("GATEWAY_BREAKER_MIN_CALLS", "10")),
+                    open_seconds=float(os.getenv("GATEWAY_BREAKER_OPEN_SECONDS", "30")),
+                )
+                # A slot outlives the longest guarded operation: a PayPal
+                # checkout makes up to GUARDED_CALLS requests (token, order,
+                # refreshed token, order again), each with every attempt
+                # timing out, and may wait out two token refresh locks.
+                request_timeout = client.timeout * (client.max_retries + 1) + client.max_backoff * client.max_retries
+                slot_timeout = GUARDED_CALLS * request_timeout + 2 * REFRESH_LOCK_TIMEOUT
+                bulkhead = Bulkhead(name, int(os.getenv("GATEWAY_MAX_CONCURRENT", "10")), backend, slot_timeout)
+                guard = _guards[name] = GatewayGuard(name, breaker, bulkhead)
+    return guard
+
+
+def gateway_health() -> dict[str, dict]:
+    """State and counters of every gateway guard in this process."""
+
+    return {name: get_gateway_guard(name).snapshot() for name in GATEWAYS}
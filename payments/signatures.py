@@ -0,0 +1,147 @@
+"""Signature checks for incoming PayPal and Coinbase Commerce webhooks.
+
+The webhook views call ``verify_webhook`` on the raw body and headers before
+the body is parsed or the database is touched, so an unsigned or forged
+delivery costs one HMAC/RSA check and a 401, never a write or an email.
+
+* Coinbase Commerce signs the body with HMAC-SHA256 using the endpoint's
+  shared secret (hex in ``X-CC-Webhook-Signature``).
+* PayPal signs ``<transmission id>|<transmission time>|<webhook id>|<crc32
+  of body>`` with SHA256withRSA. The signing certificate is downloaded from
+  ``PAYPAL-CERT-URL``, which must point at PayPal's API hosts over HTTPS
+  (or at the configured PayPal base URL, e.g. the simulator). Instead of
+  calling PayPal's verify-webhook-signature API for every event, the
+  certificate is cached through ``payments.tokens`` until it expires or for
+  ``CERT_CACHE_SECONDS``, and signatures are verified locally. With the
+  default (per-process) cache each process fetches it once; with a shared
+  CACHES backend, once for all of them.
+
+Environment variables:
+  - COINBASE_COMMERCE_WEBHOOK_SECRET (shared secret of the Coinbase endpoint)
+  - PAYPAL_WEBHOOK_ID (id of the webhook registered in the PayPal app)
+"""
+from __future__ import annotations
+
+import base64
+import binascii
+import datetime
+import hashlib
+import hmac
+import os
+import zlib
+from collections.abc import Mapping
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature as BadSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from django.conf import settings
+
+from .gateway_http import GatewayHTTPError, get_gateway_client
+from .tokens import get_token_cache
+from .utils import paypal_base_url
+
+COINBASE_SIGNATURE_HEADER = "X-CC-Webhook-Signature"
+PAYPAL_AUTH_ALGO = "SHA256withRSA"
+PAYPAL_CERT_HOSTS = frozenset({"api.paypal.com", "api-m.paypal.com", "api.sandbox.paypal.com", "api-m.sandbox.paypal.com"})
+PAYPAL_CERT_PATH = "/v1/notifications/certs/"
+# Certificates are fetched again at least this often, even if valid longer.
+CERT_CACHE_SECONDS = 24 * 3600
+
+
+class InvalidSignature(Exception):
+    """Raised when a webhook delivery is unsigned or its signature does not match."""
+
+
+class SignatureUnavailable(Exception):
+    """Raised when the signing certificate cannot be fetched (the gateway retries later)."""
+
+
+def verify_coinbase(body: bytes, headers: Mapping[str, str]) -> None:
+    secret = os.getenv("COINBASE_COMMERCE_WEBHOOK_SECRET")
+    if not secret:
+        raise InvalidSignature("COINBASE_COMMERCE_WEBHOOK_SECRET not configured")
+    signature = headers.get(COINBASE_SIGNATURE_HEADER, "")
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected.encode(), signature.strip().lower().encode()):
+        raise InvalidSignature("Coinbase signature mismatch")
+
+
+def trusted_cert_url(url: str) -> bool:
+    parts = urlsplit(url)
+    if not parts.path.startswith(PAYPAL_CERT_PATH):
+        return False
+    if parts.scheme == "https" and parts.hostname in PAYPAL_CERT_HOSTS and parts.port in (None, 443):
+        return True
+    return url.startswith(paypal_base_url() + PAYPAL_CERT_PATH)
+
+
+@lru_cache(maxsize=16)
+def _load_certificate(pem: str) -> x509.Certificate:
+    return x509.load_pem_x509_certificate(pem.encode())
+
+
+def paypal_certificate(url: str) -> x509.Certificate:
+    """The signing certificate at ``url``, from the token cache when possible."""
+
+    def fetch() -> tuple[str, float]:
+        try:
+            pem = get_gateway_client().request("GET", url).body.decode()
+            certificate = _load_certificate(pem)
+        except (GatewayHTTPError, ValueError) as exc:
+            raise SignatureUnavailable(f"PayPal certificate {url} unavailable: {exc}") from exc
+        remaining = (certificate.not_valid_after_utc - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+        return pem, min(remaining, CERT_CACHE_SECONDS)
+
+    key = "payments:paypal-cert:" + hashlib.sha256(url.encode()).hexdigest()[:32]
+    return _load_certificate(get_token_cache().get_token(key, fetch))
+
+
+def verify_paypal(body: bytes, headers: Mapping[str, str]) -> None:
+    webhook_id = os.getenv("PAYPAL_WEBHOOK_ID")
+    if not webhook_id:
+        raise InvalidSignature("PAYPAL_WEBHOOK_ID not configured")
+    transmission_id = headers.get("PAYPAL-TRANSMISSION-ID", "")
+    transmission_time = headers.get("PAYPAL-TRANSMISSION-TIME", "")
+    signature = headers.get("PAYPAL-TRANSMISSION-SIG", "")
+    cert_url = headers.get("PAYPAL-CERT-URL", "")
+    if not (transmission_id and transmission_time and signature and cert_url):
+        raise InvalidSignature("PayPal transmission headers missing")
+    if headers.get("PAYPAL-AUTH-ALGO", "") != PAYPAL_AUTH_ALGO:
+        raise InvalidSignature("Unsupported PayPal signature algorithm")
+    # Checked before any download, so forged URLs never make us fetch.
+    if not trusted_cert_url(cert_url):
+        raise InvalidSignature(f"Untrusted PayPal certificate URL {cert_url!r}")
+    try:
+        signature_bytes = base64.b64decode(signature, validate=True)
+    except binascii.Error as exc:
+        raise InvalidSignature("PayPal signature is not base64") from exc
+
+    certificate = paypal_certificate(cert_url)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    if not certificate.not_valid_before_utc <= now <= certificate.not_valid_after_utc:
+        raise InvalidSignature("PayPal certificate expired")
+    public_key = certificate.public_key()
+    if not isinstance(public_key, rsa.RSAPublicKey):
+        raise InvalidSignature("PayPal certificate is not RSA")
+
+    message = f"{transmission_id}|{transmission_time}|{webhook_id}|{zlib.crc32(body)}".encode()
+    try:
+        public_key.verify(signature_bytes, message, padding.PKCS1v15(), hashes.SHA256())
+    except BadSignature as exc:
+        raise InvalidSignature("PayPal signature mismatch") from exc
+
+
+VERIFIERS = {
+    "paypal": verify_paypal,
+    "coinbase": verify_coinbase,
+}
+
+
+def verify_webhook(provider: str, body: bytes, headers: Mapping[str, str]) -> None:
+    """Raise ``InvalidSignature``/``SignatureUnavailable`` unless the delivery is authentic."""
+
+    if settings.ALTIQ_WEBHOOK_VERIFY:
+        VERIFIERS[provider](body, headers)
@@ -0,0 +1,475 @@
+"""Local PayPal / Coinbase Commerce simulator for load and latency testing.
+
+Implements the gateway endpoints ``payments.utils`` calls (OAuth token,
+order creation and lookup, charge creation and lookup) plus the customer-
+facing approval pages, and sends webhooks back to the site the way the real
+gateways do. Latency, error rates and webhook delivery patterns (delays,
+duplicates, out-of-order events, bursts) are configurable, so the whole
+purchase flow can be benchmarked offline.
+
+Run it with ``manage.py run_gateway_simulator`` and point the site at it with
+``PAYPAL_ENV=simulator`` / ``COINBASE_ENV=simulator`` (and
+``PAYMENT_SIMULATOR_URL`` when it is not on the default address). Tests and
+benchmarks can also run ``GatewaySimulator`` in-process as a context manager.
+
+With ``paypal_webhook_id`` / ``coinbase_webhook_secret`` set, webhooks are
+signed like the real ones (PayPal with an RSA key whose certificate is served
+at ``PAYPAL_CERT_PATH``), so ``payments.signatures`` can verify them.
+"""
+from __future__ import annotations
+
+import base64
+import datetime
+import hashlib
+import hmac
+import heapq
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.x509.oid import NameOID
+
+from .gateway_http import GatewayHTTPClient, GatewayHTTPError
+
+DEFAULT_PORT = 8787
+
+PAYPAL_WEBHOOK_PATH = "/payments/paypal/webhook/"
+COINBASE_WEBHOOK_PATH = "/payments/coinbase/webhook/"
+PAYPAL_CERT_PATH = "/v1/notifications/certs/CERT-SIM-0001"
+
+_signing_identity: tuple[rsa.RSAPrivateKey, bytes] | None = None
+_signing_identity_lock = threading.Lock()
+
+
+def signing_identity() -> tuple[rsa.RSAPrivateKey, bytes]:
+    """RSA key and self-signed PEM certificate used to sign PayPal webhooks.
+
+    Generated once per process, so a certificate the site cached from one
+    simulator instance still verifies webhooks from the next one.
+    """
+
+    global _signing_identity
+    with _signing_identity_lock:
+        if _signing_identity is None:
+            key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+            name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "messageverificationcerts.simulator")])
+            now = datetime.datetime.now(datetime.timezone.utc)
+            certificate = (
+                x509.CertificateBuilder()
+                .subject_name(name)
+                .issuer_name(name)
+                .public_key(key.public_key())
+                .serial_number(x509.random_serial_number())
+                .not_valid_before(now - datetime.timedelta(days=1))
+                .not_valid_after(now + datetime.timedelta(days=365))
+                .sign(key, hashes.SHA256())
+            )
+            _signing_identity = (key, certificate.public_bytes(serialization.Encoding.PEM))
+        return _signing_identity
+
+
+@dataclass
+class SimulatorConfig:
+    # Response time of every API call: latency plus up to ``jitter`` seconds.
+    latency: float = 0.0
+    jitter: float = 0.0
+    # Fraction of API calls answered with a 503, or left hanging for
+    # ``hang_seconds`` (longer than the client timeout) to simulate timeouts.
+    error_rate: float = 0.0
+    timeout_rate: float = 0.0
+    hang_seconds: float = 15.0
+    # Site that receives webhooks, e.g. "http://127.0.0.1:8000"; None disables them.
+    webhook_target: str | None = None
+    # Seconds after creation an order/charge is paid without visiting the
+    # approval page; None waits for the customer (``/approve/<id>``).
+    auto_complete: float | None = None
+    # Fraction of payments that are never completed (no webhook at all).
+    abandon_rate: float = 0.0
+    # Fraction of Coinbase payments that fail instead of confirming.
+    decline_rate: float = 0.0
+    webhook_delay: float = 0.0
+    duplicate_rate: float = 0.0
+    out_of_order_rate: float = 0.0
+    # Hold due webhooks until ``burst_size`` are queued (or ``burst_window``
+    # seconds pass), then deliver them all at once.
+    burst_size: int = 1
+    burst_window: float = 1.0
+    seed: int | None = None
+    # Sign webhooks for this PayPal webhook id / with this Coinbase shared
+    # secret (the site's PAYPAL_WEBHOOK_ID / COINBASE_COMMERCE_WEBHOOK_SECRET).
+    paypal_webhook_id: str | None = None
+    coinbase_webhook_secret: str | None = None
+
+
+class WebhookDispatcher:
+    """Background thread delivering scheduled webhook bodies to the site."""
+
+    def __init__(self, config: SimulatorConfig, sign: Callable[[str, bytes], dict[str, str]] | None = None) -> None:
+        self.config = config
+        # Extra (signature) headers for a delivery, from its path and body.
+        self.sign = sign
+        self.client = GatewayHTTPClient(timeout=10, max_retries=0)
+        self._queue: list[tuple[float, int, str, bytes]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._pool = ThreadPoolExecutor(max_workers=max(4, config.burst_size))
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self.sent = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join()
+        self._pool.shutdown(wait=True)
+        self.client.close()
+
+    def schedule(self, delay: float, path: str, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        with self._cond:
+            heapq.heappush(self._queue, (time.monotonic() + delay, next(self._seq), path, body))
+            self._cond.notify()
+
+    def _take_due(self) -> list[tuple[str, bytes]]:
+        """Wait for the next batch of webhooks to deliver (empty when stopping)."""
+
+        with self._cond:
+            first_due = None
+            while not self._stopped:
+                now = time.monotonic()
+                due = sum(1 for item in self._queue if item[0] <= now)
+                if due:
+                    first_due = first_due or now
+                    if due >= self.config.burst_size or now - first_due >= self.config.burst_window:
+                        return [heapq.heappop(self._queue)[2:] for _ in range(due)]
+                    self._cond.wait(min(0.05, self.config.burst_window))
+                elif self._queue:
+                    self._cond.wait(self._queue[0][0] - now)
+                else:
+                    self._cond.wait()
+            return []
+
+    def _deliver(self, path: str, body: bytes) -> None:
+        headers = {"Content-Type": "application/json"}
+        if self.sign is not None:
+            headers.update(self.sign(path, body))
+        try:
+            self.client.request("POST", f"{self.config.webhook_target}{path}", body=body, headers=headers)
+            self.sent += 1
+        except GatewayHTTPError:
+            self.failed += 1
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take_due()
+            if not batch:
+                return
+            if self.config.burst_size > 1:
+                # A burst hits the site concurrently, like real gateway retries.
+                for path, body in batch:
+                    self._pool.submit(self._deliver, path, body)
+            else:
+                # One at a time keeps the scheduled (possibly reversed) order.
+                for path, body in batch:
+                    self._deliver(path, body)
+
+
+class _SimulatorHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # noqa: A002 - keep benchmark output clean
+        pass
+
+    @property
+    def sim(self) -> "GatewaySimulator":
+        return self.server  # type: ignore[return-value]
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _redirect(self, location: str) -> None:
+        self.send_response(302)
+        self.send_header("Location", location)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _api_delay(self) -> bool:
+        """Apply configured latency/errors; False if an error was sent instead."""
+
+        config = self.sim.config
+        roll = self.sim.random()
+        if roll < config.timeout_rate:
+            time.sleep(config.hang_seconds)
+        elif config.latency or config.jitter:
+            time.sleep(config.latency + self.sim.random() * config.jitter)
+        if roll < config.timeout_rate + config.error_rate:
+            self._send_json(503, {"name": "SERVICE_UNAVAILABLE", "message": "Simulated gateway error"})
+            return False
+        return True
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        path = urlsplit(self.path).path
+        self.sim.received.append((path, dict(self.headers)))
+        if not self._api_delay():
+            return
+        data = {}
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            try:
+                data = json.loads(body.decode() or "{}")
+            except ValueError:
+                return self._send_json(400, {"name": "INVALID_REQUEST"})
+
+        if path == "/v1/oauth2/token":
+            token = self.sim.new_id("A21AA")
+            return self._send_json(200, {"access_token": token, "token_type": "Bearer", "expires_in": 32400})
+        if path == "/v2/checkout/orders":
+            return self._send_json(201, self.sim.create_paypal_order(data, self.headers.get("PayPal-Request-Id")))
+        if path == "/charges":
+            return self._send_json(201, self.sim.create_coinbase_charge(data))
+        self._send_json(404, {"name": "RESOURCE_NOT_FOUND"})
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        self.sim.received.append((path, dict(self.headers)))
+
+        # Customer-facing pages: no API latency, they stand in for the browser.
+        match = re.fullmatch(r"/(approve|pay)/([\w-]+)", path)
+        if match:
+            location = self.sim.approve(match.group(2))
+            if location is None:
+                return self._send_json(404, {"name": "RESOURCE_NOT_FOUND"})
+            return self._redirect(location)
+
+        if not self._api_delay():
+            return
+        if path == PAYPAL_CERT_PATH:
+            body = signing_identity()[1]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-pem-file")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        match = re.fullmatch(r"/v2/checkout/orders/([\w-]+)", path)
+        if match and match.group(1) in self.sim.paypal_orders:
+            return self._send_json(200, self.sim.paypal_order_view(match.group(1)))
+        match = re.fullmatch(r"/charges/([\w-]+)", path)
+        if match and match.group(1) in self.sim.coinbase_charges:
+            return self._send_json(200, {"data": self.sim.coinbase_charge_view(match.group(1))})
+        self._send_json(404, {"name": "RESOURCE_NOT_FOUND"})
+
+
+class GatewaySimulator(ThreadingHTTPServer):
+    """Threaded simulator server; use as a context manager to run it in the background."""
+
+    daemon_threads = True
+    # Bursts of hundreds of concurrent connects must not overflow the backlog.
+    request_queue_size = 1024
+
+    def __init__(self, config: SimulatorConfig | None = None, host: str = "127.0.0.1", port: int = 0) -> None:
+        super().__init__((host, port), _SimulatorHandler)
+        self.config = config or SimulatorConfig()
+        self._random = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._counter = itertools.count(1)
+        self.paypal_orders: dict[str, dict] = {}
+        self.coinbase_charges: dict[str, dict] = {}
+        self._request_ids: dict[str, str] = {}
+        # (path, headers) of recent requests, for assertions in tests.
+        self.received: deque[tuple[str, dict[str, str]]] = deque(maxlen=1000)
+        self.webhooks = WebhookDispatcher(self.config, sign=self.webhook_headers)
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def random(self) -> float:
+        with self._lock:
+            return self._random.random()
+
+    def new_id(self, prefix: str) -> str:
+        return f"{prefix}-{next(self._counter):08d}"
+
+    def webhook_headers(self, path: str, body: bytes) -> dict[str, str]:
+        """Signature headers the gateway would send with ``body`` (none if unconfigured)."""
+
+        config = self.config
+        if path == PAYPAL_WEBHOOK_PATH and config.paypal_webhook_id:
+            key, _ = signing_identity()
+            transmission_id = self.new_id("TX")
+            transmission_time = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+            message = f"{transmission_id}|{transmission_time}|{config.paypal_webhook_id}|{zlib.crc32(body)}"
+            signature = key.sign(message.encode(), padding.PKCS1v15(), hashes.SHA256())
+            return {
+                "PAYPAL-TRANSMISSION-ID": transmission_id,
+                "PAYPAL-TRANSMISSION-TIME": transmission_time,
+                "PAYPAL-TRANSMISSION-SIG": base64.b64encode(signature).decode(),
+                "PAYPAL-CERT-URL": f"{self.base_url}{PAYPAL_CERT_PATH}",
+                "PAYPAL-AUTH-ALGO": "SHA256withRSA",
+            }
+        if path == COINBASE_WEBHOOK_PATH and config.coinbase_webhook_secret:
+            secret = config.coinbase_webhook_secret.encode()
+            return {"X-CC-Webhook-Signature": hmac.new(secret, body, hashlib.sha256).hexdigest()}
+        return {}
+
+    # -- PayPal ---------------------------------------------------------------
+
+    def create_paypal_order(self, data: dict, request_id: str | None) -> dict:
+        with self._lock:
+            # PayPal-Request-Id: a repeated request returns the same order.
+            if request_id and request_id in self._request_ids:
+                return self.paypal_order_view(self._request_ids[request_id])
+            order_id = self.new_id("SIMPP")
+            unit = (data.get("purchase_units") or [{}])[0]
+            context = data.get("application_context", {})
+            self.paypal_orders[order_id] = {
+                "status": "CREATED",
+                "custom_id": unit.get("custom_id", ""),
+                "amount": unit.get("amount", {}),
+                "return_url": context.get("return_url", ""),
+                "cancel_url": context.get("cancel_url", ""),
+            }
+            if request_id:
+                self._request_ids[request_id] = order_id
+        if self.config.auto_complete is not None:
+            self._complete("paypal", order_id, self.config.auto_complete)
+        return self.paypal_order_view(order_id)
+
+    def paypal_order_view(self, order_id: str) -> dict:
+        order = self.paypal_orders[order_id]
+        return {
+            "id": order_id,
+            "status": order["status"],
+            "purchase_units": [{"custom_id": order["custom_id"], "amount": order["amount"]}],
+            "links": [
+                {"rel": "self", "href": f"{self.base_url}/v2/checkout/orders/{order_id}", "method": "GET"},
+                {"rel": "approve", "href": f"{self.base_url}/approve/{order_id}", "method": "GET"},
+            ],
+        }
+
+    def _paypal_event(self, order_id: str, event_type: str) -> dict:
+        return {
+            "id": self.new_id("WH"),
+            "event_type": event_type,
+            "resource_type": "checkout-order",
+            "resource": self.paypal_order_view(order_id),
+        }
+
+    # -- Coinbase -------------------------------------------------------------
+
+    def create_coinbase_charge(self, data: dict) -> dict:
+        charge_id = self.new_id("SIMCB")
+        with self._lock:
+            self.coinbase_charges[charge_id] = {
+                "timeline": [{"status": "NEW"}],
+                "metadata": data.get("metadata", {}),
+                "pricing": {"local": data.get("local_price", {})},
+                "redirect_url": data.get("redirect_url", ""),
+                "cancel_url": data.get("cancel_url", ""),
+            }
+        if self.config.auto_complete is not None:
+            self._complete("coinbase", charge_id, self.config.auto_complete)
+        return {"data": self.coinbase_charge_view(charge_id)}
+
+    def coinbase_charge_view(self, charge_id: str) -> dict:
+        charge = self.coinbase_charges[charge_id]
+        return {
+            "id": charge_id,
+            "code": charge_id[-8:],
+            "hosted_url": f"{self.base_url}/pay/{charge_id}",
+            "timeline": list(charge["timeline"]),
+            "metadata": charge["metadata"],
+            "pricing": charge["pricing"],
+        }
+
+    def _coinbase_event(self, charge_id: str, event_type: str) -> dict:
+        event_id = self.new_id("EVT")
+        return {"id": event_id, "event": {"id": event_id, "type": event_type, "data": self.coinbase_charge_view(charge_id)}}
+
+    # -- completion and webhooks ----------------------------------------------
+
+    def approve(self, ref: str) -> str | None:
+        """Customer approval page: approve and capture the payment, return the redirect target."""
+
+        if ref in self.paypal_orders:
+            self._complete("paypal", ref, 0.0, force=True)
+            return self.paypal_orders[ref]["return_url"] or "/"
+        if ref in self.coinbase_charges:
+            self._complete("coinbase", ref, 0.0, force=True)
+            return self.coinbase_charges[ref]["redirect_url"] or "/"
+        return None
+
+    def _complete(self, gateway: str, ref: str, delay: float, force: bool = False) -> None:
+        config = self.config
+        if not force and self.random() < config.abandon_rate:
+            return
+        if gateway == "paypal":
+            with self._lock:
+                if self.paypal_orders[ref]["status"] == "COMPLETED":
+                    return
+                self.paypal_orders[ref]["status"] = "COMPLETED"
+            events = [self._paypal_event(ref, "CHECKOUT.ORDER.APPROVED"),
+                      self._paypal_event(ref, "CHECKOUT.ORDER.COMPLETED")]
+            path = PAYPAL_WEBHOOK_PATH
+        else:
+            failed = self.random() < config.decline_rate
+            with self._lock:
+                if len(self.coinbase_charges[ref]["timeline"]) > 1:
+                    return
+                self.coinbase_charges[ref]["timeline"] += [
+                    {"status": "PENDING"},
+                    {"status": "FAILED" if failed else "COMPLETED"},
+                ]
+            events = [self._coinbase_event(ref, "charge:pending"),
+                      self._coinbase_event(ref, "charge:failed" if failed else "charge:confirmed")]
+            path = COINBASE_WEBHOOK_PATH
+
+        if not config.webhook_target:
+            return
+        if self.random() < config.out_of_order_rate:
+            events.reverse()
+        delay += config.webhook_delay
+        for step, event in enumerate(events):
+            # Keep the chosen order on the wire with a small gap between events.
+            self.webhooks.schedule(delay + step * 0.01, path, event)
+            if self.random() < config.duplicate_rate:
+                self.webhooks.schedule(delay + step * 0.01 + 0.005, path, event)
+
+    # -- lifecycle ------------------------------------------------------------
+
+    def __enter__(self) -> "GatewaySimulator":
+        self.webhooks.start()
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.shutdown()
+        self.server_close()
+        self.webhooks.stop()
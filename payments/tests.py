@@ -1,15 +1,111 @@
 from __future__ import annotations
 
+import asyncio
+import gc
+import io
 import json
+import threading
+import time
+import weakref
+from dataclasses import replace
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import LiveServerTestCase, SimpleTestCase, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
-from orders.models import Order
-from payments.models import Payment
+from jobs.models import Job
+from orders.models import EmailOutbox, Order
+from payments.expiry import expire_stale_orders
+from payments.gateway_async import AsyncGatewayHTTPClient
+from payments.gateway_http import GatewayHTTPClient, GatewayHTTPError
+from payments.models import Payment, PaymentPayload, WebhookEvent
+from payments.reconcile import SWEPT_LOOKBACK, reconcile_payments
+from payments.resilience import OPEN, Bulkhead, CircuitBreaker, GatewayGuard, GatewayRejected
+from payments.simulator import PAYPAL_CERT_PATH, PAYPAL_WEBHOOK_PATH, GatewaySimulator, SimulatorConfig
+from payments.tokens import AccessTokenCache, LocalTokenBackend
+from payments.transitions import TransitionResult, transition_payment
+from payments.utils import create_coinbase_charge, create_paypal_order
+from payments.webhooks import (
+    CLAIM_LEASE,
+    MAX_ATTEMPTS,
+    PROCESS_JOB,
+    apply_gateway_state,
+    claim_pending_events,
+    process_pending_events,
+    requeue_events,
+)
 from services.models import ServicePackage
 
 
+class _StubGatewayHandler(BaseHTTPRequestHandler):
+    """Keep-alive JSON stub.
+
+    ``/flaky`` fails with 503 until ``fail_count`` hits 0; ``/drop`` reads the
+    request and hangs up without answering until ``drop_count`` hits 0.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # noqa: A002 - silence test output
+        pass
+
+    def do_POST(self):
+        server = self.server
+        server.client_ports.add(self.client_address[1])
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        server.paths.append(self.path)
+        if self.path == "/drop" and server.drop_count > 0:
+            server.drop_count -= 1
+            self.close_connection = True
+            return
+        status = 200
+        if self.path == "/flaky" and server.fail_count > 0:
+            server.fail_count -= 1
+            status = 503
+        body = json.dumps({"path": self.path}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+WEBHOOK_ID = "WH-SIM-0001"
+WEBHOOK_SECRET = "sim-webhook-secret"
+
+
+def start_simulator(test, config: SimulatorConfig | None = None) -> GatewaySimulator:
+    """Run a simulator for ``test``, point both gateways at it and sign its webhooks."""
+
+    config = replace(config or SimulatorConfig(seed=1), paypal_webhook_id=WEBHOOK_ID,
+                     coinbase_webhook_secret=WEBHOOK_SECRET)
+    simulator = GatewaySimulator(config).__enter__()
+    test.addCleanup(simulator.__exit__, None, None, None)
+    env = mock.patch.dict(
+        "os.environ",
+        {"PAYPAL_ENV": "simulator", "COINBASE_ENV": "simulator", "PAYMENT_SIMULATOR_URL": simulator.base_url,
+         "PAYPAL_CLIENT_ID": "sim", "PAYPAL_CLIENT_SECRET": "sim", "COINBASE_COMMERCE_API_KEY": "sim",
+         "PAYPAL_WEBHOOK_ID": WEBHOOK_ID, "COINBASE_COMMERCE_WEBHOOK_SECRET": WEBHOOK_SECRET},
+    )
+    env.start()
+    test.addCleanup(env.stop)
+    return simulator
+
+
+def post_signed(test, simulator: GatewaySimulator, url_name: str, body: bytes, **headers):
+    """POST ``body`` to a webhook view with the simulator's signature (or ``headers``)."""
+
+    url = reverse(url_name)
+    headers = headers or simulator.webhook_headers(url, body)
+    return test.client.post(url, body, content_type="application/json", headers=headers)
+
+
+@override_settings(ALTIQ_WEBHOOKS_INLINE=False)
 class PaypalWebhookTests(TestCase):
     def setUp(self) -> None:
         package = ServicePackage.objects.create(
@@ -42,21 +138,136 @@ class PaypalWebhookTests(TestCase):
             status="created",
             provider_payment_id="PAYPAL-123",
         )
+        self.simulator = start_simulator(self)
+
+    def post(self, payload: dict, **headers):
+        return post_signed(self, self.simulator, "payments:paypal_webhook", json.dumps(payload).encode(), **headers)
 
     def test_paypal_webhook_marks_payment_and_order_paid(self) -> None:
-        url = reverse("payments:paypal_webhook")
         payload = {
             "resource": {"id": "PAYPAL-123"},
         }
-        response = self.client.post(url, data=json.dumps(payload), content_type="application/json")
+        response = self.post(payload)
         self.assertEqual(response.status_code, 200)
+        self.assertEqual(WebhookEvent.objects.get().status, "pending")
+
+        self.assertEqual(process_pending_events(), {"processed": 1})
 
         self.payment.refresh_from_db()
         self.order.refresh_from_db()
         self.assertEqual(self.payment.status, "completed")
         self.assertEqual(self.order.status, "paid")
+        self.assertTrue(self.order.thank_you_email_sent)
+        self.assertEqual(self.order.emails.get().to, ["test@example.com"])
+
+    def test_duplicate_deliveries_are_stored_once(self) -> None:
+        payload = {"id": "WH-1", "event_type": "CHECKOUT.ORDER.APPROVED", "resource": {"id": "PAYPAL-123"}}
+        for _ in range(2):
+            response = self.post(payload)
+            self.assertEqual(response.status_code, 200)
+        event = WebhookEvent.objects.get()
+        self.assertEqual(event.event_id, "WH-1")
+
+    def test_webhook_without_order_id_is_rejected(self) -> None:
+        response = self.post({"resource": {}})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_processed_events_can_be_replayed(self) -> None:
+        self.post({"resource": {"id": "PAYPAL-123"}})
+        process_pending_events()
+        Payment.objects.filter(pk=self.payment.pk).update(status="pending")
+
+        self.assertEqual(requeue_events(WebhookEvent.objects.all()), 1)
+        self.assertEqual(process_pending_events(), {"processed": 1})
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, "completed")
+
+    def test_admin_replay_queues_processing(self) -> None:
+        self.post({"resource": {"id": "PAYPAL-123"}})
+        process_pending_events()
+        Payment.objects.filter(pk=self.payment.pk).update(status="pending")
+        staff = get_user_model().objects.create_superuser("admin", "admin@example.com", "pass")
+        self.client.force_login(staff)
+
+        self.client.post(
+            reverse("admin:payments_webhookevent_changelist"),
+            {"action": "replay_events", "_selected_action": [WebhookEvent.objects.get().pk]},
+        )
+        self.assertEqual(WebhookEvent.objects.get().status, "pending")
+        self.assertTrue(Job.objects.filter(name=PROCESS_JOB, status="queued").exists())
+
+        call_command("runworker", queues=["webhooks"], stdout=io.StringIO())
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, "completed")
+
+    def test_events_are_processed_inline_by_default(self) -> None:
+        with self.settings(ALTIQ_WEBHOOKS_INLINE=True):
+            self.assertEqual(self.post({"resource": {"id": "PAYPAL-123"}}).status_code, 200)
+        self.assertEqual(WebhookEvent.objects.get().status, "processed")
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, "paid")
+
+    def test_orphaned_claims_are_reclaimed(self) -> None:
+        self.post({"resource": {"id": "PAYPAL-123"}})
+        [event] = claim_pending_events()  # the processor dies here
+        self.assertEqual(claim_pending_events(), [])
+
+        WebhookEvent.objects.update(claimed_at=event.claimed_at - CLAIM_LEASE)
+        self.assertEqual(process_pending_events(), {"processed": 1})
+        self.assertEqual(WebhookEvent.objects.get().attempts, 2)
 
+    def test_failing_events_are_retried_a_bounded_number_of_times(self) -> None:
+        self.post({"resource": {"id": "PAYPAL-123"}})
+        failing = mock.Mock(side_effect=RuntimeError("database went away"))
+        with mock.patch.dict("payments.webhooks.HANDLERS", {"paypal": failing}):
+            for _ in range(MAX_ATTEMPTS - 1):
+                self.assertEqual(process_pending_events(), {"retry": 1})
+            self.assertEqual(process_pending_events(), {"failed": 1})
+            self.assertEqual(process_pending_events(), {})
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.status, event.attempts), ("failed", MAX_ATTEMPTS))
+        self.assertIn("database went away", event.last_error)
 
+    def test_payload_is_archived_compressed_and_shown_on_demand(self) -> None:
+        payload = {"id": "WH-2", "event_type": "CHECKOUT.ORDER.COMPLETED",
+                   "resource": {"id": "PAYPAL-123", "status": "COMPLETED", "links": [{"rel": "self"}] * 50}}
+        self.post(payload)
+        process_pending_events()
+
+        archived = self.payment.payloads.get()
+        self.assertEqual((archived.source, archived.load()), ("webhook", payload))
+        self.assertLess(len(archived.data), archived.size)
+
+        admin = get_user_model().objects.create_superuser("admin", "admin@example.com", "testpass123")
+        self.client.force_login(admin)
+        view_url = reverse("admin:payments_payment_payload", args=[archived.pk])
+        response = self.client.get(reverse("admin:payments_payment_change", args=[self.payment.pk]))
+        self.assertContains(response, view_url)
+        self.assertNotContains(response, "CHECKOUT.ORDER.COMPLETED")
+        self.assertEqual(self.client.get(view_url).json(), payload)
+
+    def test_unsigned_and_forged_deliveries_are_rejected_before_storage(self) -> None:
+        body = json.dumps({"resource": {"id": "PAYPAL-123"}}).encode()
+        signed = self.simulator.webhook_headers(PAYPAL_WEBHOOK_PATH, body)
+        forged_cert = {**signed, "PAYPAL-CERT-URL": "https://evil.example/v1/notifications/certs/CERT-1"}
+        url = reverse("payments:paypal_webhook")
+        with self.assertNumQueries(0), self.assertLogs("payments.views", "WARNING"):
+            self.assertEqual(self.client.post(url, body, content_type="application/json").status_code, 401)
+            # Signature of another body, and a certificate from an untrusted host.
+            self.assertEqual(self.post({"resource": {"id": "PAYPAL-999"}}, **signed).status_code, 401)
+            self.assertEqual(post_signed(self, self.simulator, "payments:paypal_webhook", body,
+                                         **forged_cert).status_code, 401)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_signing_certificate_is_fetched_once(self) -> None:
+        for number in range(3):
+            self.assertEqual(self.post({"id": f"WH-{number}", "resource": {"id": "PAYPAL-123"}}).status_code, 200)
+        self.assertEqual(sum(path == PAYPAL_CERT_PATH for path, _ in self.simulator.received), 1)
+        self.assertEqual(WebhookEvent.objects.count(), 3)
+
+
+@override_settings(ALTIQ_WEBHOOKS_INLINE=False)
 class CoinbaseWebhookTests(TestCase):
     def setUp(self) -> None:
         package = ServicePackage.objects.create(
@@ -89,6 +300,7 @@ class CoinbaseWebhookTests(TestCase):
             status="created",
             provider_payment_id="COINBASE-123",
         )
+        self.simulator = start_simulator(self)
 
     def test_coinbase_webhook_marks_payment_and_order_paid(self) -> None:
         url = reverse("payments:coinbase_webhook")
@@ -99,11 +311,420 @@ class CoinbaseWebhookTests(TestCase):
                 "timeline": [{"status": "NEW"}, {"status": "COMPLETED"}],
             },
         }
-        response = self.client.post(url, data=json.dumps(payload), content_type="application/json")
+        body = json.dumps(payload).encode()
+        response = post_signed(self, self.simulator, "payments:coinbase_webhook", body)
         self.assertEqual(response.status_code, 200)
+        self.assertEqual(process_pending_events(), {"processed": 1})
+
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual(self.payment.status, "completed")
+        self.assertEqual(self.order.status, "paid")
+
+    def test_wrong_signature_is_rejected(self) -> None:
+        url = reverse("payments:coinbase_webhook")
+        body = json.dumps({"type": "charge:confirmed", "data": {"id": "COINBASE-123"}}).encode()
+        with self.assertLogs("payments.views", "WARNING"):
+            response = self.client.post(url, body, content_type="application/json",
+                                        headers={"X-CC-Webhook-Signature": "0" * 64})
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+
+class GatewayHTTPClientTests(SimpleTestCase):
+    def setUp(self) -> None:
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _StubGatewayHandler)
+        self.server.client_ports = set()
+        self.server.fail_count = 0
+        self.server.drop_count = 0
+        self.server.paths = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.client = GatewayHTTPClient(timeout=5, backoff=0.001)
+
+    def tearDown(self) -> None:
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connections_are_reused(self) -> None:
+        for _ in range(3):
+            response = self.client.post_json(f"{self.base}/orders", {"amount": "1"})
+            self.assertEqual(response.json(), {"path": "/orders"})
+        self.assertEqual(len(self.server.client_ports), 1)
+        self.assertEqual(len(self.client.calls), 3)
+
+    def test_idempotent_calls_are_retried(self) -> None:
+        self.server.fail_count = 2
+        response = self.client.post_json(f"{self.base}/flaky", {}, idempotent=True)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(self.client.calls[-1].attempts, 3)
+
+    def test_non_idempotent_calls_are_not_retried(self) -> None:
+        self.server.fail_count = 1
+        with self.assertRaises(GatewayHTTPError) as ctx:
+            self.client.post_json(f"{self.base}/flaky", {})
+        self.assertEqual(ctx.exception.status, 503)
+        self.assertEqual(self.client.calls[-1].attempts, 1)
+
+    def test_post_dropped_after_it_was_read_is_not_replayed(self) -> None:
+        self.client.post_json(f"{self.base}/orders", {})  # leaves a kept-alive connection
+        self.server.drop_count = 1
+        with self.assertRaises(GatewayHTTPError):
+            self.client.post_json(f"{self.base}/drop", {})
+        self.assertEqual(self.server.paths, ["/orders", "/drop"])
+
+        self.server.drop_count = 1
+        response = self.client.post_json(f"{self.base}/drop", {}, idempotent=True)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(self.server.paths[2:], ["/drop", "/drop"])
+
+    async def test_async_post_dropped_after_it_was_read_is_not_replayed(self) -> None:
+        client = AsyncGatewayHTTPClient(timeout=5, backoff=0.001)
+        await client.post_json(f"{self.base}/orders", {})
+        self.server.drop_count = 1
+        with self.assertRaises(GatewayHTTPError):
+            await client.post_json(f"{self.base}/drop", {})
+        self.assertEqual(self.server.paths, ["/orders", "/drop"])
+
+        self.server.drop_count = 1
+        response = await client.post_json(f"{self.base}/drop", {}, idempotent=True)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(self.server.paths[2:], ["/drop", "/drop"])
+        await client.close()
+
+    async def test_async_client_reuses_connections_and_retries(self) -> None:
+        client = AsyncGatewayHTTPClient(timeout=5, backoff=0.001)
+        for _ in range(3):
+            response = await client.post_json(f"{self.base}/orders", {"amount": "1"})
+            self.assertEqual(response.json(), {"path": "/orders"})
+        self.assertEqual(len(self.server.client_ports), 1)
+
+        self.server.fail_count = 1
+        with self.assertRaises(GatewayHTTPError):
+            await client.post_json(f"{self.base}/flaky", {})
+        self.server.fail_count = 1
+        response = await client.post_json(f"{self.base}/flaky", {}, idempotent=True)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(client.calls[-1].attempts, 2)
+        await client.close()
+
+    def test_async_pool_is_closed_with_its_event_loop(self) -> None:
+        # Under WSGI every async view runs on its own loop via asyncio.run.
+        client = AsyncGatewayHTTPClient(timeout=5)
+        loops = []
+
+        async def checkout() -> None:
+            loops.append(weakref.ref(asyncio.get_running_loop()))
+            await client.post_json(f"{self.base}/orders", {})
+
+        for _ in range(3):
+            asyncio.run(checkout())
+        gc.collect()
+        self.assertEqual((client._pools, client._closers), ({}, {}))
+        self.assertEqual([loop() for loop in loops], [None] * 3)
+
+
+class AccessTokenCacheTests(SimpleTestCase):
+    def setUp(self) -> None:
+        self.cache = AccessTokenCache(LocalTokenBackend(), refresh_margin=60)
+        self.fetches = 0
 
+    def fetch(self):
+        self.fetches += 1
+        time.sleep(0.05)
+        return f"token-{self.fetches}", 3600
+
+    def test_token_is_reused_until_refresh(self) -> None:
+        self.assertEqual(self.cache.get_token("paypal", self.fetch), "token-1")
+        self.assertEqual(self.cache.get_token("paypal", self.fetch), "token-1")
+        self.cache.invalidate("paypal")
+        self.assertEqual(self.cache.get_token("paypal", self.fetch), "token-2")
+
+    def test_short_lived_token_is_refreshed_early(self) -> None:
+        self.cache.get_token("paypal", lambda: ("short", 1))
+        time.sleep(0.6)
+        self.assertEqual(self.cache.get_token("paypal", self.fetch), "token-1")
+
+    def test_concurrent_callers_fetch_once(self) -> None:
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.cache.get_token("paypal", self.fetch)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.fetches, 1)
+        self.assertEqual(set(results), {"token-1"})
+
+
+class GatewayGuardTests(SimpleTestCase):
+    def setUp(self) -> None:
+        self.now = 0.0
+        self.breaker = CircuitBreaker("paypal", window=4, min_calls=4, open_seconds=30, clock=lambda: self.now)
+        self.guard = GatewayGuard("paypal", self.breaker, Bulkhead("paypal", 1, LocalTokenBackend(), 60))
+
+    def _call(self, exc: Exception | None = None) -> None:
+        with self.guard.call():
+            if exc is not None:
+                raise exc
+
+    def test_circuit_opens_then_recovers_through_half_open(self) -> None:
+        self._call()
+        for _ in range(3):
+            with self.assertRaises(GatewayHTTPError):
+                self._call(GatewayHTTPError("timeout"))
+        self.assertEqual(self.breaker.state, OPEN)
+        with self.assertRaises(GatewayRejected):
+            self._call()
+
+        self.now += 30
+        self.assertTrue(self.guard.available())
+        self._call()
+        self.assertEqual(self.breaker.state, "closed")
+        snapshot = self.guard.snapshot()
+        self.assertEqual(snapshot["circuit"]["times_opened"], 1)
+        self.assertEqual(snapshot["circuit"]["rejected"], 1)
+
+    def test_client_errors_do_not_trip_the_circuit(self) -> None:
+        for _ in range(4):
+            with self.assertRaises(GatewayHTTPError):
+                self._call(GatewayHTTPError("bad request", status=400))
+        self.assertEqual(self.breaker.state, "closed")
+
+    def test_bulkhead_rejects_calls_beyond_the_limit(self) -> None:
+        with self.guard.call():
+            self.assertFalse(self.guard.available())
+            with self.assertRaises(GatewayRejected):
+                self._call()
+        self._call()
+        self.assertEqual(self.guard.snapshot()["bulkhead"], {"limit": 1, "in_flight": 0, "rejected": 1})
+
+    def test_late_release_keeps_the_next_claim(self) -> None:
+        bulkhead = self.guard.bulkhead
+        stale = bulkhead.try_acquire()
+        bulkhead.backend.delete(bulkhead._slot_key(stale[0]))  # the slot timed out
+        current = bulkhead.try_acquire()
+
+        bulkhead.release(stale)
+        self.assertTrue(bulkhead.saturated())
+        bulkhead.release(current)
+        self.assertFalse(bulkhead.saturated())
+
+
+class TransitionTests(TestCase):
+    def setUp(self) -> None:
+        package = ServicePackage.objects.create(
+            slug="transition-test",
+            name_es="Paquete transiciones",
+            short_description_es="",
+            price_mxn=100,
+        )
+        self.order = Order.objects.create(
+            package=package, customer_name="Test User", email="test@example.com", amount=100
+        )
+        self.payment = Payment.objects.create(
+            order=self.order, method="coinbase", amount=100, status="pending", provider_payment_id="CB-1"
+        )
+        self.payments = Payment.objects.filter(pk=self.payment.pk)
+
+    def test_transition_wins_once(self) -> None:
+        with self.assertNumQueries(4):  # savepoint, payment UPDATE, order UPDATE, release
+            first = transition_payment(self.payments, "completed", order_status="paid")
+        second = transition_payment(self.payments, "completed", order_status="paid")
+        self.assertEqual(first, TransitionResult(payment_won=True, order_won=True))
+        self.assertEqual(second, TransitionResult(payment_won=False, order_won=False))
+
+    def test_late_failure_does_not_overwrite_paid_order(self) -> None:
+        transition_payment(self.payments, "completed", order_status="paid")
+        result = transition_payment(self.payments, "failed", order_status="failed")
+        self.assertFalse(result.payment_won)
         self.payment.refresh_from_db()
         self.order.refresh_from_db()
         self.assertEqual(self.payment.status, "completed")
         self.assertEqual(self.order.status, "paid")
 
+
+@override_settings(ALTIQ_WEBHOOKS_INLINE=False)
+class GatewaySimulatorTests(LiveServerTestCase):
+    def setUp(self) -> None:
+        package = ServicePackage.objects.create(slug="sim", name_es="Sim", short_description_es="", price_mxn=100)
+        self.order = Order.objects.create(package=package, customer_name="Sim", email="sim@example.com", amount=100)
+        self.simulator = start_simulator(self, SimulatorConfig(
+            webhook_target=self.live_server_url, auto_complete=0, duplicate_rate=1, out_of_order_rate=1, seed=1,
+        ))
+
+    def test_paypal_purchase_flow_with_duplicate_out_of_order_webhooks(self) -> None:
+        approval_url, paypal_id = create_paypal_order(self.order, "http://ok", "http://cancel", request_id="sim-1")
+        self.assertEqual(create_paypal_order(self.order, "http://ok", "http://cancel", request_id="sim-1")[1], paypal_id)
+        self.assertTrue(approval_url.startswith(self.simulator.base_url))
+        Payment.objects.create(order=self.order, method="paypal", amount=100, status="pending",
+                               provider_payment_id=paypal_id)
+
+        deadline = time.monotonic() + 5
+        while self.simulator.webhooks.sent < 4 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        # Two events, each delivered twice: the duplicates are dropped on insert.
+        self.assertEqual(self.simulator.webhooks.sent, 4)
+        self.assertEqual(WebhookEvent.objects.count(), 2)
+        self.assertEqual(
+            list(WebhookEvent.objects.order_by("id").values_list("event_type", flat=True)),
+            ["CHECKOUT.ORDER.COMPLETED", "CHECKOUT.ORDER.APPROVED"],
+        )
+
+        process_pending_events()
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, "paid")
+
+
+class OrderExpiryTests(TestCase):
+    def setUp(self) -> None:
+        self.package = ServicePackage.objects.create(
+            slug="expiry", name_es="Expiración", short_description_es="", price_mxn=100
+        )
+        self.old = timezone.now() - timedelta(days=2)
+
+    def _order(self, status: str = "pending", created_at=None) -> Order:
+        order = Order.objects.create(
+            package=self.package, customer_name="Exp", email="exp@example.com", amount=100, status=status
+        )
+        Order.objects.filter(pk=order.pk).update(created_at=created_at or self.old)
+        return order
+
+    def test_stale_pending_orders_are_cancelled_in_batches(self) -> None:
+        bare = self._order()
+        with_payment = self._order()
+        Payment.objects.create(order=with_payment, method="paypal", amount=100, status="created")
+        recent = self._order(created_at=timezone.now())
+        paid = self._order(status="paid")
+
+        self.assertEqual(expire_stale_orders(timedelta(hours=24), dry_run=True)["cancelled"], 2)
+        counts = expire_stale_orders(timedelta(hours=24), batch_size=1)
+
+        self.assertEqual(counts, {"cancelled": 2, "paid": 0, "skipped": 0})
+        statuses = dict(Order.objects.values_list("pk", "status"))
+        self.assertEqual(statuses[bare.pk], "cancelled")
+        self.assertEqual(statuses[with_payment.pk], "cancelled")
+        self.assertEqual(statuses[recent.pk], "pending")
+        self.assertEqual(statuses[paid.pk], "paid")
+        self.assertEqual(Payment.objects.get(order=with_payment).status, "failed")
+
+    def test_gateway_check_completes_late_captures(self) -> None:
+        simulator = start_simulator(self)
+
+        captured = self._order()
+        _, paypal_id = create_paypal_order(captured, "http://ok", "http://cancel")
+        Payment.objects.create(order=captured, method="paypal", amount=100, status="pending",
+                               provider_payment_id=paypal_id)
+        simulator.approve(paypal_id)  # approved and captured, but the webhook never arrived
+        abandoned = self._order()
+        _, charge_id = create_coinbase_charge(abandoned, "http://ok", "http://cancel")
+        Payment.objects.create(order=abandoned, method="coinbase", amount=100, status="created",
+                               provider_payment_id=charge_id)
+
+        out = io.StringIO()
+        call_command("expire_orders", "--check-gateway", stdout=out)
+
+        self.assertIn("cancelled=1, paid=1, skipped=0", out.getvalue())
+        captured.refresh_from_db()
+        abandoned.refresh_from_db()
+        self.assertEqual((captured.status, captured.payments.get().status), ("paid", "completed"))
+        self.assertEqual((abandoned.status, abandoned.payments.get().status), ("cancelled", "failed"))
+
+    def test_late_resolution_reopens_and_fulfils_a_cancelled_order(self) -> None:
+        order = self._order()
+        Payment.objects.create(order=order, method="coinbase", amount=100, status="pending",
+                               provider_payment_id="CB-LATE")
+        expire_stale_orders(timedelta(hours=24))
+
+        state = apply_gateway_state("coinbase", {"id": "CB-LATE", "timeline": [{"status": "RESOLVED"}]})
+
+        self.assertEqual(state, "paid")
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.payments.get().status), ("paid", "completed"))
+        self.assertTrue(order.thank_you_email_sent)
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+
+
+class ReconciliationTests(TestCase):
+    def setUp(self) -> None:
+        self.simulator = start_simulator(self, SimulatorConfig(latency=0.02, seed=1))
+        self.package = ServicePackage.objects.create(
+            slug="reconcile", name_es="Conciliación", short_description_es="", price_mxn=100
+        )
+
+    def _payment(self, method: str, minutes_ago: int = 60) -> Payment:
+        order = Order.objects.create(package=self.package, customer_name="Rec", email="rec@example.com", amount=100)
+        create = create_paypal_order if method == "paypal" else create_coinbase_charge
+        _, provider_id = create(order, "http://ok", "http://cancel")
+        payment = Payment.objects.create(
+            order=order, method=method, amount=100, status="pending", provider_payment_id=provider_id
+        )
+        Payment.objects.filter(pk=payment.pk).update(created_at=timezone.now() - timedelta(minutes=minutes_ago))
+        return payment
+
+    def test_settled_payments_are_applied_in_bulk(self) -> None:
+        paid = [self._payment("paypal") for _ in range(3)]
+        for payment in paid:
+            self.simulator.approve(payment.provider_payment_id)
+        expired = self._payment("coinbase")
+        self.simulator.coinbase_charges[expired.provider_payment_id]["timeline"].append({"status": "EXPIRED"})
+        still_open = self._payment("coinbase")
+        # Approved by the buyer but not captured: nothing was paid yet.
+        uncaptured = self._payment("paypal")
+        self.simulator.paypal_orders[uncaptured.provider_payment_id]["status"] = "APPROVED"
+        recent = self._payment("paypal", minutes_ago=1)
+        self.simulator.approve(recent.provider_payment_id)
+        missing = self._payment("paypal")
+        Payment.objects.filter(pk=missing.pk).update(provider_payment_id="SIMPP-UNKNOWN")
+
+        dry = reconcile_payments(timedelta(minutes=30), workers=4, dry_run=True)
+        self.assertEqual((dry.paid, Payment.objects.filter(status="completed").count()), (3, 0))
+
+        stats = reconcile_payments(timedelta(minutes=30), workers=4, batch_size=2)
+
+        self.assertEqual((stats.checked, stats.paid, stats.failed, stats.still_open), (7, 3, 1, 2))
+        self.assertEqual(stats.errors, {"HTTP 404": 1})
+        statuses = dict(Payment.objects.values_list("pk", "status"))
+        self.assertEqual({statuses[payment.pk] for payment in paid}, {"completed"})
+        self.assertEqual(statuses[expired.pk], "failed")
+        self.assertEqual(statuses[still_open.pk], "pending")
+        self.assertEqual(statuses[uncaptured.pk], "pending")
+        self.assertEqual(statuses[recent.pk], "pending")
+        self.assertEqual(Order.objects.filter(status="paid", thank_you_email_sent=True).count(), 3)
+        self.assertEqual(EmailOutbox.objects.count(), 3)
+        self.assertEqual(PaymentPayload.objects.filter(source="reconcile").count(), 4)
+
+        # A second run only sees what is still open.
+        self.assertEqual(reconcile_payments(timedelta(minutes=30)).checked, 3)
+
+    def test_payment_settled_after_the_sweep_reopens_its_order(self) -> None:
+        payment = self._payment("paypal")
+        Order.objects.filter(pk=payment.order_id).update(created_at=timezone.now() - timedelta(days=2))
+        expire_stale_orders(timedelta(hours=24))
+        self.simulator.approve(payment.provider_payment_id)
+
+        stats = reconcile_payments(timedelta(minutes=30))
+
+        self.assertEqual((stats.checked, stats.paid), (1, 1))
+        payment.refresh_from_db()
+        self.assertEqual((payment.status, payment.order.status), ("completed", "paid"))
+        self.assertTrue(payment.order.thank_you_email_sent)
+
+    def test_swept_payments_are_only_looked_up_shortly_after_the_sweep(self) -> None:
+        payment = self._payment("coinbase")
+        Order.objects.filter(pk=payment.order_id).update(created_at=timezone.now() - timedelta(days=2))
+        expire_stale_orders(timedelta(hours=24))
+        self.assertEqual(reconcile_payments(timedelta(minutes=30)).checked, 1)
+
+        Payment.objects.filter(pk=payment.pk).update(updated_at=timezone.now() - SWEPT_LOOKBACK)
+        self.assertEqual(reconcile_payments(timedelta(minutes=30)).checked, 0)
+
+    def test_command_reports_statistics(self) -> None:
+        self.simulator.approve(self._payment("paypal").provider_payment_id)
+        out = io.StringIO()
+        call_command("reconcile_payments", "--workers", "2", stdout=out)
+        self.assertIn("checked=1 paid=1 failed=0 open=0 errors=0", out.getvalue())
+        self.assertIn("lookups/s", out.getvalue())
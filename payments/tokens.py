@@ -0,0 +1,183 @@
+"""Shared cache for gateway OAuth access tokens (PayPal ``client_credentials``).
+
+Tokens are cached until ``expires_in`` minus a refresh margin. Only one caller
+refreshes a token at a time: threads in a process serialize on a local lock
+and, with the Django cache backend, workers coordinate through a short-lived
+``cache.add`` lock. While a refresh is in flight everybody else keeps using the
+still-valid token, or briefly waits for the new one if there is none.
+
+Tokens are only shared across processes if the Django cache is. The settings
+configure no CACHES backend, so the default is per-process local memory: each
+worker or serverless instance fetches and refreshes its own token. Configure a
+shared CACHES backend (Redis, Memcached) to share tokens and the single-flight
+refresh between workers.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Callable, Protocol
+
+# Refresh this many seconds before the gateway-reported expiry.
+DEFAULT_REFRESH_MARGIN = 300
+REFRESH_LOCK_TIMEOUT = 30
+WAIT_POLL_INTERVAL = 0.05
+
+
+class TokenBackend(Protocol):
+    def get(self, key: str) -> dict | None: ...
+
+    def set(self, key: str, value: dict, timeout: float) -> None: ...
+
+    def add(self, key: str, value: object, timeout: float) -> bool: ...
+
+    def delete(self, key: str) -> None: ...
+
+
+class LocalTokenBackend:
+    """In-process backend; each worker process keeps its own token."""
+
+    def __init__(self) -> None:
+        self._data: dict[str, tuple[object, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at <= time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key: str, value, timeout: float) -> None:
+        with self._lock:
+            self._data[key] = (value, time.time() + timeout)
+
+    def add(self, key: str, value, timeout: float) -> bool:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[1] > time.time():
+                return False
+            self._data[key] = (value, time.time() + timeout)
+            return True
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class DjangoCacheTokenBackend:
+    """Backend on a Django cache alias, shared by every worker using it."""
+
+    def __init__(self, alias: str = "default") -> None:
+        self.alias = alias
+
+    @property
+    def _cache(self):
+        from django.core.cache import caches
+
+        return caches[self.alias]
+
+    def get(self, key: str):
+        return self._cache.get(key)
+
+    def set(self, key: str, value, timeout: float) -> None:
+        self._cache.set(key, value, timeout)
+
+    def add(self, key: str, value, timeout: float) -> bool:
+        return self._cache.add(key, value, timeout)
+
+    def delete(self, key: str) -> None:
+        self._cache.delete(key)
+
+
+class AccessTokenCache:
+    """Cache of access tokens with early refresh and single-flight fetching."""
+
+    def __init__(self, backend: TokenBackend, refresh_margin: float = DEFAULT_REFRESH_MARGIN) -> None:
+        self.backend = backend
+        self.refresh_margin = refresh_margin
+        self._local_locks: dict[str, threading.Lock] = {}
+        self._local_locks_guard = threading.Lock()
+
+    def _local_lock(self, key: str) -> threading.Lock:
+        with self._local_locks_guard:
+            return self._local_locks.setdefault(key, threading.Lock())
+
+    def invalidate(self, key: str) -> None:
+        self.backend.delete(key)
+
+    def get_token(self, key: str, fetch: Callable[[], tuple[str, float]]) -> str:
+        """Return a valid token for ``key``, calling ``fetch`` only when needed.
+
+        ``fetch`` must return ``(access_token, expires_in_seconds)``.
+        """
+
+        entry = self.backend.get(key)
+        if entry is not None and time.time() < entry["refresh_at"]:
+            return entry["token"]
+
+        with self._local_lock(key):
+            # Another thread may have refreshed while we waited for the lock.
+            entry = self.backend.get(key)
+            if entry is not None and time.time() < entry["refresh_at"]:
+                return entry["token"]
+
+            lock_key = f"{key}:refresh"
+            deadline = time.time() + REFRESH_LOCK_TIMEOUT
+            locked = self.backend.add(lock_key, 1, REFRESH_LOCK_TIMEOUT)
+            while not locked:
+                # Another worker is refreshing: keep using the current token
+                # while it is still valid, otherwise wait for the new one.
+                if entry is not None and time.time() < entry["expires_at"]:
+                    return entry["token"]
+                if time.time() >= deadline:
+                    break
+                time.sleep(WAIT_POLL_INTERVAL)
+                entry = self.backend.get(key)
+                if entry is not None and time.time() < entry["refresh_at"]:
+                    return entry["token"]
+                locked = self.backend.add(lock_key, 1, REFRESH_LOCK_TIMEOUT)
+
+            try:
+                token, expires_in = fetch()
+                now = time.time()
+                expires_in = max(float(expires_in), 0.0)
+                margin = min(self.refresh_margin, expires_in / 2)
+                entry = {"token": token, "expires_at": now + expires_in, "refresh_at": now + expires_in - margin}
+                if expires_in > 0:
+                    self.backend.set(key, entry, expires_in)
+                return token
+            finally:
+                if locked:
+                    self.backend.delete(lock_key)
+
+
+_token_cache: AccessTokenCache | None = None
+_token_cache_lock = threading.Lock()
+
+
+def get_token_cache() -> AccessTokenCache:
+    """Return the process-wide token cache configured from the environment.
+
+    Optional environment variables:
+      - GATEWAY_TOKEN_CACHE ("django" (default) to go through the Django
+        cache, shared across processes only when CACHES is, or "local" for a
+        per-process cache)
+      - GATEWAY_TOKEN_CACHE_ALIAS (Django cache alias, default "default")
+    """
+
+    global _token_cache
+    if _token_cache is None:
+        with _token_cache_lock:
+            if _token_cache is None:
+                if os.getenv("GATEWAY_TOKEN_CACHE", "django").lower() == "local":
+                    backend: TokenBackend = LocalTokenBackend()
+                else:
+                    backend = DjangoCacheTokenBackend(os.getenv("GATEWAY_TOKEN_CACHE_ALIAS", "default"))
+                _token_cache = AccessTokenCache(backend)
+    return _token_cache
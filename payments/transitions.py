@@ -0,0 +1,89 @@
+"""Explicit state machine for ``Payment`` and ``Order`` status changes.
+
+Every transition is one conditional ``UPDATE ... WHERE status IN (allowed)``,
+so the database decides who wins: duplicate or concurrent webhook deliveries
+become no-op updates, and out-of-order events (e.g. a late ``charge:failed``
+after the order was paid) cannot move a row backwards. Callers fire
+fulfilment only when ``TransitionResult.order_won`` is true.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from orders.models import Order
+from .models import Payment
+
+# target status -> statuses it may be entered from
+PAYMENT_TRANSITIONS: dict[str, frozenset[str]] = {
+    "pending": frozenset({"created"}),
+    # A failed charge can still be resolved (e.g. Coinbase manual resolution).
+    "completed": frozenset({"created", "pending", "failed"}),
+    "failed": frozenset({"created", "pending"}),
+}
+
+ORDER_TRANSITIONS: dict[str, frozenset[str]] = {
+    "processing": frozenset({"pending"}),
+    # A cancelled (swept) order is reopened when its payment completes late:
+    # the customer paid, so it must still be fulfilled.
+    "paid": frozenset({"pending", "processing", "failed", "cancelled"}),
+    "failed": frozenset({"pending", "processing"}),
+    "cancelled": frozenset({"pending", "processing", "failed"}),
+}
+
+
+class InvalidTransition(ValueError):
+    """Raised for a target status the state machine does not know."""
+
+
+@dataclass(frozen=True)
+class TransitionResult:
+    payment_won: bool
+    order_won: bool = False
+
+
+def transition_order(orders: QuerySet[Order], to_status: str, **fields) -> int:
+    """Move every order in ``orders`` allowed to reach ``to_status``; return the count."""
+
+    if to_status not in ORDER_TRANSITIONS:
+        raise InvalidTransition(f"Unknown order status {to_status!r}")
+    return orders.filter(status__in=ORDER_TRANSITIONS[to_status]).update(
+        status=to_status, updated_at=timezone.now(), **fields
+    )
+
+
+def transition_payment(
+    payments: QuerySet[Payment],
+    to_status: str,
+    *,
+    order_status: str | None = None,
+    **fields,
+) -> TransitionResult:
+    """Move the payment(s) selected by ``payments`` to ``to_status``.
+
+    ``fields`` are written in the same UPDATE (e.g. ``provider_payment_id``).
+    When the payment transition wins and ``order_status`` is given, the
+    related order is moved too, in the same transaction. Nothing is read
+    from the database: ``payments`` is only used as a WHERE clause, so it
+    must select by identity (pk, provider id), never by status.
+    """
+
+    if to_status not in PAYMENT_TRANSITIONS:
+        raise InvalidTransition(f"Unknown payment status {to_status!r}")
+    if order_status is not None and order_status not in ORDER_TRANSITIONS:
+        raise InvalidTransition(f"Unknown order status {order_status!r}")
+
+    with transaction.atomic():
+        payment_won = bool(
+            payments.filter(status__in=PAYMENT_TRANSITIONS[to_status]).update(
+                status=to_status, updated_at=timezone.now(), **fields
+            )
+        )
+        order_won = False
+        if payment_won and order_status is not None:
+            orders = Order.objects.filter(pk__in=payments.values("order_id"))
+            order_won = bool(transition_order(orders, order_status))
+    return TransitionResult(payment_won, order_won)
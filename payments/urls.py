@@ -9,5 +9,6 @@ app_name = "payments"
 urlpatterns = [
     path("paypal/webhook/", views.paypal_webhook, name="paypal_webhook"),
     path("coinbase/webhook/", views.coinbase_webhook, name="coinbase_webhook"),
+    path("gateways/status/", views.gateway_status, name="gateway_status"),
 ]
 
@@ -2,29 +2,65 @@ from __future__ import annotations
 
 """Helpers for talking to PayPal and Coinbase Commerce without extra deps.
 
-These functions use the Python stdlib (urllib) so we do not need to install
-additional HTTP client libraries. They are intentionally minimal and suitable
-for a first MVP; hardening (signature verification, retries, logging) can be
-added later.
+These functions use the Python stdlib (http.client, via the pooled
+``payments.gateway_http`` client) so we do not need to install additional HTTP
+client libraries. Connections are reused across calls and idempotent calls are
+retried. The ``a``-prefixed variants do the same over non-blocking asyncio
+streams for async views. Incoming webhook signatures are checked in
+``payments.signatures``, which trusts PayPal certificates served from
+``paypal_base_url()``.
+Every gateway call runs under ``payments.resilience`` (circuit breaker and
+concurrency limit), so an unhealthy gateway fails fast instead of holding
+workers until the timeout.
 """
 
 import base64
-import json
+import hashlib
 import os
+from contextlib import contextmanager
 from decimal import Decimal
-from typing import TYPE_CHECKING, Tuple
+from typing import TYPE_CHECKING, Iterator, Sequence, Tuple
 
-import urllib.error
-import urllib.request
+from asgiref.sync import sync_to_async
+
+from .gateway_async import get_async_gateway_client
+from .gateway_http import GatewayHTTPClient, GatewayHTTPError, get_gateway_client
+from .resilience import GatewayRejected, get_gateway_guard
+from .tokens import get_token_cache
 
 if TYPE_CHECKING:  # pragma: no cover - import only for type checkers
-    from orders.models import Order
+    from orders.models import Order, OrderItem
 
 
 class PaymentGatewayError(Exception):
     """Raised when a call to an external payment gateway fails."""
 
 
+class GatewayUnavailableError(PaymentGatewayError):
+    """Raised without calling the gateway: its circuit is open or it is at capacity."""
+
+    def __init__(self, message: str, gateway: str) -> None:
+        super().__init__(message)
+        self.gateway = gateway
+
+
+@contextmanager
+def _guarded(gateway: str) -> Iterator[None]:
+    """Run a gateway call under its circuit breaker and bulkhead."""
+
+    try:
+        with get_gateway_guard(gateway).call():
+            yield
+    except GatewayRejected as exc:
+        raise GatewayUnavailableError(str(exc), gateway) from exc
+
+
+def gateway_available(gateway: str) -> bool:
+    """Whether a call to ``gateway`` would currently be attempted."""
+
+    return get_gateway_guard(gateway).available()
+
+
 def _to_str_amount(value: Decimal | float | int) -> str:
     """Convert a numeric value to a plain string acceptable by gateways."""
 
@@ -36,85 +72,113 @@ def _to_str_amount(value: Decimal | float | int) -> str:
 # ---------------------------------------------------------------------------
 
 
-def _paypal_base_url() -> str:
+def _simulator_base_url() -> str:
+    # ``manage.py run_gateway_simulator`` (payments.simulator) listens here.
+    return os.getenv("PAYMENT_SIMULATOR_URL", "http://127.0.0.1:8787").rstrip("/")
+
+
+def paypal_base_url() -> str:
+    """PayPal REST API root for ``PAYPAL_ENV``, or ``PAYPAL_API_BASE`` when set."""
+
+    # PAYPAL_API_BASE points the helpers at any other stand-in (tests).
+    override = os.getenv("PAYPAL_API_BASE")
+    if override:
+        return override.rstrip("/")
     env = os.getenv("PAYPAL_ENV", "sandbox").lower()
+    if env == "simulator":
+        return _simulator_base_url()
     if env == "live":
         return "https://api-m.paypal.com"
     return "https://api-m.sandbox.paypal.com"
 
 
-def create_paypal_order(order: "Order", success_url: str, cancel_url: str) -> Tuple[str, str]:
-    """Create a PayPal order and return (approval_url, paypal_order_id).
-
-    Environment variables required:
-      - PAYPAL_CLIENT_ID
-      - PAYPAL_CLIENT_SECRET
-      - optional PAYPAL_ENV ("sandbox" or "live")
-    """
-
+def _paypal_credentials() -> Tuple[str, str]:
     client_id = os.getenv("PAYPAL_CLIENT_ID")
     secret = os.getenv("PAYPAL_CLIENT_SECRET")
     if not client_id or not secret:
         raise PaymentGatewayError("PAYPAL_CLIENT_ID / PAYPAL_CLIENT_SECRET not configured")
+    return client_id, secret
 
-    auth = base64.b64encode(f"{client_id}:{secret}".encode()).decode()
-    base = _paypal_base_url()
 
-    # 1) Obtain access token
-    token_req = urllib.request.Request(
-        f"{base}/v1/oauth2/token",
-        data="grant_type=client_credentials".encode(),
-        headers={
-            "Authorization": f"Basic {auth}",
-            "Content-Type": "application/x-www-form-urlencoded",
-        },
-        method="POST",
-    )
+def _paypal_token_key(base: str, client_id: str) -> str:
+    digest = hashlib.sha256(f"{base}|{client_id}".encode()).hexdigest()[:32]
+    return f"payments:paypal-token:{digest}"
 
-    try:
-        with urllib.request.urlopen(token_req, timeout=10) as resp:
-            token_data = json.loads(resp.read().decode())
-    except urllib.error.URLError as exc:  # pragma: no cover - network dependent
-        raise PaymentGatewayError(f"PayPal token error: {exc}") from exc
 
-    access_token = token_data.get("access_token")
-    if not access_token:
-        raise PaymentGatewayError("PayPal access token missing from response")
+def paypal_access_token(*, force_refresh: bool = False) -> str:
+    """Return a cached PayPal OAuth token, fetching a new one only when needed.
 
-    # 2) Create order
-    body = {
-        "intent": "CAPTURE",
-        "purchase_units": [
-            {
-                "amount": {
-                    "currency_code": order.currency or "MXN",
-                    "value": _to_str_amount(order.amount),
+    Tokens are shared through ``payments.tokens`` and refreshed shortly before
+    the ``expires_in`` PayPal reports, so checkouts normally skip this call.
+    """
+
+    client_id, secret = _paypal_credentials()
+    base = paypal_base_url()
+    key = _paypal_token_key(base, client_id)
+    token_cache = get_token_cache()
+    if force_refresh:
+        token_cache.invalidate(key)
+
+    def fetch() -> Tuple[str, float]:
+        auth = base64.b64encode(f"{client_id}:{secret}".encode()).decode()
+        # Token requests are safe to replay, so they may be retried.
+        try:
+            token_data = get_gateway_client().request(
+                "POST",
+                f"{base}/v1/oauth2/token",
+                body="grant_type=client_credentials".encode(),
+                headers={
+                    "Authorization": f"Basic {auth}",
+                    "Content-Type": "application/x-www-form-urlencoded",
                 },
-                "custom_id": str(order.id),
+                idempotent=True,
+            ).json()
+        except (GatewayHTTPError, ValueError) as exc:
+            raise PaymentGatewayError(f"PayPal token error: {exc}") from exc
+
+        access_token = token_data.get("access_token")
+        if not access_token:
+            raise PaymentGatewayError("PayPal access token missing from response")
+        return access_token, token_data.get("expires_in", 0)
+
+    return token_cache.get_token(key, fetch)
+
+
+def _paypal_order_body(
+    order: "Order", success_url: str, cancel_url: str, items: Sequence["OrderItem"] = ()
+) -> dict:
+    currency = order.currency or "MXN"
+    purchase_unit = {
+        "amount": {
+            "currency_code": currency,
+            "value": _to_str_amount(order.amount),
+        },
+        "custom_id": str(order.id),
+    }
+    if items:
+        purchase_unit["items"] = [
+            {
+                "name": (item.name or f"Item {item.pk}")[:127],
+                "quantity": str(item.quantity),
+                "unit_amount": {"currency_code": currency, "value": _to_str_amount(item.unit_price)},
             }
-        ],
+            for item in items
+        ]
+        purchase_unit["amount"]["breakdown"] = {
+            "item_total": {"currency_code": currency, "value": _to_str_amount(order.amount)},
+        }
+
+    return {
+        "intent": "CAPTURE",
+        "purchase_units": [purchase_unit],
         "application_context": {
             "return_url": success_url,
             "cancel_url": cancel_url,
         },
     }
 
-    order_req = urllib.request.Request(
-        f"{base}/v2/checkout/orders",
-        data=json.dumps(body).encode(),
-        headers={
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json",
-        },
-        method="POST",
-    )
-
-    try:
-        with urllib.request.urlopen(order_req, timeout=10) as resp:
-            order_data = json.loads(resp.read().decode())
-    except urllib.error.URLError as exc:  # pragma: no cover - network dependent
-        raise PaymentGatewayError(f"PayPal order error: {exc}") from exc
 
+def _paypal_approval(order_data: dict) -> Tuple[str, str]:
     approval_url = None
     for link in order_data.get("links", []):
         if link.get("rel") == "approve":
@@ -127,25 +191,167 @@ def create_paypal_order(order: "Order", success_url: str, cancel_url: str) -> Tu
     return approval_url, order_data.get("id", "")
 
 
+def _paypal_order_headers(token: str, request_id: str) -> dict[str, str]:
+    headers = {"Authorization": f"Bearer {token}"}
+    if request_id:
+        headers["PayPal-Request-Id"] = request_id
+    return headers
+
+
+def create_paypal_order(
+    order: "Order",
+    success_url: str,
+    cancel_url: str,
+    items: Sequence["OrderItem"] = (),
+    request_id: str = "",
+) -> Tuple[str, str]:
+    """Create a PayPal order and return (approval_url, paypal_order_id).
+
+    ``items`` (cart checkouts) are sent as PayPal line items with an
+    ``item_total`` breakdown; they must add up to ``order.amount``.
+
+    ``request_id`` is sent as ``PayPal-Request-Id``: PayPal answers a repeated
+    request with the order it already created, so the call is also retried.
+
+    Environment variables required:
+      - PAYPAL_CLIENT_ID
+      - PAYPAL_CLIENT_SECRET
+      - optional PAYPAL_ENV ("sandbox", "live" or "simulator") or PAYPAL_API_BASE
+    """
+
+    base = paypal_base_url()
+    client = get_gateway_client()
+    body = _paypal_order_body(order, success_url, cancel_url, items)
+
+    def post_order(token: str):
+        return client.post_json(
+            f"{base}/v2/checkout/orders",
+            body,
+            headers=_paypal_order_headers(token, request_id),
+            idempotent=bool(request_id),
+        ).json()
+
+    with _guarded("paypal"):
+        # 1) Obtain (cached) access token
+        access_token = paypal_access_token()
+
+        # 2) Create order
+        try:
+            try:
+                order_data = post_order(access_token)
+            except GatewayHTTPError as exc:
+                if exc.status != 401:
+                    raise
+                # The cached token was revoked or expired early: refresh once.
+                order_data = post_order(paypal_access_token(force_refresh=True))
+        except (GatewayHTTPError, ValueError) as exc:
+            raise PaymentGatewayError(f"PayPal order error: {exc}") from exc
+
+    return _paypal_approval(order_data)
+
+
+async def acreate_paypal_order(
+    order: "Order",
+    success_url: str,
+    cancel_url: str,
+    items: Sequence["OrderItem"] = (),
+    request_id: str = "",
+) -> Tuple[str, str]:
+    """Async ``create_paypal_order`` for the ASGI checkout view.
+
+    The order call uses the non-blocking client. The token usually comes
+    straight from the shared cache; when it has to be fetched, that happens on
+    a worker thread so the event loop is never blocked.
+    """
+
+    base = paypal_base_url()
+    client = get_async_gateway_client()
+    get_access_token = sync_to_async(paypal_access_token, thread_sensitive=False)
+    body = _paypal_order_body(order, success_url, cancel_url, items)
+
+    async def post_order(token: str):
+        response = await client.post_json(
+            f"{base}/v2/checkout/orders",
+            body,
+            headers=_paypal_order_headers(token, request_id),
+            idempotent=bool(request_id),
+        )
+        return response.json()
+
+    with _guarded("paypal"):
+        try:
+            try:
+                order_data = await post_order(await get_access_token())
+            except GatewayHTTPError as exc:
+                if exc.status != 401:
+                    raise
+                order_data = await post_order(await get_access_token(force_refresh=True))
+        except (GatewayHTTPError, ValueError) as exc:
+            raise PaymentGatewayError(f"PayPal order error: {exc}") from exc
+
+    return _paypal_approval(order_data)
+
+
+def get_paypal_order(paypal_order_id: str, *, client: GatewayHTTPClient | None = None) -> dict:
+    """Fetch a PayPal order as the gateway sees it now (status, purchase units).
+
+    ``client`` replaces the shared client, e.g. one with a connection pool
+    sized for a batch of parallel lookups.
+    """
+
+    base = paypal_base_url()
+    client = client or get_gateway_client()
+
+    def get_order(token: str):
+        return client.request(
+            "GET", f"{base}/v2/checkout/orders/{paypal_order_id}", headers={"Authorization": f"Bearer {token}"}
+        ).json()
+
+    with _guarded("paypal"):
+        try:
+            try:
+                return get_order(paypal_access_token())
+            except GatewayHTTPError as exc:
+                if exc.status != 401:
+                    raise
+                return get_order(paypal_access_token(force_refresh=True))
+        except (GatewayHTTPError, ValueError) as exc:
+            raise PaymentGatewayError(f"PayPal order lookup error: {exc}") from exc
+
+
 # ---------------------------------------------------------------------------
 # Coinbase Commerce helpers
 # ---------------------------------------------------------------------------
 
 
-def create_coinbase_charge(order: "Order", success_url: str, cancel_url: str) -> Tuple[str, str]:
-    """Create a Coinbase Commerce charge and return (hosted_url, charge_id).
+def _coinbase_base_url() -> str:
+    # COINBASE_API_BASE points the helpers at any other stand-in (tests).
+    override = os.getenv("COINBASE_API_BASE")
+    if override:
+        return override.rstrip("/")
+    if os.getenv("COINBASE_ENV", "live").lower() == "simulator":
+        return _simulator_base_url()
+    return "https://api.commerce.coinbase.com"
 
-    Environment variables required:
-      - COINBASE_COMMERCE_API_KEY
-    """
 
+def _coinbase_headers() -> dict[str, str]:
     api_key = os.getenv("COINBASE_COMMERCE_API_KEY")
     if not api_key:
         raise PaymentGatewayError("COINBASE_COMMERCE_API_KEY not configured")
+    return {"X-CC-Api-Key": api_key, "X-CC-Version": "2018-03-22"}
+
+
+def _coinbase_charge_body(order: "Order", success_url: str, cancel_url: str) -> dict:
+    if order.package is not None:
+        name, description = order.package.name_es, order.package.short_description_es
+    else:
+        # Cart order without packages: describe it by its line items.
+        name = f"AltIQ - Pedido #{order.id}"
+        description = ", ".join(order.items.values_list("name", flat=True))[:200]
 
-    body = {
-        "name": order.package.name_es,
-        "description": order.package.short_description_es,
+    return {
+        "name": name,
+        "description": description,
         "pricing_type": "fixed_price",
         "local_price": {
             "amount": _to_str_amount(order.amount),
@@ -156,23 +362,8 @@ def create_coinbase_charge(order: "Order", success_url: str, cancel_url: str) ->
         "cancel_url": cancel_url,
     }
 
-    req = urllib.request.Request(
-        "https://api.commerce.coinbase.com/charges",
-        data=json.dumps(body).encode(),
-        headers={
-            "X-CC-Api-Key": api_key,
-            "X-CC-Version": "2018-03-22",
-            "Content-Type": "application/json",
-        },
-        method="POST",
-    )
-
-    try:
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            data = json.loads(resp.read().decode())
-    except urllib.error.URLError as exc:  # pragma: no cover - network dependent
-        raise PaymentGatewayError(f"Coinbase charge error: {exc}") from exc
 
+def _coinbase_hosted_url(data: dict) -> Tuple[str, str]:
     charge = data.get("data", {})
     hosted_url = charge.get("hosted_url")
     charge_id = charge.get("id", "")
@@ -182,3 +373,54 @@ def create_coinbase_charge(order: "Order", success_url: str, cancel_url: str) ->
 
     return hosted_url, charge_id
 
+
+def create_coinbase_charge(order: "Order", success_url: str, cancel_url: str) -> Tuple[str, str]:
+    """Create a Coinbase Commerce charge and return (hosted_url, charge_id).
+
+    Environment variables required:
+      - COINBASE_COMMERCE_API_KEY
+      - optional COINBASE_ENV ("live" or "simulator") or COINBASE_API_BASE
+    """
+
+    headers = _coinbase_headers()
+    body = _coinbase_charge_body(order, success_url, cancel_url)
+    with _guarded("coinbase"):
+        try:
+            data = get_gateway_client().post_json(f"{_coinbase_base_url()}/charges", body, headers=headers).json()
+        except (GatewayHTTPError, ValueError) as exc:
+            raise PaymentGatewayError(f"Coinbase charge error: {exc}") from exc
+
+    return _coinbase_hosted_url(data)
+
+
+async def acreate_coinbase_charge(order: "Order", success_url: str, cancel_url: str) -> Tuple[str, str]:
+    """Async ``create_coinbase_charge`` using the non-blocking client."""
+
+    headers = _coinbase_headers()
+    # Cart orders are described by their items, which needs a query.
+    body = await sync_to_async(_coinbase_charge_body)(order, success_url, cancel_url)
+    with _guarded("coinbase"):
+        try:
+            response = await get_async_gateway_client().post_json(
+                f"{_coinbase_base_url()}/charges", body, headers=headers
+            )
+            data = response.json()
+        except (GatewayHTTPError, ValueError) as exc:
+            raise PaymentGatewayError(f"Coinbase charge error: {exc}") from exc
+
+    return _coinbase_hosted_url(data)
+
+
+def get_coinbase_charge(charge_id: str, *, client: GatewayHTTPClient | None = None) -> dict:
+    """Fetch a Coinbase Commerce charge (including its status timeline)."""
+
+    headers = _coinbase_headers()
+    with _guarded("coinbase"):
+        try:
+            data = (client or get_gateway_client()).request(
+                "GET", f"{_coinbase_base_url()}/charges/{charge_id}", headers=headers
+            ).json()
+        except (GatewayHTTPError, ValueError) as exc:
+            raise PaymentGatewayError(f"Coinbase charge lookup error: {exc}") from exc
+
+    return data.get("data", {})
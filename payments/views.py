@@ -1,107 +1,82 @@
 from __future__ import annotations
 
-import json
+import logging
 
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.http import HttpRequest, HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 
-from orders.emails import send_order_thank_you_email_with_codes
-from .models import Payment
+from jobs.registry import enqueue
+from orders.emails import deliver_outbox_batch
+from .resilience import gateway_health
+from .signatures import InvalidSignature, SignatureUnavailable, verify_webhook
+from .webhooks import PROCESS_JOB, InvalidWebhookPayload, parse_event, process_pending_events, record_event
 
+logger = logging.getLogger(__name__)
 
-@csrf_exempt
-@require_POST
-def paypal_webhook(request: HttpRequest) -> HttpResponse:
-    """Very small PayPal webhook handler for MVP.
 
-    For now we trust PayPal's call (IPN/webhook) and only look at the
-    order/payment identifiers. Proper signature verification can be added
-    before going live.
-    """
+def _ingest(request: HttpRequest, provider: str) -> HttpResponse:
+    # Unsigned or forged deliveries are turned away before any parsing or
+    # database work.
+    try:
+        verify_webhook(provider, request.body, request.headers)
+    except InvalidSignature as exc:
+        logger.warning("Rejected %s webhook: %s", provider, exc)
+        return HttpResponse(status=401)
+    except SignatureUnavailable as exc:
+        # Not acknowledged, so the gateway redelivers later.
+        logger.warning("Cannot verify %s webhook: %s", provider, exc)
+        return HttpResponse(status=503)
 
-    data = request.body.decode() or "{}"
     try:
-        payload = json.loads(data)
-    except Exception:  # pragma: no cover - defensive, we just ignore bad JSON
+        event = parse_event(provider, request.body)
+    except InvalidWebhookPayload:
         return HttpResponse(status=400)
 
-    resource = payload.get("resource", {})
-    paypal_order_id = resource.get("id") or resource.get("supplementary_data", {}).get("related_ids", {}).get("order_id")
+    record_event(event)
 
-    if not paypal_order_id:
-        return HttpResponse(status=400)
+    # Inline by default, as serverless deployments have no worker process.
+    if getattr(settings, "ALTIQ_WEBHOOKS_INLINE", True):
+        process_pending_events()
+        deliver_outbox_batch()
+    else:
+        enqueue(PROCESS_JOB, unique_key=PROCESS_JOB)
 
-    payment = Payment.objects.filter(provider_payment_id=paypal_order_id, method="paypal").select_related("order").first()
-    if not payment:
-        return HttpResponse(status=200)
+    return JsonResponse({"status": "accepted"})
 
-    payment.status = "completed"
-    payment.raw_payload = payload
-    payment.save(update_fields=["status", "raw_payload"])
 
-    payment.order.status = "paid"
-    payment.order.save(update_fields=["status"])
+@csrf_exempt
+@require_POST
+def paypal_webhook(request: HttpRequest) -> HttpResponse:
+    """Store a PayPal webhook delivery and acknowledge it immediately.
 
-    # Generate per-product codes and send the thank-you email (idempotent).
-    send_order_thank_you_email_with_codes(payment.order)
+    The transmission signature is checked locally against PayPal's signing
+    certificate (cached, see ``payments.signatures``); unsigned deliveries
+    get a 401. Stored events are processed by ``payments.webhooks``, in this
+    request or in a worker (see ``ALTIQ_WEBHOOKS_INLINE``).
+    """
 
-    return JsonResponse({"status": "ok"})
+    return _ingest(request, "paypal")
 
 
 @csrf_exempt
 @require_POST
 def coinbase_webhook(request: HttpRequest) -> HttpResponse:
-    """Very small Coinbase Commerce webhook handler for MVP.
+    """Store a Coinbase Commerce webhook delivery and acknowledge it.
 
-    We simply trust the event for now and mark the payment as completed when
-    the charge is marked "CONFIRMED". Signature verification is intentionally
-    left for a later hardening pass.
+    The ``X-CC-Webhook-Signature`` HMAC must match the endpoint's shared
+    secret; unsigned deliveries get a 401. Stored events are processed by
+    ``payments.webhooks``, in this request or in a worker (see
+    ``ALTIQ_WEBHOOKS_INLINE``).
     """
 
-    data = request.body.decode() or "{}"
-    try:
-        payload = json.loads(data)
-    except Exception:  # pragma: no cover
-        return HttpResponse(status=400)
-
-    event_type = payload.get("type")
-    charge = payload.get("data", {})
-    charge_id = charge.get("id")
-    timeline = charge.get("timeline", [])
-
-    if not charge_id:
-        return HttpResponse(status=400)
-
-    last_status = None
-    if timeline:
-        last_status = timeline[-1].get("status")
-
-    payment = Payment.objects.filter(provider_payment_id=charge_id, method="coinbase").select_related("order").first()
-    if not payment:
-        return HttpResponse(status=200)
-
-    if event_type == "charge:confirmed" or last_status == "COMPLETED":
-        payment.status = "completed"
-        payment.order.status = "paid"
-        order_update_fields = ["status"]
-    elif event_type in {"charge:failed", "charge:expired"} or last_status in {"FAILED", "EXPIRED"}:
-        payment.status = "failed"
-        payment.order.status = "failed"
-        order_update_fields = ["status"]
-    else:
-        # Other statuses are ignored for now but payload is stored.
-        payment.raw_payload = payload
-        payment.save(update_fields=["raw_payload"])
-        return JsonResponse({"status": "ignored"})
-
-    payment.raw_payload = payload
-    payment.save(update_fields=["status", "raw_payload"])
-    payment.order.save(update_fields=order_update_fields)
+    return _ingest(request, "coinbase")
 
-    if payment.order.status == "paid":
-        # Only when payment is truly successful we generate codes & email.
-        send_order_thank_you_email_with_codes(payment.order)
 
-    return JsonResponse({"status": "ok"})
+@staff_member_required
+def gateway_status(request: HttpRequest) -> HttpResponse:
+    """Circuit breaker and bulkhead state per gateway, as seen by this process."""
 
+    return JsonResponse(gateway_health())
@@ -0,0 +1,262 @@
+"""Persist-then-process pipeline for PayPal and Coinbase webhooks.
+
+``record_event`` is all the webhook views do: one ``INSERT ... ON CONFLICT DO
+NOTHING`` keyed on the provider event id, plus queueing the ``PROCESS_JOB``
+background job. ``process_pending_events`` (run by that job under
+``manage.py runworker``, by ``manage.py process_webhooks``, or inside the
+webhook request with ``ALTIQ_WEBHOOKS_INLINE``) later claims stored events in
+batches, applies the payment/order transitions and triggers fulfilment.
+
+A claim is a lease: events whose processor died are claimed again once
+``CLAIM_LEASE`` has passed. The gateway already got its 200 and will not
+redeliver, so an event that raises is retried up to ``MAX_ATTEMPTS`` times
+before it is left "failed" for a manual replay.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from orders.emails import send_order_thank_you_email_with_codes
+from orders.models import Order
+from .models import Payment, PaymentPayload, WebhookEvent
+from .transitions import transition_payment
+
+
+# Job (payments/jobs.py) that drains stored events.
+PROCESS_JOB = "payments.process_webhooks"
+# Claimed events still "processing" after this are assumed orphaned.
+CLAIM_LEASE = timedelta(minutes=5)
+MAX_ATTEMPTS = 5
+
+
+class InvalidWebhookPayload(ValueError):
+    """Raised when a webhook body cannot be turned into an event."""
+
+
+def _event_id(payload: dict, body: bytes) -> str:
+    event_id = payload.get("id") or payload.get("event", {}).get("id")
+    if event_id:
+        return str(event_id)[:120]
+    # No provider id: fall back to the body hash, so exact redeliveries dedupe.
+    return "sha256:" + hashlib.sha256(body).hexdigest()
+
+
+def paypal_order_id(payload: dict) -> str | None:
+    resource = payload.get("resource", {})
+    return resource.get("id") or resource.get("supplementary_data", {}).get("related_ids", {}).get("order_id")
+
+
+def coinbase_event(payload: dict) -> dict:
+    # Coinbase wraps the event under "event"; older/simple payloads are flat.
+    return payload.get("event", payload)
+
+
+def parse_event(provider: str, body: bytes) -> WebhookEvent:
+    """Validate a raw webhook body and build (without saving) its event row."""
+
+    try:
+        payload = json.loads(body.decode() or "{}")
+    except ValueError as exc:
+        raise InvalidWebhookPayload("Body is not valid JSON") from exc
+    if not isinstance(payload, dict):
+        raise InvalidWebhookPayload("Body is not a JSON object")
+
+    if provider == "paypal":
+        if not paypal_order_id(payload):
+            raise InvalidWebhookPayload("PayPal event without order id")
+        event_type = payload.get("event_type", "")
+    else:
+        event = coinbase_event(payload)
+        if not event.get("data", {}).get("id"):
+            raise InvalidWebhookPayload("Coinbase event without charge id")
+        event_type = event.get("type", "")
+
+    return WebhookEvent(
+        provider=provider,
+        event_id=_event_id(payload, body),
+        event_type=(event_type or "")[:120],
+        payload=payload,
+    )
+
+
+def record_event(event: WebhookEvent) -> None:
+    """Store an event with a single insert; duplicates are silently dropped."""
+
+    WebhookEvent.objects.bulk_create([event], ignore_conflicts=True)
+
+
+# ---------------------------------------------------------------------------
+# Processing
+# ---------------------------------------------------------------------------
+
+
+def _fulfil(payments) -> None:
+    order = Order.objects.filter(pk__in=payments.values("order_id")).first()
+    if order is not None:
+        # Generate per-product codes and queue the thank-you email in the
+        # same transaction as the status change (transactional outbox).
+        send_order_thank_you_email_with_codes(order)
+
+
+def _archive(payments, payload: dict) -> None:
+    # Raw payloads are appended, compressed, to PaymentPayload rather than
+    # rewritten on the payment row.
+    PaymentPayload.objects.bulk_create(
+        [PaymentPayload.build(pk, payload, "webhook") for pk in payments.values_list("pk", flat=True)]
+    )
+
+
+def _apply_paypal(payload: dict) -> str:
+    payments = Payment.objects.filter(provider_payment_id=paypal_order_id(payload), method="paypal")
+    result = transition_payment(payments, "completed", order_status="paid")
+    if not result.payment_won:
+        # Unknown payment, or a duplicate/late delivery for a settled one.
+        return "ignored"
+    _archive(payments, payload)
+    if result.order_won:
+        _fulfil(payments)
+    return "processed"
+
+
+def _apply_coinbase(payload: dict) -> str:
+    event = coinbase_event(payload)
+    event_type = event.get("type")
+    charge = event.get("data", {})
+    timeline = charge.get("timeline", [])
+
+    last_status = None
+    if timeline:
+        last_status = timeline[-1].get("status")
+
+    payments = Payment.objects.filter(provider_payment_id=charge.get("id"), method="coinbase")
+
+    paid = event_type == "charge:confirmed" or last_status == "COMPLETED"
+    if paid:
+        result = transition_payment(payments, "completed", order_status="paid")
+    elif event_type in {"charge:failed", "charge:expired"} or last_status in {"FAILED", "EXPIRED"}:
+        result = transition_payment(payments, "failed", order_status="failed")
+    else:
+        # Other statuses are ignored for now but payload is stored.
+        _archive(payments, payload)
+        return "ignored"
+
+    if not result.payment_won:
+        return "ignored"
+    _archive(payments, payload)
+    if paid and result.order_won:
+        # Only when payment is truly successful we generate codes & email.
+        _fulfil(payments)
+    return "processed"
+
+
+HANDLERS = {
+    "paypal": _apply_paypal,
+    "coinbase": _apply_coinbase,
+}
+
+# Gateway-side statuses that settle a payment, as returned by the lookup
+# helpers in payments.utils. An APPROVED PayPal order has not been captured:
+# no money has moved yet, so it stays open.
+PAYPAL_PAID_STATUSES = frozenset({"COMPLETED"})
+COINBASE_PAID_STATUSES = frozenset({"COMPLETED", "RESOLVED"})
+COINBASE_FAILED_STATUSES = frozenset({"FAILED", "EXPIRED"})
+
+
+def gateway_state(provider: str, resource: dict) -> str | None:
+    """Classify a fetched resource: "paid", "failed", or None while still open."""
+
+    if provider == "paypal":
+        return "paid" if resource.get("status") in PAYPAL_PAID_STATUSES else None
+    timeline = resource.get("timeline") or [{}]
+    last_status = timeline[-1].get("status")
+    if last_status in COINBASE_PAID_STATUSES:
+        return "paid"
+    if last_status in COINBASE_FAILED_STATUSES:
+        return "failed"
+    return None
+
+
+def apply_gateway_state(provider: str, resource: dict) -> str | None:
+    """Apply a PayPal order / Coinbase charge fetched from the gateway API.
+
+    Settled payments go through the webhook handlers, as if the missed
+    webhook had arrived. Returns ``gateway_state(provider, resource)``.
+    """
+
+    state = gateway_state(provider, resource)
+    if state is None:
+        return None
+    with transaction.atomic():
+        if provider == "paypal":
+            _apply_paypal({"resource": resource})
+        else:
+            event_type = "charge:confirmed" if state == "paid" else "charge:failed"
+            _apply_coinbase({"event": {"type": event_type, "data": resource}})
+    return state
+
+
+def process_event(event: WebhookEvent) -> str:
+    """Apply one claimed event and record the outcome ("retry" if it will run again)."""
+
+    # Only while this claim is still current: after the lease expired another
+    # processor may have reclaimed the event and owns its outcome.
+    mine = WebhookEvent.objects.filter(pk=event.pk, status="processing", claimed_at=event.claimed_at)
+    try:
+        if event.attempts > MAX_ATTEMPTS:
+            # Only reachable by reclaiming expired leases: processing the
+            # event keeps taking its worker down.
+            raise RuntimeError(f"Lease expired on all {MAX_ATTEMPTS} attempts")
+        with transaction.atomic():
+            outcome = HANDLERS[event.provider](event.payload)
+    except Exception as exc:  # noqa: BLE001 - recorded on the event and retried
+        status = "pending" if event.attempts < MAX_ATTEMPTS else "failed"
+        mine.update(status=status, claimed_at=None, last_error=repr(exc)[:2000])
+        return "retry" if status == "pending" else "failed"
+
+    mine.update(status=outcome, claimed_at=None, last_error="", processed_at=timezone.now())
+    return outcome
+
+
+def claim_pending_events(batch_size: int = 100) -> list[WebhookEvent]:
+    """Claim up to ``batch_size`` pending (or orphaned) events for this worker.
+
+    On Postgres concurrent workers skip each other's rows via ``SKIP LOCKED``;
+    SQLite has no row locks, so run a single worker there.
+    """
+
+    now = timezone.now()
+    due = Q(status="pending") | Q(status="processing", claimed_at__lte=now - CLAIM_LEASE)
+    with transaction.atomic():
+        queryset = WebhookEvent.objects.filter(due).order_by("id")
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        events = list(queryset[:batch_size])
+        if events:
+            WebhookEvent.objects.filter(pk__in=[event.pk for event in events]).update(
+                status="processing", claimed_at=now, attempts=F("attempts") + 1
+            )
+    for event in events:
+        event.status, event.claimed_at, event.attempts = "processing", now, event.attempts + 1
+    return events
+
+
+def process_pending_events(batch_size: int = 100) -> dict[str, int]:
+    """Drain one batch of pending events and return counts per outcome."""
+
+    counts: dict[str, int] = {}
+    for event in claim_pending_events(batch_size):
+        outcome = process_event(event)
+        counts[outcome] = counts.get(outcome, 0) + 1
+    return counts
+
+
+def requeue_events(queryset) -> int:
+    """Mark stored events as pending again so they are replayed."""
+
+    return queryset.update(status="pending", processed_at=None, claimed_at=None, attempts=0)
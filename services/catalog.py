@@ -0,0 +1,150 @@
+"""Read-only, in-process snapshot of the active service catalog.
+
+The services listing used to hit the database (and re-sync the defaults) on
+every request. Instead we keep an immutable snapshot of the active
+``IndividualService`` / ``ServicePackage`` rows per process and rebuild it only
+when the catalog *generation* changes. The generation is a single
+``CatalogGeneration`` row, so a save in one worker invalidates the snapshot
+in every worker and serverless instance. Each process re-reads that row at
+most once every ``GENERATION_TTL`` seconds, so the steady state costs no
+queries and other processes see a change within that window (the process
+that made it sees it at once). Saves/deletes bump it via ``services.signals``.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+from .models import CatalogGeneration, IndividualService, ServicePackage
+
+GENERATION_PK = 1
+# How long a process trusts its last read of the generation row.
+GENERATION_TTL = 5.0
+
+
+@dataclass(frozen=True)
+class CatalogItem:
+    """Immutable copy of the catalog fields rendered by templates."""
+
+    id: int
+    slug: str
+    name_es: str
+    name_en: str
+    short_description_es: str
+    short_description_en: str
+    description_es: str
+    description_en: str
+    icon: str
+    price_mxn: Decimal
+    display_order: int
+
+    def __str__(self) -> str:  # pragma: no cover
+        return self.name_es or self.slug
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    generation: int
+    individual_services: tuple[CatalogItem, ...]
+    packages: tuple[CatalogItem, ...]
+
+    def find(self, kind: str, slug: str) -> CatalogItem | None:
+        """Look up an active ``"package"`` or ``"service"`` by slug."""
+
+        items = self.packages if kind == "package" else self.individual_services
+        return next((item for item in items if item.slug == slug), None)
+
+
+_lock = threading.Lock()
+_snapshot: CatalogSnapshot | None = None
+# (generation, time.monotonic() when it was read)
+_generation: tuple[int, float] | None = None
+
+
+def current_generation() -> int:
+    """Return the catalog generation (0 until the catalog is first changed)."""
+
+    global _generation
+
+    cached = _generation
+    if cached is not None and time.monotonic() - cached[1] < GENERATION_TTL:
+        return cached[0]
+    value = CatalogGeneration.objects.filter(pk=GENERATION_PK).values_list("value", flat=True).first() or 0
+    _generation = (value, time.monotonic())
+    return value
+
+
+def _bump_generation() -> None:
+    global _generation
+
+    # Move to the current time in ns (but always forward), not just +1: a
+    # rolled-back bump must not let a later one reuse a generation that a
+    # snapshot was already built from.
+    now = time.time_ns()
+    bumped = CatalogGeneration.objects.filter(pk=GENERATION_PK).update(value=Greatest(F("value") + 1, Value(now)))
+    if not bumped:
+        CatalogGeneration.objects.get_or_create(pk=GENERATION_PK, defaults={"value": now})
+    # This process re-reads the row on its next lookup instead of waiting out the TTL.
+    _generation = None
+
+
+def invalidate_catalog() -> None:
+    """Invalidate every process' snapshot.
+
+    The generation is bumped immediately and once more after the surrounding
+    transaction commits, so a snapshot rebuilt between the write and the
+    commit (which would still see the old rows) is discarded as well.
+    """
+
+    _bump_generation()
+    transaction.on_commit(_bump_generation)
+
+
+def _item(obj, icon: str = "") -> CatalogItem:
+    return CatalogItem(
+        id=obj.pk,
+        slug=obj.slug,
+        name_es=obj.name_es,
+        name_en=obj.name_en,
+        short_description_es=obj.short_description_es,
+        short_description_en=obj.short_description_en,
+        description_es=obj.description_es,
+        description_en=obj.description_en,
+        icon=icon,
+        price_mxn=obj.price_mxn,
+        display_order=obj.display_order,
+    )
+
+
+def _build_snapshot(generation: int) -> CatalogSnapshot:
+    individual_services = tuple(
+        _item(obj, obj.icon)
+        for obj in IndividualService.objects.filter(is_active=True).order_by("display_order", "id")
+    )
+    packages = tuple(
+        _item(obj) for obj in ServicePackage.objects.filter(is_active=True).order_by("display_order", "id")
+    )
+    return CatalogSnapshot(generation, individual_services, packages)
+
+
+def get_catalog() -> CatalogSnapshot:
+    """Return the active catalog, rebuilding it only after an invalidation."""
+
+    global _snapshot
+
+    generation = current_generation()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.generation == generation:
+        return snapshot
+
+    with _lock:
+        snapshot = _snapshot
+        if snapshot is None or snapshot.generation != generation:
+            snapshot = _snapshot = _build_snapshot(generation)
+    return snapshot
@@ -0,0 +1,14 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from services.defaults import ensure_default_individual_services, ensure_default_service_packages
+
+
+class Command(BaseCommand):
+    help = "Create or update the default individual services and service packages."
+
+    def handle(self, *args, **options):
+        ensure_default_individual_services()
+        ensure_default_service_packages()
+        self.stdout.write(self.style.SUCCESS("Service catalog synced."))
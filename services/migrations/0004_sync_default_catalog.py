@@ -0,0 +1,55 @@
+from decimal import Decimal
+
+from django.db import migrations
+
+# Frozen copy of ``services.defaults`` at the time of this migration, so it
+# does not change with later edits or with ALTIQ_ENV (the test environment's
+# 1 MXN prices are applied by ``manage.py sync_service_catalog``).
+INDIVIDUAL_SERVICES = [
+    {"slug": "reporte-estadistico", "name_es": "Reporte Estadístico", "name_en": "Statistical Report",
+     "short_description_es": "Análisis de datos con insights accionables.",
+     "short_description_en": "Data analysis with actionable insights.",
+     "icon": "chart-bar", "price_mxn": Decimal("800"), "is_active": True, "display_order": 1},
+    {"slug": "hora-consultoria", "name_es": "Hora de Consultoría", "name_en": "Consulting Hour",
+     "short_description_es": "Sesión 1:1 con experto en AI industrial.",
+     "short_description_en": "1:1 session with industrial AI expert.",
+     "icon": "clock", "price_mxn": Decimal("500"), "is_active": True, "display_order": 2},
+    {"slug": "app", "name_es": "Aplicación Web", "name_en": "Web Application",
+     "short_description_es": "Herramienta digital a la medida.",
+     "short_description_en": "Custom digital tool.",
+     "icon": "device-mobile", "price_mxn": Decimal("8000"), "is_active": True, "display_order": 3},
+    {"slug": "automatizacion", "name_es": "Solución de Automatización", "name_en": "Automation Solution",
+     "short_description_es": "Automatiza procesos repetitivos.",
+     "short_description_en": "Automate repetitive processes.",
+     "icon": "cog", "price_mxn": Decimal("5000"), "is_active": True, "display_order": 4},
+]
+
+SERVICE_PACKAGES = [
+    {"slug": "basic", "name_es": "Paquete Básico", "name_en": "Basic Package",
+     "short_description_es": "Reportes puntuales sobre tu operación y datos clave.",
+     "short_description_en": "Focused reports on your operation and key data.",
+     "price_mxn": Decimal("500"), "is_active": True, "display_order": 1},
+    {"slug": "medium", "name_es": "Paquete Medium", "name_en": "Medium Package",
+     "short_description_es": "Diagnóstico profundo y recomendaciones priorizadas.",
+     "short_description_en": "Deeper diagnostic and prioritized recommendations.",
+     "price_mxn": Decimal("3000"), "is_active": True, "display_order": 2},
+    {"slug": "master", "name_es": "Paquete Master", "name_en": "Master Package",
+     "short_description_es": "Implementación de una solución digital hecha a la medida.",
+     "short_description_en": "Implementation of a custom digital solution.",
+     "price_mxn": Decimal("15000"), "is_active": True, "display_order": 3},
+]
+
+
+def sync_default_catalog(apps, schema_editor):
+    # Defaults used to be re-applied on every /services/ request; they are now
+    # synced once here (and on demand via ``manage.py sync_service_catalog``).
+    for model_name, rows in (("IndividualService", INDIVIDUAL_SERVICES), ("ServicePackage", SERVICE_PACKAGES)):
+        model = apps.get_model("services", model_name)
+        for data in rows:
+            data = dict(data)
+            model.objects.update_or_create(slug=data.pop("slug"), defaults=data)
+
+
+class Migration(migrations.Migration):
+    dependencies = [("services", "0003_add_individual_service")]
+    operations = [migrations.RunPython(sync_default_catalog, migrations.RunPython.noop)]
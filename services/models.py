@@ -81,3 +81,16 @@ class ServicePackage(models.Model):
     def __str__(self) -> str:  # pragma: no cover - simple representation
         return self.name_es or self.slug
 
+
+class CatalogGeneration(models.Model):
+    """Single row marking the last catalog change (see ``services.catalog``).
+
+    Kept in the database because it is the one store every process
+    (gunicorn workers, serverless instances) shares; the default cache is
+    local to each process.
+    """
+
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self) -> str:  # pragma: no cover
+        return str(self.value)
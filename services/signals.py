@@ -0,0 +1,15 @@
+from __future__ import annotations
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalog import invalidate_catalog
+from .models import IndividualService, ServicePackage
+
+
+@receiver(post_save, sender=IndividualService)
+@receiver(post_delete, sender=IndividualService)
+@receiver(post_save, sender=ServicePackage)
+@receiver(post_delete, sender=ServicePackage)
+def catalog_changed(sender, **kwargs) -> None:
+    invalidate_catalog()
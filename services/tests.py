@@ -1,9 +1,12 @@
 from __future__ import annotations
 
+from unittest import mock
+
 from django.test import TestCase
 from django.urls import reverse
 
-from .models import ServicePackage
+from .catalog import GENERATION_PK, GENERATION_TTL, current_generation, get_catalog
+from .models import CatalogGeneration, ServicePackage
 
 
 class ServiceViewsTests(TestCase):
@@ -27,3 +30,26 @@ class ServiceViewsTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, self.package.name_es)
 
+    def test_catalog_is_served_without_queries(self) -> None:
+        get_catalog()
+        with self.assertNumQueries(0):
+            catalog = get_catalog()
+        self.assertEqual(catalog.find("package", self.package.slug).name_es, self.package.name_es)
+
+    def test_catalog_is_rebuilt_after_save(self) -> None:
+        url = reverse("services:list")
+        self.client.get(url)
+        self.package.name_es = "Linea piloto renovada"
+        self.package.save()
+        response = self.client.get(url)
+        self.assertContains(response, "Linea piloto renovada")
+
+    def test_catalog_change_in_another_process_is_seen(self) -> None:
+        get_catalog()
+        # Another worker saves: its signal bumps the shared generation row.
+        ServicePackage.objects.filter(pk=self.package.pk).update(name_es="Linea piloto remota")
+        CatalogGeneration.objects.update_or_create(pk=GENERATION_PK, defaults={"value": current_generation() + 1})
+        self.assertEqual(get_catalog().find("package", self.package.slug).name_es, "Linea piloto")
+
+        with mock.patch("services.catalog.time.monotonic", return_value=GENERATION_TTL + 1e9):
+            self.assertEqual(get_catalog().find("package", self.package.slug).name_es, "Linea piloto remota")
@@ -2,20 +2,18 @@ from __future__ import annotations
 
 from django.shortcuts import render
 
-from .defaults import ensure_default_individual_services, ensure_default_service_packages
-from .models import IndividualService, ServicePackage
+from core.page_cache import cache_public_page
 
+from .catalog import get_catalog
 
-def service_list(request):
-    # Make sure both individual services and packages exist
-    ensure_default_individual_services()
-    ensure_default_service_packages()
 
-    individual_services = IndividualService.objects.filter(is_active=True).order_by("display_order", "id")
-    packages = ServicePackage.objects.filter(is_active=True).order_by("display_order", "id")
+@cache_public_page("services.IndividualService", "services.ServicePackage")
+def service_list(request):
+    # Defaults are synced by migration / ``manage.py sync_service_catalog``;
+    # the listing itself only reads the in-process catalog snapshot.
+    catalog = get_catalog()
 
     return render(request, "services/list.html", {
-        "individual_services": individual_services,
-        "packages": packages,
+        "individual_services": catalog.individual_services,
+        "packages": catalog.packages,
     })
-